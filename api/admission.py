@@ -0,0 +1,120 @@
+import math
+import time
+import heapq
+import asyncio
+import itertools
+
+# Lower values are admitted first
+PRIORITIES = {"interactive": 0, "batch": 1}
+
+
+def parse_limits(value):
+    """Parse per-mode limits written as `mode=limit,mode=limit`."""
+    limits = {}
+    for item in (value or "").split(","):
+        mode, sep, limit = item.partition("=")
+        if sep:
+            limits[mode.strip()] = int(limit)
+    return limits
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request's queue is full or it waited too long for a slot."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Lane:
+    """Slots and waiting requests of one search mode."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self.waiters = []
+        # Moving average of how long a slot is held, for Retry-After estimates
+        self.hold_time = 1.0
+
+
+class Slot:
+    """A held concurrency slot. Releasing it more than once is harmless."""
+
+    def __init__(self, controller, lane):
+        self.controller = controller
+        self.lane = lane
+        self.started = time.monotonic()
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.controller._release(self.lane, time.monotonic() - self.started)
+
+
+class AdmissionController:
+    """
+    Per-mode concurrency limits with a bounded, prioritized wait queue.
+
+    Each search mode has `limits[mode]` slots, or `default_limit` if it is not
+    listed. A request that finds every slot taken waits in its mode's queue,
+    higher priority classes first, for at most `max_wait` seconds. Requests
+    that find `queue_size` others already waiting, or whose wait runs out,
+    are rejected with an estimate of when to retry.
+    """
+
+    def __init__(self, limits=None, default_limit=8, queue_size=32, max_wait=10):
+        self.limits = dict(limits or {})
+        self.default_limit = default_limit
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.lanes = {}
+        self._order = itertools.count()
+
+    async def acquire(self, mode, priority="interactive"):
+        """Wait for a slot for a query in `mode` and return it."""
+        lane = self.lanes.get(mode)
+        if lane is None:
+            lane = self.lanes[mode] = Lane(self.limits.get(mode, self.default_limit))
+
+        if lane.active < lane.limit and not lane.waiters:
+            lane.active += 1
+            return Slot(self, lane)
+        if len(lane.waiters) >= self.queue_size:
+            raise AdmissionRejected(
+                f"Too many '{mode}' requests queued.", self.retry_after(lane)
+            )
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = (PRIORITIES[priority], next(self._order), future)
+        heapq.heappush(lane.waiters, waiter)
+        try:
+            await asyncio.wait_for(future, self.max_wait)
+        except BaseException as e:
+            if waiter in lane.waiters:
+                lane.waiters.remove(waiter)
+                heapq.heapify(lane.waiters)
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as the wait ended; pass it on
+                self._release(lane, None)
+            if isinstance(e, TimeoutError):
+                raise AdmissionRejected(
+                    f"Timed out waiting for a '{mode}' slot.", self.retry_after(lane)
+                ) from None
+            raise
+        return Slot(self, lane)
+
+    def retry_after(self, lane):
+        """Seconds until the queue ahead of a new request has likely drained."""
+        return max(1, math.ceil(lane.hold_time * (len(lane.waiters) + 1) / lane.limit))
+
+    def _release(self, lane, held):
+        if held is not None:
+            lane.hold_time = 0.8 * lane.hold_time + 0.2 * held
+        while lane.waiters:
+            _, _, future = heapq.heappop(lane.waiters)
+            if not future.done():
+                # Hand the slot straight to the next waiter
+                future.set_result(None)
+                return
+        lane.active -= 1
@@ -0,0 +1,232 @@
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def cache_key(query, mode, model, sources, language, incognito):
+    """Build a cache key from normalized search parameters."""
+    normalized = {
+        "query": " ".join(query.split()).casefold(),
+        "mode": mode,
+        "model": model,
+        "sources": sorted(set(sources)),
+        "language": language.lower(),
+        "incognito": incognito,
+    }
+    return hashlib.sha256(
+        json.dumps(normalized, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+
+class MemoryCache:
+    """In-memory LRU cache whose entries expire after `ttl` seconds."""
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires < time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key, value, expires=None):
+        self._entries[key] = (expires or time.time() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+
+class DiskCache:
+    """SQLite-backed cache whose entries expire after `ttl` seconds."""
+
+    def __init__(self, path, ttl=300, table="responses"):
+        self.path = path
+        self.ttl = ttl
+        self.table = table
+        self._lock = threading.Lock()
+        self._conn = None
+
+    @property
+    def _db(self):
+        # Opened on first use, so creating a cache never touches the disk
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            # Several worker processes may share the file
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} "
+                "(key TEXT PRIMARY KEY, expires REAL NOT NULL, value TEXT NOT NULL)"
+            )
+            db.execute(f"DELETE FROM {self.table} WHERE expires < ?", (time.time(),))
+            db.commit()
+            self._conn = db
+        return self._conn
+
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT expires, value FROM {self.table} WHERE key = ? AND expires >= ?",
+                (key, time.time()),
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def set(self, key, value, expires=None):
+        with self._lock:
+            self._db.execute(
+                f"INSERT OR REPLACE INTO {self.table} VALUES (?, ?, ?)",
+                (key, expires or time.time() + self.ttl, json.dumps(value)),
+            )
+            self._db.commit()
+
+
+class ResponseCache:
+    """
+    Final search responses keyed by `cache_key`.
+
+    Lookups go to the in-memory LRU first and fall back to the optional disk
+    backend, whose hits are promoted into memory until they expire. The
+    `_async` methods do the disk part in a worker thread, as another worker
+    sharing the file may hold its lock.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300, path=None, table="responses"):
+        self.memory = MemoryCache(maxsize, ttl)
+        self.disk = DiskCache(path, ttl, table) if path else None
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self._promote(key, self.disk.get(key))
+        return value
+
+    async def get_async(self, key):
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self._promote(key, await asyncio.to_thread(self.disk.get, key))
+        return value
+
+    def _promote(self, key, hit):
+        if hit is None:
+            return None
+        expires, value = hit
+        self.memory.set(key, value, expires)
+        return value
+
+    def set(self, key, value):
+        expires = time.time() + self.memory.ttl
+        self.memory.set(key, value, expires)
+        if self.disk is not None:
+            self.disk.set(key, value, expires)
+
+    async def set_async(self, key, value):
+        expires = time.time() + self.memory.ttl
+        self.memory.set(key, value, expires)
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.set, key, value, expires)
+
+
+class Flight:
+    """One upstream search shared by every subscriber with the same key."""
+
+    def __init__(self):
+        self.latest = None
+        self.seq = 0
+        self.done = False
+        self.error = None
+        self.task = None
+        self.subscribers = 0
+        self.condition = asyncio.Condition()
+
+    async def publish(self, event):
+        async with self.condition:
+            self.latest = event
+            self.seq += 1
+            self.condition.notify_all()
+
+    async def finish(self, error=None):
+        async with self.condition:
+            self.done = True
+            self.error = error
+            self.condition.notify_all()
+
+    async def events(self):
+        """
+        Yield the latest snapshot each time it changes.
+
+        Every event is a full snapshot, so a slow or late subscriber skips
+        straight to the newest one instead of buffering the ones it missed.
+        """
+        seen = 0
+        while True:
+            async with self.condition:
+                await self.condition.wait_for(lambda: self.seq > seen or self.done)
+                if self.seq > seen:
+                    event, seen = self.latest, self.seq
+                elif self.error is not None:
+                    raise self.error
+                else:
+                    return
+            yield event
+
+
+class SingleFlight:
+    """Coalesce concurrent identical searches into one upstream stream."""
+
+    def __init__(self):
+        self.flights = {}
+
+    async def stream(self, key, factory):
+        """
+        Yield the events of the in-flight search for `key`, starting one with
+        `factory()` if there is none. The search is cancelled once its last
+        subscriber stops listening.
+        """
+        flight = self.flights.get(key)
+        if flight is None:
+            flight = self.flights[key] = Flight()
+            flight.task = asyncio.create_task(self._run(key, flight, factory))
+
+        flight.subscribers += 1
+        try:
+            async for event in flight.events():
+                yield event
+        finally:
+            flight.subscribers -= 1
+            if not flight.subscribers and not flight.done:
+                # Everyone has gone away, so stop reading from upstream. The
+                # task may take a while to wind down, so a newcomer starts a
+                # fresh search rather than join this one
+                if self.flights.get(key) is flight:
+                    del self.flights[key]
+                flight.task.cancel()
+
+    async def _run(self, key, flight, factory):
+        try:
+            async for event in factory():
+                await flight.publish(event)
+        except asyncio.CancelledError:
+            await flight.finish(RuntimeError("Search was cancelled."))
+            raise
+        except Exception as e:
+            await flight.finish(e)
+        else:
+            await flight.finish()
+        finally:
+            if self.flights.get(key) is flight:
+                del self.flights[key]
@@ -0,0 +1,87 @@
+import json
+import time
+import hashlib
+from uuid import uuid4
+
+MODES = ("auto", "pro", "reasoning", "deep research")
+
+
+def parse_model(name):
+    """Split an OpenAI model name such as `pro/gpt-4o` into search mode and model."""
+    mode, _, model = name.partition("/")
+    if mode not in MODES:
+        raise ValueError(
+            f"Unknown model '{name}'. Use one of {', '.join(MODES)}, "
+            "optionally followed by /<model>."
+        )
+    return mode, model or None
+
+
+def message_text(content):
+    """Text of a chat message whose content is a string or a list of parts."""
+    if content is None:
+        return ""
+    if isinstance(content, str):
+        return content
+    return "".join(
+        part.get("text", "")
+        for part in content
+        if isinstance(part, dict) and part.get("type") == "text"
+    )
+
+
+def history_key(history):
+    """Conversation id derived from a transcript of (role, text) pairs."""
+    normalized = [[role, " ".join(text.split())] for role, text in history]
+    return "chat-" + hashlib.sha256(json.dumps(normalized).encode("utf-8")).hexdigest()
+
+
+def build_query(history):
+    """
+    Fold a transcript Perplexity has not seen, such as a system prompt or
+    turns from elsewhere, into the text of a single query.
+    """
+    if len(history) == 1:
+        return history[0][1]
+    return "\n\n".join(f"{role}: {text}" for role, text in history if text)
+
+
+class Completion:
+    """Builds the OpenAI response objects of one chat completion."""
+
+    def __init__(self, model):
+        self.id = f"chatcmpl-{uuid4().hex}"
+        self.created = int(time.time())
+        self.model = model
+
+    def message(self, content):
+        """The whole completion, for non-streaming requests."""
+        return {
+            "id": self.id,
+            "object": "chat.completion",
+            "created": self.created,
+            "model": self.model,
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }
+            ],
+        }
+
+    def chunk(self, delta, finish_reason=None):
+        """One SSE event of a streamed completion."""
+        data = {
+            "id": self.id,
+            "object": "chat.completion.chunk",
+            "created": self.created,
+            "model": self.model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(data)}\n\n"
+
+
+def error_body(message, error_type="invalid_request_error"):
+    """An error in the shape OpenAI clients expect."""
+    return {"error": {"message": message, "type": error_type}}
@@ -0,0 +1,204 @@
+import os
+import time
+import asyncio
+from uuid import uuid4
+from collections import deque
+
+from lib.shared import process_alive
+
+from .cache import DiskCache, MemoryCache
+
+FINISHED = ("done", "failed", "cancelled")
+
+
+class Job:
+    """
+    One background search and the latest events it has produced.
+
+    Every event is a full snapshot, numbered from 1. The most recent `replay`
+    events are kept so a client that reconnects with the number of the last
+    one it saw gets the ones it missed. A client that fell further behind
+    resumes from the oldest kept snapshot, which holds the whole state anyway.
+    """
+
+    def __init__(
+        self,
+        id=None,
+        query=None,
+        mode=None,
+        status="queued",
+        created=None,
+        finished=None,
+        error=None,
+        result=None,
+        events=0,
+        replay=100,
+    ):
+        self.id = id or uuid4().hex
+        self.query = query
+        self.mode = mode
+        self.status = status
+        self.created = created or time.time()
+        self.finished = finished
+        self.error = error
+        self.result = result
+        self.seq = events
+        self.buffer = deque(maxlen=replay)
+        self.task = None
+        self.condition = asyncio.Condition()
+
+    @property
+    def done(self):
+        return self.status in FINISHED
+
+    async def publish(self, event):
+        async with self.condition:
+            self.seq += 1
+            self.result = event
+            self.buffer.append((self.seq, event))
+            self.condition.notify_all()
+
+    async def finish(self, status, error=None):
+        async with self.condition:
+            self.status = status
+            self.error = error
+            self.finished = time.time()
+            self.condition.notify_all()
+
+    def since(self, last_id):
+        """The kept events after `last_id`, or the latest one if none are kept."""
+        pending = [(seq, event) for seq, event in self.buffer if seq > last_id]
+        if not pending and self.seq > last_id and self.result is not None:
+            pending = [(self.seq, self.result)]
+        return pending
+
+    async def events(self, last_id=0):
+        """Yield `(seq, event)` for every event after `last_id` until the job ends."""
+        while True:
+            async with self.condition:
+                await self.condition.wait_for(lambda: self.seq > last_id or self.done)
+                pending = self.since(last_id)
+                done = self.done
+            for seq, event in pending:
+                yield seq, event
+                last_id = seq
+            if done and not pending:
+                return
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "query": self.query,
+            "mode": self.mode,
+            "status": self.status,
+            "created": self.created,
+            "finished": self.finished,
+            "error": self.error,
+            "events": self.seq,
+            "result": self.result,
+        }
+
+
+class JobStore:
+    """
+    Running jobs, and finished ones that expire `ttl` seconds after they end.
+
+    Recently finished jobs stay in an in-memory LRU with their replay buffers.
+    With a `path`, their final state also goes to SQLite, so it outlives the
+    LRU and restarts, and replays as a single snapshot.
+
+    With `shared`, workers that share the file see each other's jobs. A
+    running job's state is written out every `checkpoint` seconds, and
+    other workers follow it by reading it back. The file is read and written
+    in a worker thread, since another worker may hold its lock.
+    """
+
+    def __init__(
+        self,
+        maxsize=1024,
+        ttl=86400,
+        path=None,
+        replay=100,
+        shared=False,
+        checkpoint=1.0,
+    ):
+        self.replay = replay
+        self.running = {}
+        self.finished = MemoryCache(maxsize, ttl)
+        self.disk = DiskCache(path, ttl, table="jobs") if path else None
+        self.shared = shared and self.disk is not None
+        self.checkpoint = checkpoint
+        self.saved = {}
+
+    async def create(self, query, mode):
+        job = Job(query=query, mode=mode, replay=self.replay)
+        self.running[job.id] = job
+        await self.save(job, force=True)
+        return job
+
+    async def save(self, job, force=False):
+        """Write a running job's state for other workers, at most every `checkpoint` seconds."""
+        if not self.shared:
+            return
+        now = time.monotonic()
+        if force or now - self.saved.get(job.id, 0) >= self.checkpoint:
+            self.saved[job.id] = now
+            await self._write(job)
+
+    async def _write(self, job):
+        state = {**job.to_dict(), "pid": os.getpid()}
+        await asyncio.to_thread(self.disk.set, job.id, state)
+
+    async def get(self, job_id):
+        """Return the job called `job_id`, or None."""
+        job = self.running.get(job_id) or self.finished.get(job_id)
+        if job is not None or self.disk is None:
+            return job
+        hit = await asyncio.to_thread(self.disk.get, job_id)
+        if hit is None:
+            return None
+        state = hit[1]
+        pid = state.pop("pid", None)
+        job = Job(**state, replay=0)
+        if not job.done and not (pid and process_alive(pid)):
+            job.status = "failed"
+            job.error = "The worker running the job stopped."
+        return job
+
+    async def events(self, job, last_id=0):
+        """
+        Yield `(seq, event)` for every event of `job` after `last_id` until it
+        ends, following jobs that run on another worker through their
+        checkpoints.
+        """
+        if job.id in self.running or job.done:
+            async for seq, event in job.events(last_id):
+                yield seq, event
+            return
+
+        while True:
+            job = await self.get(job.id)
+            if job is None:
+                return
+            if job.seq > last_id and job.result is not None:
+                yield job.seq, job.result
+                last_id = job.seq
+            if job.done:
+                return
+            await asyncio.sleep(self.checkpoint)
+
+    async def finish(self, job, status, error=None):
+        await job.finish(status, error)
+        self.finished.set(job.id, job)
+        if self.disk is not None:
+            # Shielded so a job cancelled at shutdown is still recorded
+            await asyncio.shield(self._write(job))
+        self.running.pop(job.id, None)
+        self.saved.pop(job.id, None)
+
+    async def stop(self):
+        """Cancel the running jobs, which record themselves as cancelled."""
+        tasks = [job.task for job in self.running.values() if job.task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,213 @@
+import os
+import gzip
+import json
+import time
+import queue
+import atexit
+import random
+import shutil
+import threading
+from uuid import uuid4
+
+logs_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../logs")
+if not os.path.exists(logs_dir):
+    os.makedirs(logs_dir)
+
+_CLOSE = object()
+
+
+class RequestLog:
+    """Log handle for one request. Events must not be mutated after `write`."""
+
+    def __init__(self, logger, endpoint, sampled):
+        self.logger = logger
+        self.endpoint = endpoint
+        self.request_id = uuid4().hex
+        self.sampled = sampled
+        self.seq = 0
+        self.last = None
+
+    def write(self, event):
+        """Queue one response event for writing."""
+        self.seq += 1
+        if not self.sampled:
+            return
+        if self.logger.mode == "final":
+            self.last = event
+            return
+        self.logger.enqueue(self._record(event, final=False))
+
+    def close(self):
+        """Finish the request, writing the final snapshot in "final" mode."""
+        if self.sampled and self.logger.mode == "final" and self.last is not None:
+            self.logger.enqueue(self._record(self.last, final=True))
+        self.last = None
+
+    def _record(self, event, final):
+        return {
+            "request_id": self.request_id,
+            "endpoint": self.endpoint,
+            "seq": self.seq,
+            "ts": time.time(),
+            "final": final,
+            "event": event,
+        }
+
+
+class ResponseLogger:
+    """
+    Background writer for response logs.
+
+    Events are queued on the request path and serialized by a daemon thread,
+    which appends them in batches as compact JSONL to `responses.jsonl`. The
+    file is rotated by size and age, and rotated files can be gzipped.
+
+    With `per_process`, each process writes to its own `responses.<pid>.jsonl`
+    instead, so workers sharing a directory never rotate each other's file.
+    """
+
+    def __init__(
+        self,
+        directory=logs_dir,
+        mode="all",
+        sample_rate=1.0,
+        max_bytes=64 * 2**20,
+        max_age=24 * 3600,
+        compress=True,
+        flush_interval=1.0,
+        batch_size=256,
+        per_process=False,
+    ):
+        """
+        Parameters:
+        - directory: Directory for log files.
+        - mode: "all" logs every event, "final" only the last one per request, "off" nothing.
+        - sample_rate: Fraction of requests to log.
+        - max_bytes: Rotate the log once it grows past this size.
+        - max_age: Rotate the log once it is older than this many seconds.
+        - compress: Whether to gzip rotated files.
+        - flush_interval: Longest time in seconds a queued record waits for its batch.
+        - batch_size: Most records written per batch.
+        - per_process: Name the log file after the writing process.
+        """
+        assert mode in ("all", "final", "off"), "Invalid log mode."
+        self.directory = directory
+        self.mode = mode
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.compress = compress
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.per_process = per_process
+        self.path = os.path.join(directory, "responses.jsonl")
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._file = None
+        self._opened_at = 0.0
+
+    def open(self, endpoint):
+        """Start logging a request and return its `RequestLog`."""
+        sampled = self.mode != "off" and random.random() < self.sample_rate
+        return RequestLog(self, endpoint, sampled)
+
+    def enqueue(self, record):
+        if self._thread is None:
+            self._start()
+        self._queue.put(record)
+
+    def close(self):
+        """Flush queued records and stop the writer thread."""
+        if self._thread is not None:
+            self._queue.put(_CLOSE)
+            self._thread.join()
+            self._thread = None
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="response-logger", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        closing = False
+        while not closing:
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if _CLOSE in batch:
+                closing = True
+                batch = [record for record in batch if record is not _CLOSE]
+            try:
+                self._write(batch)
+            except Exception as e:
+                print(f"Failed to write response log: {e}")
+
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write(self, batch):
+        if not batch:
+            return
+        lines = [
+            json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+            for record in batch
+        ]
+        if self._file is None:
+            self._open_file()
+        elif (
+            self._file.tell() >= self.max_bytes
+            or time.time() - self._opened_at >= self.max_age
+        ):
+            self._rotate()
+        self._file.write("\n".join(lines) + "\n")
+        self._file.flush()
+
+    def _open_file(self):
+        if self.per_process:
+            # Named on open, as the logger may be built before a fork
+            self.path = os.path.join(self.directory, f"responses.{os.getpid()}.jsonl")
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._opened_at = time.time()
+
+    def _rotate(self):
+        self._file.close()
+        rotated = os.path.join(
+            self.directory,
+            f"responses-{time.strftime('%Y%m%d%H%M%S')}-{uuid4().hex[:6]}.jsonl",
+        )
+        os.replace(self.path, rotated)
+        if self.compress:
+            with open(rotated, "rb") as src, gzip.open(rotated + ".gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(rotated)
+        self._open_file()
+
+
+def logger_from_env():
+    """Build a `ResponseLogger` configured by PERPLEXITY_LOG_* environment variables."""
+    response_logger = ResponseLogger(
+        mode=os.environ.get("PERPLEXITY_LOG_MODE", "all"),
+        sample_rate=float(os.environ.get("PERPLEXITY_LOG_SAMPLE_RATE", 1.0)),
+        max_bytes=int(os.environ.get("PERPLEXITY_LOG_MAX_BYTES", 64 * 2**20)),
+        max_age=float(os.environ.get("PERPLEXITY_LOG_MAX_AGE", 24 * 3600)),
+        compress=os.environ.get("PERPLEXITY_LOG_COMPRESS", "1") != "0",
+        # Workers sharing state run side by side and would share the file
+        per_process=os.environ.get(
+            "PERPLEXITY_LOG_PER_PROCESS",
+            "1" if os.environ.get("PERPLEXITY_STATE_PATH") else "0",
+        )
+        == "1",
+    )
+    atexit.register(response_logger.close)
+    return response_logger
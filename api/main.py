@@ -1,26 +1,171 @@
-from fastapi import FastAPI, Query
+from fastapi import FastAPI, File, Form, Header, Query, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import (
+    JSONResponse,
+    PlainTextResponse,
+    Response,
+    StreamingResponse,
+)
+from starlette.background import BackgroundTask
+from pydantic import BaseModel, Field
 
 
+import os
+import hmac
 import json
+import time
+import random
+import shutil
+import asyncio
+import threading
+from collections import deque
+from contextlib import asynccontextmanager
+from functools import partial
 from lib import perplexity
+from lib.hooks import MultiHooks
+from lib.jsonpatch import make_patch
+from lib.mirror import ThreadMirror
+from lib.pool import AccountGone, NoAccountAvailable
+from lib.resilience import Resilience
+from lib.shared import SharedState
+from lib.tracing import Trace, TraceHooks, current_trace, timer_for
+
+from typing import List, Optional, Union
+from . import chat
+from .admission import AdmissionController, AdmissionRejected, parse_limits
+from .cache import ResponseCache, SingleFlight, cache_key
+from .jobs import JobStore
+from . import metrics
+from .logger import logger_from_env
+from .profiler import ProfilerBusy, SamplingProfiler
+from .sessions import AttachmentRecorder, Conversation, ConversationStore
+from .upstream import Upstream
+from .utils import (
+    FIELDS,
+    AnswerDelta,
+    BlockExtractor,
+    decode_cursor,
+    encode_cursor,
+    parse_fields,
+    spool_uploads,
+)
 
-from typing import List, Optional
-from datetime import datetime
-from .utils import extract_answer, save_resp
+# SQLite files without a path of their own go here
+data_dir = os.environ.get("PERPLEXITY_DATA_DIR", "data")
+
+# With several workers, quota, account leases, in-flight queries, cached
+# responses, conversations and jobs go to one SQLite file they all share
+state_path = os.environ.get("PERPLEXITY_STATE_PATH")
+shared_state = SharedState(state_path) if state_path else None
+
+# The account pool is built on first use, so importing the app never reads the
+# cookies file or touches the network. The lifespan warms it up in the background.
+upstream = Upstream(
+    os.environ.get("PERPLEXITY_COOKIES_PATH", "perplexity_cookies.json"),
+    anonymous=int(os.environ.get("PERPLEXITY_ANONYMOUS_SESSIONS", 0)),
+    connections=int(os.environ.get("PERPLEXITY_WARM_CONNECTIONS", 2)),
+    keepalive=float(os.environ.get("PERPLEXITY_KEEPALIVE_INTERVAL", 60)),
+    client_cls=partial(
+        perplexity.AsyncClient,
+        base_url=os.environ.get("PERPLEXITY_BASE_URL", perplexity.BASE_URL),
+        # One policy for every account, so hedging learns from all their latencies
+        resilience=Resilience(
+            connect_timeout=float(os.environ.get("PERPLEXITY_CONNECT_TIMEOUT", 10)),
+            first_event_timeout=float(
+                os.environ.get("PERPLEXITY_FIRST_EVENT_TIMEOUT", 60)
+            ),
+            event_timeout=float(os.environ.get("PERPLEXITY_EVENT_TIMEOUT", 60)),
+            retries=int(os.environ.get("PERPLEXITY_RETRIES", 2)),
+            hedge=os.environ.get("PERPLEXITY_HEDGE", "0") == "1",
+        ),
+    ),
+    rate_limit=float(os.environ.get("PERPLEXITY_ACCOUNT_RATE_LIMIT", 0)) or None,
+    state=shared_state,
+    pro_quota=(
+        int(os.environ["PERPLEXITY_PRO_QUOTA"])
+        if "PERPLEXITY_PRO_QUOTA" in os.environ
+        else None
+    ),
+    upload_quota=(
+        int(os.environ["PERPLEXITY_UPLOAD_QUOTA"])
+        if "PERPLEXITY_UPLOAD_QUOTA" in os.environ
+        else None
+    ),
+)
+admission = AdmissionController(
+    limits=parse_limits(os.environ.get("PERPLEXITY_MODE_LIMITS")),
+    default_limit=int(os.environ.get("PERPLEXITY_CONCURRENCY_LIMIT", 8)),
+    queue_size=int(os.environ.get("PERPLEXITY_QUEUE_SIZE", 32)),
+    max_wait=float(os.environ.get("PERPLEXITY_QUEUE_TIMEOUT", 10)),
+)
+batch_concurrency = int(os.environ.get("PERPLEXITY_BATCH_CONCURRENCY", 4))
+batch_max_wait = float(os.environ.get("PERPLEXITY_BATCH_MAX_WAIT", 60))
+response_logger = logger_from_env()
+response_cache = ResponseCache(
+    maxsize=int(os.environ.get("PERPLEXITY_CACHE_SIZE", 1024)),
+    ttl=float(os.environ.get("PERPLEXITY_CACHE_TTL", 300)),
+    path=os.environ.get("PERPLEXITY_CACHE_PATH", state_path),
+)
+single_flight = SingleFlight()
+conversations = ConversationStore(
+    # Other workers update conversations too, so shared ones are always read
+    # from disk rather than from a copy in memory
+    maxsize=0 if state_path else int(os.environ.get("PERPLEXITY_SESSION_SIZE", 4096)),
+    ttl=float(os.environ.get("PERPLEXITY_SESSION_TTL", 86400)),
+    path=os.environ.get("PERPLEXITY_SESSION_PATH", state_path),
+)
+jobs = JobStore(
+    maxsize=int(os.environ.get("PERPLEXITY_JOB_SIZE", 1024)),
+    ttl=float(os.environ.get("PERPLEXITY_JOB_TTL", 86400)),
+    path=os.environ.get(
+        "PERPLEXITY_JOB_PATH", state_path or os.path.join(data_dir, "jobs.db")
+    ),
+    replay=int(os.environ.get("PERPLEXITY_JOB_REPLAY", 100)),
+    shared=shared_state is not None,
+)
+job_limit = int(os.environ.get("PERPLEXITY_JOB_LIMIT", 64))
+job_retry_after = int(os.environ.get("PERPLEXITY_JOB_RETRY_AFTER", 30))
+FIELDS_DESCRIPTION = (
+    "Comma-separated fields to return instead of the full response: "
+    + ", ".join(FIELDS)
+)
+TRACE_DESCRIPTION = (
+    "Return the timing spans of the request: a Server-Timing header, "
+    "or a trace event before the last one when streaming"
+)
+trace_hooks = TraceHooks()
+search_hooks = {
+    endpoint: MultiHooks(metrics.MetricsHooks(endpoint), trace_hooks)
+    for endpoint in (
+        "query_async",
+        "query_sync",
+        "query_upload",
+        "batch",
+        "jobs",
+        "chat",
+    )
+}
+thread_mirror = ThreadMirror(
+    os.environ.get("PERPLEXITY_MIRROR_PATH", os.path.join(data_dir, "threads.db"))
+)
+trace_sample_rate = float(os.environ.get("PERPLEXITY_TRACE_SAMPLE_RATE", 0))
+recent_traces = deque(maxlen=int(os.environ.get("PERPLEXITY_TRACE_BUFFER", 256)))
+admin_token = os.environ.get("PERPLEXITY_ADMIN_TOKEN")
+profiler = SamplingProfiler()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    upstream.start()
+    yield
+    await jobs.stop()
+    await upstream.stop()
 
-# Initialize Perplexity client
-try:
-    with open("perplexity_cookies.json", "r", encoding="utf-8") as f:
-        perplexity_cookies = json.load(f)
-except (FileNotFoundError, json.JSONDecodeError):
-    print("Cookies file not found or invalid. Using empty cookies.")
-    perplexity_cookies = {}
 
-perplexity_cli = perplexity.Client(perplexity_cookies)
 app = FastAPI(
-    title="Perplexity Web API", description="Stream Perplexity AI responses using SSE"
+    title="Perplexity Web API",
+    description="Stream Perplexity AI responses using SSE",
+    lifespan=lifespan,
 )
 
 # Configure CORS
@@ -33,53 +178,264 @@ app.add_middleware(
 )
 
 
+def content_event(content, previous, patch):
+    """Serialize a snapshot as a full content event, or as a patch against the previous one."""
+    if patch and previous is not None:
+        ops = make_patch(previous, content)
+        if not ops:
+            return None
+        return json.dumps({"type": "patch", "content": ops, "done": False})
+
+    return json.dumps({"type": "content", "content": content, "done": False})
+
+
+def start_trace(endpoint, requested, mode):
+    """Trace a request if the client asked for it or it is sampled, else return None."""
+    if not requested and random.random() >= trace_sample_rate:
+        return None
+    return Trace(endpoint, {"mode": mode, "requested": requested})
+
+
+def finish_trace(trace, error=None):
+    """End a request's trace and keep it for /admin/traces."""
+    trace.finish(error=repr(error) if error is not None else None)
+    recent_traces.append(trace)
+
+
+def follow_up_for(backend_uuid, conversation):
+    """
+    Build a query's follow-up from its conversation. An explicit backend_uuid
+    takes precedence over the conversation's latest answer, and the
+    conversation's attachments are kept either way.
+    """
+    follow_up = conversation.follow_up if conversation is not None else None
+    if backend_uuid:
+        attachments = follow_up["attachments"] if follow_up else []
+        follow_up = {"backend_uuid": backend_uuid, "attachments": attachments}
+    return follow_up
+
+
+async def upstream_search(
+    query,
+    mode,
+    model,
+    sources,
+    language,
+    follow_up,
+    incognito,
+    files,
+    endpoint,
+    conversation=None,
+):
+    """
+    Stream a search from the least-loaded pool account, or from the account
+    its conversation is pinned to, and record the answer in the conversation.
+    """
+    pinned = conversation.account if conversation is not None else None
+    hooks = search_hooks[endpoint]
+    if conversation is not None:
+        recorder = AttachmentRecorder()
+        hooks = MultiHooks(hooks, recorder)
+    async with upstream.pool.lease_async(mode, len(files), pinned) as account:
+        stream = None
+        async for stream in await account.client.search(
+            query,
+            mode=mode,
+            model=model,
+            sources=sources,
+            files=files,
+            stream=True,
+            language=language,
+            follow_up=follow_up,
+            incognito=incognito,
+            hooks=hooks,
+        ):
+            yield stream
+        if conversation is not None and stream is not None:
+            conversation.update(stream, account.name, recorder.attachments)
+            if conversation.id is not None:
+                await conversations.save_async(conversation)
+
+
+# Queries in flight on other workers are only worth waiting for when their
+# responses land in a cache this worker can read
+share_flights = shared_state is not None and response_cache.disk is not None
+
+
+async def other_worker_result(key):
+    """
+    Wait while another worker runs the query `key`, and return the response
+    it caches. Returns None once this worker has claimed the query itself.
+    """
+    delay = 0.05
+    while not await asyncio.to_thread(shared_state.claim, key):
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 1.0)
+        cached = await response_cache.get_async(key)
+        if cached is not None:
+            return cached
+    # The other worker may have finished just before the claim
+    cached = await response_cache.get_async(key)
+    if cached is not None:
+        await asyncio.to_thread(shared_state.unclaim, key)
+    return cached
+
+
+async def search_events(
+    query,
+    mode,
+    model,
+    sources,
+    language,
+    follow_up,
+    incognito,
+    files=None,
+    use_cache=True,
+    endpoint="query_sync",
+    conversation=None,
+):
+    """
+    Stream search events, answering repeated queries from the response cache
+    and sharing one upstream stream between identical in-flight queries.
+    Follow-ups, incognito queries, queries with files and conversation turns
+    always go upstream on their own.
+    """
+    files = files or {}
+    search = (
+        query,
+        mode,
+        model,
+        sources,
+        language,
+        follow_up,
+        incognito,
+        files,
+        endpoint,
+        conversation,
+    )
+    if not use_cache or follow_up or incognito or files or conversation is not None:
+        async for stream in upstream_search(*search):
+            yield stream
+        return
+
+    key = cache_key(query, mode, model, sources, language, incognito)
+    cached = await response_cache.get_async(key)
+    if cached is None and share_flights and key not in single_flight.flights:
+        cached = await other_worker_result(key)
+    if cached is not None:
+        yield cached
+        return
+
+    async def fill_cache():
+        stream = None
+        try:
+            async for stream in upstream_search(*search):
+                yield stream
+            if stream is not None:
+                await response_cache.set_async(key, stream)
+        finally:
+            if share_flights:
+                await asyncio.shield(asyncio.to_thread(shared_state.unclaim, key))
+
+    async for stream in single_flight.stream(key, fill_cache):
+        yield stream
+
+
 async def generate_sse_stream(
     query: str,
-    answer_only: bool,
+    fields: Optional[List[str]],
     mode: str,
     model: Optional[str],
     sources: List[str],
     language: str,
     follow_up: Optional[dict],
     incognito: bool,
+    stream_mode: str = "snapshot",
+    use_cache: bool = True,
+    files: Optional[dict] = None,
+    endpoint: str = "query_async",
+    conversation: Optional[Conversation] = None,
+    trace: Optional[Trace] = None,
 ):
-    """Generate SSE stream from Perplexity responses."""
-    response_count = 0
+    """
+    Generate SSE stream from Perplexity responses. With a trace that the
+    client asked for, its spans are sent as a `trace` event before the last one.
+    """
+    request_log = response_logger.open(endpoint)
+    metrics.request_started(endpoint)
+    error = None
+    answer_delta = AnswerDelta() if stream_mode == "delta" else None
+    extractor = BlockExtractor(fields) if fields else None
+    patch = stream_mode == "patch"
+    stream = None
+    previous = None
+    timer = timer_for(trace)
+    if trace is not None:
+        current_trace.set(trace)
 
-    # Start the streaming search in a sync function
     try:
-        for stream in perplexity_cli.search(
+        async for stream in search_events(
             query,
-            mode=mode,
-            model=model,
-            sources=sources,
-            files={},
-            stream=True,
-            language=language,
-            follow_up=follow_up,
-            incognito=incognito,
+            mode,
+            model,
+            sources,
+            language,
+            follow_up,
+            incognito,
+            files=files,
+            use_cache=use_cache,
+            endpoint=endpoint,
+            conversation=conversation,
         ):
-            response_count += 1
-            file_name = (
-                f"API-{datetime.now().strftime('%Y%m%d%H%M%S')}-{response_count}"
-            )
-            save_resp(stream, file_name)
-            if answer_only:
-                ans_data = extract_answer(stream, file_name)
-                if "answer" in ans_data and ans_data["answer"] is not None:
-                    event_data = json.dumps(
-                        {
-                            "type": "content",
-                            "content": ans_data,
-                            "done": False,
-                        }
-                    )
+            with timer("log"):
+                request_log.write(stream)
+            file_name = f"{request_log.request_id}-{request_log.seq}"
+            if answer_delta is not None:
+                with timer("extract"):
+                    delta_data = answer_delta.update(stream, file_name)
+                if delta_data is not None:
+                    with timer("serialize"):
+                        event_data = json.dumps(
+                            {"type": "delta", "content": delta_data, "done": False}
+                        )
                     yield f"data: {event_data}\n\n"
 
-            # If not answer_only, send the full stream content
+            elif extractor is not None:
+                with timer("extract"):
+                    projection = extractor.update(stream, file_name)
+                if projection is not None and any(
+                    projection[field] is not None for field in fields
+                ):
+                    with timer("serialize"):
+                        event_data = content_event(projection, previous, patch)
+                    previous = projection
+                    if event_data is not None:
+                        yield f"data: {event_data}\n\n"
+
+            # Without fields, send the full stream content
             else:
+                with timer("serialize"):
+                    event_data = content_event(stream, previous, patch)
+                previous = stream
+                if event_data is not None:
+                    yield f"data: {event_data}\n\n"
+
+        # Send the consolidated answer once in delta mode
+        if answer_delta is not None:
+            event_data = json.dumps(
+                {
+                    "type": "content",
+                    "content": answer_delta.final(stream, request_log.request_id),
+                    "done": False,
+                }
+            )
+            yield f"data: {event_data}\n\n"
+
+        if trace is not None:
+            finish_trace(trace)
+            if trace.root.attributes["requested"]:
                 event_data = json.dumps(
-                    {"type": "content", "content": stream, "done": False}
+                    {"type": "trace", "content": trace.to_otlp(), "done": False}
                 )
                 yield f"data: {event_data}\n\n"
 
@@ -88,9 +444,222 @@ async def generate_sse_stream(
         yield f"data: {event_data}\n\n"
 
     except Exception as e:
+        error = e
         error_data = json.dumps({"type": "error", "error": str(e)})
         yield f"data: {error_data}\n\n"
 
+    finally:
+        request_log.close()
+        metrics.request_finished(endpoint, error)
+        if trace is not None and trace.root.end is None:
+            finish_trace(trace, error)
+
+
+async def search_result(
+    query: str,
+    fields: Optional[List[str]],
+    mode: str,
+    model: Optional[str],
+    sources: List[str],
+    language: str,
+    follow_up: Optional[dict],
+    incognito: bool,
+    use_cache: bool = True,
+    files: Optional[dict] = None,
+    endpoint: str = "query_sync",
+    conversation: Optional[Conversation] = None,
+):
+    """Run a search to completion and return its final response."""
+    result = None
+    async for result in search_events(
+        query,
+        mode,
+        model,
+        sources,
+        language,
+        follow_up,
+        incognito,
+        files=files,
+        use_cache=use_cache,
+        endpoint=endpoint,
+        conversation=conversation,
+    ):
+        pass
+    trace = current_trace.get()
+    timer = timer_for(trace)
+    request_log = response_logger.open(endpoint)
+    with timer("log"):
+        request_log.write(result)
+        request_log.close()
+    if fields:
+        with timer("extract"):
+            return BlockExtractor(fields).extract(result, request_log.request_id)
+    return result
+
+
+async def generate_json_response(endpoint="query_sync", trace=None, **search):
+    """
+    Run a search to completion and return its final response as JSON, with
+    the spans of a trace in a `Server-Timing` header.
+    """
+    if trace is not None:
+        current_trace.set(trace)
+    started = time.perf_counter()
+    try:
+        slot = await admission.acquire(search["mode"])
+    except AdmissionRejected as e:
+        return rejected_response(endpoint, e)
+    if trace is not None:
+        trace.add("admission", started)
+
+    error = None
+    try:
+        with metrics.track_request(endpoint):
+            result = await search_result(endpoint=endpoint, **search)
+        started = time.perf_counter()
+        response = JSONResponse(content=result)
+        if trace is not None:
+            trace.add("serialize", started)
+    except NoAccountAvailable as e:
+        error = e
+        status_code = 410 if isinstance(e, AccountGone) else 503
+        response = JSONResponse(content={"error": str(e)}, status_code=status_code)
+    except Exception as e:
+        error = e
+        response = JSONResponse(content={"error": str(e)}, status_code=500)
+    finally:
+        slot.release()
+
+    if trace is not None:
+        finish_trace(trace, error)
+        response.headers["Server-Timing"] = trace.server_timing()
+        response.headers["X-Trace-Id"] = trace.trace_id
+    return response
+
+
+def rejected_response(endpoint, error):
+    """Answer a request that admission control turned away with a 429."""
+    metrics.request_errors.labels(endpoint, type(error).__name__).inc()
+    return JSONResponse(
+        content={"error": str(error)},
+        status_code=429,
+        headers={"Retry-After": str(error.retry_after)},
+    )
+
+
+def admitted_stream(stream, slot, media_type, trace=None):
+    """Stream a response that holds an admission slot until it ends or the client leaves."""
+    return StreamingResponse(
+        release_after(stream, slot),
+        media_type=media_type,
+        headers={"X-Trace-Id": trace.trace_id} if trace is not None else None,
+        # Also runs if the client disconnects before the stream starts
+        background=BackgroundTask(slot.release),
+    )
+
+
+async def spec_search(spec, fields, endpoint):
+    """Build the search arguments of a query given as a `BatchQuery`."""
+    conversation = (
+        await conversations.open_async(spec.conversation_id)
+        if spec.conversation_id
+        else None
+    )
+    return dict(
+        query=spec.q,
+        fields=fields,
+        mode=spec.mode,
+        model=spec.model,
+        sources=[s.strip() for s in spec.sources.split(",")],
+        language=spec.language,
+        follow_up=follow_up_for(spec.backend_uuid, conversation),
+        incognito=spec.incognito,
+        use_cache=spec.cache,
+        endpoint=endpoint,
+        conversation=conversation,
+    )
+
+
+async def batch_item(index, spec):
+    """Run one batch query and return its NDJSON record, with any error inline."""
+    try:
+        fields = parse_fields(spec.fields, spec.answer_only)
+    except ValueError as e:
+        return {"index": index, "error": str(e), "status": 400}
+    search = await spec_search(spec, fields, "batch")
+    deadline = asyncio.get_running_loop().time() + batch_max_wait
+    metrics.request_started("batch")
+    error = None
+    try:
+        while True:
+            try:
+                slot = await admission.acquire(spec.mode, "batch")
+                try:
+                    result = await search_result(**search)
+                finally:
+                    slot.release()
+                return {"index": index, "result": result}
+            except (AdmissionRejected, NoAccountAvailable) as e:
+                # Wait out full queues, rate limits and short quarantines
+                # rather than failing
+                now = asyncio.get_running_loop().time()
+                if e.retry_after is None or now + e.retry_after > deadline:
+                    error = e
+                    if isinstance(e, AdmissionRejected):
+                        status = 429
+                    else:
+                        status = 410 if isinstance(e, AccountGone) else 503
+                    return {"index": index, "error": str(e), "status": status}
+                await asyncio.sleep(e.retry_after)
+            except Exception as e:
+                error = e
+                return {"index": index, "error": str(e), "status": 500}
+    finally:
+        metrics.request_finished("batch", error)
+
+
+async def generate_batch(specs, concurrency):
+    """Run batch queries with bounded concurrency, yielding NDJSON in completion order."""
+    pending = iter(enumerate(specs))
+    results = asyncio.Queue()
+
+    async def worker():
+        for index, spec in pending:
+            try:
+                record = await batch_item(index, spec)
+            except Exception as e:
+                # Every query must report back, or the stream waits forever
+                record = {"index": index, "error": str(e), "status": 500}
+            await results.put(record)
+
+    workers = [
+        asyncio.create_task(worker()) for _ in range(min(concurrency, len(specs)))
+    ]
+    try:
+        for _ in specs:
+            yield json.dumps(await results.get()) + "\n"
+    finally:
+        for task in workers:
+            task.cancel()
+
+
+async def release_after(stream, slot):
+    """Pass a stream through and release its admission slot once it is finished."""
+    try:
+        async for chunk in stream:
+            yield chunk
+    finally:
+        slot.release()
+
+
+async def remove_after(stream, path):
+    """Pass a stream through and remove `path` once it is finished."""
+    try:
+        async for chunk in stream:
+            yield chunk
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
 
 @app.get("/api/query_async")
 async def query_async(
@@ -98,7 +667,12 @@ async def query_async(
     backend_uuid: str = Query(
         None, description="UUID of the previous response", alias="backend_uuid"
     ),
+    conversation_id: Optional[str] = Query(
+        None,
+        description="Continue this server-side conversation, or start it if new",
+    ),
     answer_only: bool = Query(False, description="Return only the answer text"),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
     mode: str = Query(
         "auto",
         description="Search mode",
@@ -108,34 +682,68 @@ async def query_async(
     sources: str = Query("web", description="Sources (comma-separated)"),
     language: str = Query("en-US", description="Language"),
     incognito: bool = Query(False, description="Use incognito mode"),
+    stream_mode: str = Query(
+        "snapshot",
+        description="snapshot: resend the current state on every event; "
+        "delta: send only new answer text, then the consolidated answer; "
+        "patch: send the first snapshot, then JSON Patch diffs against the previous one",
+        enum=["snapshot", "delta", "patch"],
+    ),
+    cache: bool = Query(True, description="Allow answers from the response cache"),
+    trace: bool = Query(False, description=TRACE_DESCRIPTION),
 ):
     """Stream Perplexity AI responses as Server-Sent Events (SSE). Handles both new and follow-up queries."""
+    try:
+        fields_list = parse_fields(fields, answer_only, stream_mode)
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
     sources_list = [s.strip() for s in sources.split(",")]
-    follow_up = (
-        {"backend_uuid": backend_uuid, "attachments": []} if backend_uuid else None
+    conversation = (
+        await conversations.open_async(conversation_id) if conversation_id else None
     )
-    return StreamingResponse(
+    follow_up = follow_up_for(backend_uuid, conversation)
+    request_trace = start_trace("query_async", trace, mode)
+    started = time.perf_counter()
+    try:
+        slot = await admission.acquire(mode)
+    except AdmissionRejected as e:
+        return rejected_response("query_async", e)
+    if request_trace is not None:
+        request_trace.add("admission", started)
+
+    return admitted_stream(
         generate_sse_stream(
             query=q,
-            answer_only=answer_only,
+            fields=fields_list,
             mode=mode,
             model=model,
             sources=sources_list,
             language=language,
             follow_up=follow_up,
             incognito=incognito,
+            stream_mode=stream_mode,
+            use_cache=cache,
+            conversation=conversation,
+            trace=request_trace,
         ),
+        slot,
         media_type="text/event-stream",
+        trace=request_trace,
     )
 
 
 @app.get("/api/query_sync")
-def query_sync(
+async def query_sync(
     q: str = Query(..., description="Query string to search"),
     backend_uuid: str = Query(
         None, description="UUID of the previous response", alias="backend_uuid"
     ),
+    conversation_id: Optional[str] = Query(
+        None,
+        description="Continue this server-side conversation, or start it if new",
+    ),
     answer_only: bool = Query(False, description="Return only the answer text"),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
     mode: str = Query(
         "auto",
         description="Search mode",
@@ -145,40 +753,539 @@ def query_sync(
     sources: str = Query("web", description="Sources (comma-separated)"),
     language: str = Query("en-US", description="Language"),
     incognito: bool = Query(False, description="Use incognito mode"),
+    cache: bool = Query(True, description="Allow answers from the response cache"),
+    trace: bool = Query(False, description=TRACE_DESCRIPTION),
 ):
     """Query Perplexity AI and return the full response as JSON (no streaming)."""
+    try:
+        fields_list = parse_fields(fields, answer_only)
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+    sources_list = [s.strip() for s in sources.split(",")]
+    conversation = (
+        await conversations.open_async(conversation_id) if conversation_id else None
+    )
+    follow_up = follow_up_for(backend_uuid, conversation)
+    return await generate_json_response(
+        trace=start_trace("query_sync", trace, mode),
+        query=q,
+        fields=fields_list,
+        mode=mode,
+        model=model,
+        sources=sources_list,
+        language=language,
+        follow_up=follow_up,
+        incognito=incognito,
+        use_cache=cache,
+        conversation=conversation,
+    )
+
+
+@app.post("/api/query_upload")
+async def query_upload(
+    q: str = Form(..., description="Query string to search"),
+    files: List[UploadFile] = File(..., description="Files to attach to the query"),
+    backend_uuid: Optional[str] = Form(
+        None, description="UUID of the previous response"
+    ),
+    conversation_id: Optional[str] = Form(
+        None,
+        description="Continue this server-side conversation, or start it if new",
+    ),
+    answer_only: bool = Form(False, description="Return only the answer text"),
+    fields: Optional[str] = Form(None, description=FIELDS_DESCRIPTION),
+    mode: str = Form(
+        "auto",
+        description="Search mode",
+        enum=["auto", "writing", "coding", "research"],
+    ),
+    model: Optional[str] = Form(None, description="Model to use"),
+    sources: str = Form("web", description="Sources (comma-separated)"),
+    language: str = Form("en-US", description="Language"),
+    incognito: bool = Form(False, description="Use incognito mode"),
+    stream: bool = Form(False, description="Stream the response as SSE"),
+    stream_mode: str = Form(
+        "snapshot",
+        description="Output mode when streaming, as for /api/query_async",
+        enum=["snapshot", "delta", "patch"],
+    ),
+    trace: bool = Form(False, description=TRACE_DESCRIPTION),
+):
+    """Query Perplexity AI with attached files, as JSON or as an SSE stream."""
+    try:
+        fields_list = parse_fields(fields, answer_only, stream and stream_mode)
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
     sources_list = [s.strip() for s in sources.split(",")]
-    follow_up = (
-        {"backend_uuid": backend_uuid, "attachments": []} if backend_uuid else None
+    conversation = (
+        await conversations.open_async(conversation_id) if conversation_id else None
+    )
+    follow_up = follow_up_for(backend_uuid, conversation)
+    request_trace = start_trace("query_upload", trace, mode)
+    started = time.perf_counter()
+    upload_dir, upload_paths = await spool_uploads(files)
+    if request_trace is not None:
+        request_trace.add("spool", started, files=len(upload_paths))
+    search = dict(
+        query=q,
+        fields=fields_list,
+        mode=mode,
+        model=model,
+        sources=sources_list,
+        language=language,
+        follow_up=follow_up,
+        incognito=incognito,
+        files=upload_paths,
+        conversation=conversation,
     )
+
+    if stream:
+        started = time.perf_counter()
+        try:
+            slot = await admission.acquire(mode)
+        except AdmissionRejected as e:
+            shutil.rmtree(upload_dir, ignore_errors=True)
+            return rejected_response("query_upload", e)
+        if request_trace is not None:
+            request_trace.add("admission", started)
+
+        return admitted_stream(
+            remove_after(
+                generate_sse_stream(
+                    stream_mode=stream_mode,
+                    endpoint="query_upload",
+                    trace=request_trace,
+                    **search,
+                ),
+                upload_dir,
+            ),
+            slot,
+            media_type="text/event-stream",
+            trace=request_trace,
+        )
+
     try:
-        result = perplexity_cli.search(
-            q,
-            mode=mode,
-            model=model,
-            sources=sources_list,
-            files={},
-            stream=False,
-            language=language,
-            follow_up=follow_up,
-            incognito=incognito,
+        return await generate_json_response(
+            endpoint="query_upload", trace=request_trace, **search
         )
-        file_name = f"API-{datetime.now().strftime('%Y%m%d%H%M%S')}-sync"
-        save_resp(result, file_name)
-        if answer_only:
-            ans_data = extract_answer(result, file_name)
-            return JSONResponse(content=ans_data)
-        return JSONResponse(content=result)
+    finally:
+        shutil.rmtree(upload_dir, ignore_errors=True)
+
+
+class BatchQuery(BaseModel):
+    """One query of a batch, with the parameters of /api/query_sync."""
+
+    q: str = Field(..., description="Query string to search")
+    backend_uuid: Optional[str] = Field(
+        None, description="UUID of the previous response"
+    )
+    conversation_id: Optional[str] = Field(
+        None, description="Continue this server-side conversation, or start it if new"
+    )
+    answer_only: bool = Field(False, description="Return only the answer text")
+    fields: Optional[str] = Field(None, description=FIELDS_DESCRIPTION)
+    mode: str = Field(
+        "auto",
+        description="Search mode",
+        json_schema_extra={"enum": ["auto", "writing", "coding", "research"]},
+    )
+    model: Optional[str] = Field(None, description="Model to use")
+    sources: str = Field("web", description="Sources (comma-separated)")
+    language: str = Field("en-US", description="Language")
+    incognito: bool = Field(False, description="Use incognito mode")
+    cache: bool = Field(True, description="Allow answers from the response cache")
+
+
+class BatchRequest(BaseModel):
+    queries: List[BatchQuery] = Field(..., description="Queries to run")
+    concurrency: Optional[int] = Field(
+        None,
+        ge=1,
+        description="Most queries in flight at once, capped by the server limit",
+    )
+
+
+@app.post("/api/batch")
+async def batch(request: BatchRequest):
+    """Run many queries and stream their results as NDJSON in completion order.
+
+    Each line is `{"index": i, "result": ...}` for the i-th query, or
+    `{"index": i, "error": ..., "status": ...}` if it failed.
+    """
+    concurrency = min(request.concurrency or batch_concurrency, batch_concurrency)
+    return StreamingResponse(
+        generate_batch(request.queries, concurrency),
+        media_type="application/x-ndjson",
+    )
+
+
+class JobRequest(BatchQuery):
+    """A background search, with the parameters of /api/query_sync."""
+
+
+async def run_job(job, search):
+    """
+    Run a job's search and publish its events. The job waits for an admission
+    slot and for a usable account for as long as it takes, at batch priority.
+    """
+    fields = search.pop("fields")
+    extractor = BlockExtractor(fields) if fields else None
+    request_log = response_logger.open("jobs")
+    metrics.request_started("jobs")
+    error = None
+    try:
+        while True:
+            try:
+                slot = await admission.acquire(search["mode"], "batch")
+                try:
+                    job.status = "running"
+                    await jobs.save(job, force=True)
+                    async for stream in search_events(**search):
+                        request_log.write(stream)
+                        if extractor is not None:
+                            stream = extractor.update(stream, job.id)
+                        if stream is not None:
+                            await job.publish(stream)
+                            await jobs.save(job)
+                finally:
+                    slot.release()
+                break
+            except (AdmissionRejected, NoAccountAvailable) as e:
+                if job.seq or e.retry_after is None:
+                    raise
+                job.status = "queued"
+                await jobs.save(job, force=True)
+                await asyncio.sleep(e.retry_after)
+        await jobs.finish(job, "done")
+    except asyncio.CancelledError:
+        await jobs.finish(job, "cancelled", "The server stopped.")
+        raise
     except Exception as e:
-        return JSONResponse(content={"error": str(e)}, status_code=500)
+        error = e
+        await jobs.finish(job, "failed", str(e))
+    finally:
+        request_log.close()
+        metrics.request_finished("jobs", error)
+
+
+def job_event(seq, data):
+    return f"id: {seq}\ndata: {json.dumps(data)}\n\n"
+
+
+async def generate_job_stream(job, last_id):
+    """Stream a job's events after `last_id` as SSE, each with its number as id."""
+    async for seq, event in jobs.events(job, last_id):
+        yield job_event(seq, {"type": "content", "content": event, "done": False})
+    job = await jobs.get(job.id) or job
+    if job.status == "done":
+        yield job_event(job.seq, {"type": "content", "content": "", "done": True})
+    else:
+        yield job_event(job.seq, {"type": "error", "error": job.error, "done": True})
+
+
+@app.post("/api/jobs", status_code=202)
+async def create_job(request: JobRequest):
+    """Start a search in the background and return its job id.
+
+    Suited to long `deep research` queries: poll `/api/jobs/{id}` or follow
+    `/api/jobs/{id}/events`, reconnecting at any time.
+    """
+    try:
+        fields = parse_fields(request.fields, request.answer_only)
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+    if len(jobs.running) >= job_limit:
+        metrics.request_errors.labels("jobs", "TooManyJobs").inc()
+        return JSONResponse(
+            content={"error": f"Too many jobs running (limit {job_limit})."},
+            status_code=429,
+            headers={"Retry-After": str(job_retry_after)},
+        )
+
+    search = await spec_search(request, fields, "jobs")
+    job = await jobs.create(request.q, request.mode)
+    job.task = asyncio.create_task(run_job(job, search))
+    return JSONResponse(content=job.to_dict(), status_code=202)
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Return a job's status and its latest snapshot."""
+    job = await jobs.get(job_id)
+    if job is None:
+        return JSONResponse(content={"error": "Job not found"}, status_code=404)
+    return JSONResponse(content=job.to_dict())
+
+
+@app.get("/api/jobs/{job_id}/events")
+async def get_job_events(
+    job_id: str,
+    last_event_id: Optional[str] = Header(
+        None, description="Resume after this event, as sent by EventSource"
+    ),
+):
+    """Stream a job's events as SSE until it finishes.
+
+    Each event carries its number as the SSE id. Reconnecting with the
+    `Last-Event-ID` header replays the events after it that are still buffered.
+    """
+    job = await jobs.get(job_id)
+    if job is None:
+        return JSONResponse(content={"error": "Job not found"}, status_code=404)
+    try:
+        last_id = int(last_event_id or 0)
+    except ValueError:
+        return JSONResponse(content={"error": "Invalid Last-Event-ID"}, status_code=400)
+    return StreamingResponse(
+        generate_job_stream(job, last_id), media_type="text/event-stream"
+    )
+
+
+class ChatMessage(BaseModel):
+    role: str = Field(..., description="system, user or assistant")
+    content: Union[str, List[dict], None] = Field(
+        None, description="Text, or a list of content parts"
+    )
+
+
+class ChatCompletionRequest(BaseModel):
+    """The parts of an OpenAI chat completion request the wrapper understands."""
+
+    model: str = Field(
+        "auto",
+        description="Search mode, optionally followed by a model, e.g. `pro/gpt-4o`",
+    )
+    messages: List[ChatMessage] = Field(..., min_length=1)
+    stream: bool = Field(False, description="Stream the answer as SSE chunks")
+    conversation_id: Optional[str] = Field(
+        None,
+        description="Continue this server-side conversation instead of the one "
+        "matching the message history",
+    )
+
+
+async def chat_conversation(request, history):
+    """
+    Find the conversation a chat request continues.
+
+    Without an explicit id, a conversation is stored under a key derived from
+    its transcript, which the next request repeats as its history. The key
+    is only assigned once the answer is known, so sending the same history
+    twice branches off the stored turn instead of moving it.
+    """
+    if request.conversation_id:
+        return await conversations.open_async(request.conversation_id)
+    previous = None
+    if any(role == "assistant" for role, _ in history[:-1]):
+        previous = await conversations.get_async(chat.history_key(history[:-1]))
+    conversation = previous or Conversation()
+    conversation.id = None
+    return conversation
+
+
+async def remember_chat(conversation, history, answer):
+    """Store a transcript-keyed conversation under its key for the next turn."""
+    if conversation.id is None and conversation.backend_uuid is not None:
+        conversation.id = chat.history_key(history + [("assistant", answer)])
+        await conversations.save_async(conversation)
+
+
+async def generate_chat_stream(completion, conversation, history, search):
+    """Stream a chat completion as OpenAI chunks, ending with `[DONE]`."""
+    request_log = response_logger.open("chat")
+    metrics.request_started("chat")
+    error = None
+    answer_delta = AnswerDelta()
+    sent = ""
+    stream = None
+    try:
+        yield completion.chunk({"role": "assistant", "content": ""})
+        async for stream in search_events(**search):
+            request_log.write(stream)
+            delta = answer_delta.update(stream, completion.id)
+            if delta is not None:
+                sent += delta["delta"]
+                yield completion.chunk({"content": delta["delta"]})
+
+        # The final answer may add text that never arrived as a chunk
+        answer = answer_delta.final(stream, completion.id)["answer"] or ""
+        if answer.startswith(sent) and len(answer) > len(sent):
+            yield completion.chunk({"content": answer[len(sent) :]})
+            sent = answer
+        yield completion.chunk({}, finish_reason="stop")
+        yield "data: [DONE]\n\n"
+        await remember_chat(conversation, history, sent)
+
+    except Exception as e:
+        error = e
+        yield f"data: {json.dumps(chat.error_body(str(e), type(e).__name__))}\n\n"
+
+    finally:
+        request_log.close()
+        metrics.request_finished("chat", error)
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: ChatCompletionRequest):
+    """OpenAI-compatible chat completions backed by server-side conversations.
+
+    Only the last message is sent to Perplexity when the conversation is
+    known, so clients can keep sending the full history as usual. A history
+    the server hasn't seen is folded into the first query.
+    """
+    history = [(m.role, chat.message_text(m.content)) for m in request.messages]
+    try:
+        mode, model = chat.parse_model(request.model)
+        if history[-1][0] != "user":
+            raise ValueError("The last message must be from the user.")
+    except ValueError as e:
+        return JSONResponse(content=chat.error_body(str(e)), status_code=400)
+
+    conversation = await chat_conversation(request, history)
+    follow_up = conversation.follow_up
+    search = dict(
+        query=history[-1][1] if follow_up else chat.build_query(history),
+        mode=mode,
+        model=model,
+        sources=["web"],
+        language="en-US",
+        follow_up=follow_up,
+        incognito=False,
+        endpoint="chat",
+        conversation=conversation,
+    )
+    completion = chat.Completion(request.model)
+    try:
+        slot = await admission.acquire(mode)
+    except AdmissionRejected as e:
+        metrics.request_errors.labels("chat", type(e).__name__).inc()
+        return JSONResponse(
+            content=chat.error_body(str(e), "rate_limit_error"),
+            status_code=429,
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+    if request.stream:
+        return admitted_stream(
+            generate_chat_stream(completion, conversation, history, search),
+            slot,
+            media_type="text/event-stream",
+        )
+
+    try:
+        with metrics.track_request("chat"):
+            result = await search_result(fields=["answer"], **search)
+        answer = result.get("answer") or ""
+        await remember_chat(conversation, history, answer)
+        return JSONResponse(content=completion.message(answer))
+    except AccountGone as e:
+        return JSONResponse(content=chat.error_body(str(e)), status_code=410)
+    except NoAccountAvailable as e:
+        return JSONResponse(
+            content=chat.error_body(str(e), "service_unavailable"), status_code=503
+        )
+    except Exception as e:
+        return JSONResponse(
+            content=chat.error_body(str(e), type(e).__name__), status_code=500
+        )
+    finally:
+        slot.release()
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Expose search latency, stream throughput, load and quota in the Prometheus format."""
+    body, content_type = metrics.render(upstream.pool)
+    return Response(content=body, media_type=content_type)
+
+
+def check_admin(authorization):
+    """Return an error response unless `authorization` carries the admin token."""
+    if not admin_token:
+        return JSONResponse(
+            content={"error": "Admin endpoints are disabled"}, status_code=404
+        )
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(
+        token.encode(), admin_token.encode()
+    ):
+        return JSONResponse(content={"error": "Invalid admin token"}, status_code=401)
+    return None
+
+
+@app.get("/admin/profile")
+async def get_profile(
+    seconds: float = Query(10, gt=0, le=300, description="How long to sample"),
+    interval: float = Query(0.005, gt=0, le=1, description="Seconds between samples"),
+    all_threads: bool = Query(
+        False, description="Sample every thread, not only the event loop"
+    ),
+    authorization: Optional[str] = Header(None),
+):
+    """
+    Sample the server's stacks for a while and return them as folded stacks,
+    ready for flamegraph.pl or speedscope. Needs the admin token.
+    """
+    denied = check_admin(authorization)
+    if denied is not None:
+        return denied
+    thread_ids = None if all_threads else {threading.get_ident()}
+    try:
+        stacks = await asyncio.to_thread(
+            profiler.profile, seconds, interval, thread_ids
+        )
+    except ProfilerBusy as e:
+        return JSONResponse(content={"error": str(e)}, status_code=409)
+    return PlainTextResponse(stacks)
+
+
+@app.get("/admin/traces")
+async def get_traces(authorization: Optional[str] = Header(None)):
+    """List the most recent request traces, newest first. Needs the admin token."""
+    denied = check_admin(authorization)
+    if denied is not None:
+        return denied
+    return JSONResponse(
+        content=[
+            {
+                "trace_id": trace.trace_id,
+                "name": trace.root.name,
+                "duration_ms": round(trace.root.seconds * 1000, 3),
+                "error": trace.root.attributes.get("error"),
+            }
+            for trace in reversed(recent_traces)
+        ]
+    )
+
+
+@app.get("/admin/traces/{trace_id}")
+async def get_trace(trace_id: str, authorization: Optional[str] = Header(None)):
+    """Return one recent trace as OTLP/JSON. Needs the admin token."""
+    denied = check_admin(authorization)
+    if denied is not None:
+        return denied
+    for trace in recent_traces:
+        if trace.trace_id == trace_id:
+            return JSONResponse(content=trace.to_otlp())
+    return JSONResponse(content={"error": "Trace not found"}, status_code=404)
 
 
 @app.get("/api/threads")
-def get_threads(limit: int = 20, offset: int = 0, search_term: str = ""):
-    """Fetch a list of threads from Perplexity AI."""
+async def get_threads(
+    limit: int = 20,
+    offset: int = 0,
+    search_term: str = "",
+    refresh: bool = Query(False, description="Sync the local mirror first"),
+):
+    """List threads from the local mirror, syncing it first if asked or empty."""
     try:
-        threads = perplexity_cli.get_threads(
-            limit=limit, offset=offset, search_term=search_term
+        if refresh or await asyncio.to_thread(thread_mirror.synced_at) is None:
+            await thread_mirror.sync(upstream.pool.primary.client)
+        threads = await asyncio.to_thread(
+            thread_mirror.list_threads,
+            limit=limit,
+            offset=offset,
+            search_term=search_term,
         )
         return JSONResponse(content=threads)
     except Exception as e:
@@ -186,10 +1293,44 @@ def get_threads(limit: int = 20, offset: int = 0, search_term: str = ""):
 
 
 @app.get("/api/threads/{slug}")
-def get_thread(slug: str):
-    """Fetch a specific thread by slug."""
+async def get_thread(
+    slug: str,
+    refresh: bool = Query(False, description="Fetch the thread again from Perplexity"),
+    cursor: Optional[str] = Query(
+        None, description="Resume after the page that returned this cursor"
+    ),
+    limit: Optional[int] = Query(
+        None, ge=1, description="Entries per page; pages the thread when set"
+    ),
+):
+    """Fetch a specific thread by slug from the local mirror.
+
+    With `limit` or `cursor`, only one page of entries is returned along with
+    a `next_cursor` for the following page (null on the last one).
+    """
+    try:
+        offset = decode_cursor(cursor) if cursor else 0
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
     try:
-        thread = perplexity_cli.get_thread_details_by_slug(slug)
-        return JSONResponse(content=thread)
+        thread = None
+        if not refresh:
+            thread = await asyncio.to_thread(thread_mirror.get_thread, slug)
+        if thread is None:
+            thread = await thread_mirror.refresh_thread(
+                upstream.pool.primary.client, slug
+            )
+        if cursor is None and limit is None:
+            return JSONResponse(content=thread)
+
+        entries = thread.get("entries") or []
+        end = offset + (limit or 100)
+        return JSONResponse(
+            content={
+                **thread,
+                "entries": entries[offset:end],
+                "next_cursor": encode_cursor(end) if end < len(entries) else None,
+            }
+        )
     except Exception as e:
         return JSONResponse(content={"error": str(e)}, status_code=500)
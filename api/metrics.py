@@ -0,0 +1,174 @@
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+
+from lib.events import SearchEvent
+from lib.hooks import SearchHooks
+
+registry = CollectorRegistry()
+
+SEARCH_LABELS = ("mode", "model", "endpoint")
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 120, 300)
+
+upload_seconds = Histogram(
+    "perplexity_upload_seconds",
+    "Time to upload a query's files",
+    SEARCH_LABELS,
+    buckets=LATENCY_BUCKETS,
+    registry=registry,
+)
+first_byte_seconds = Histogram(
+    "perplexity_first_byte_seconds",
+    "Time from sending a query to the first response byte",
+    SEARCH_LABELS,
+    buckets=LATENCY_BUCKETS,
+    registry=registry,
+)
+first_token_seconds = Histogram(
+    "perplexity_first_token_seconds",
+    "Time from the start of a search to the first answer text",
+    SEARCH_LABELS,
+    buckets=LATENCY_BUCKETS,
+    registry=registry,
+)
+stream_seconds = Histogram(
+    "perplexity_stream_seconds",
+    "Total duration of a search, from start to end of stream",
+    SEARCH_LABELS,
+    buckets=LATENCY_BUCKETS,
+    registry=registry,
+)
+stream_events = Histogram(
+    "perplexity_stream_events",
+    "Events per response stream",
+    SEARCH_LABELS,
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500),
+    registry=registry,
+)
+stream_bytes = Histogram(
+    "perplexity_stream_bytes",
+    "Bytes per response stream",
+    SEARCH_LABELS,
+    buckets=tuple(2**n for n in range(10, 28, 2)),
+    registry=registry,
+)
+upstream_errors = Counter(
+    "perplexity_upstream_errors",
+    "Searches that failed while uploading, sending or streaming, by error type",
+    SEARCH_LABELS + ("type",),
+    registry=registry,
+)
+request_errors = Counter(
+    "perplexity_request_errors",
+    "API requests that ended in an error, by error type",
+    ("endpoint", "type"),
+    registry=registry,
+)
+in_flight_requests = Gauge(
+    "perplexity_in_flight_requests",
+    "API requests being served",
+    ("endpoint",),
+    registry=registry,
+)
+account_in_flight = Gauge(
+    "perplexity_account_in_flight",
+    "Searches running on each pool account",
+    ("account",),
+    registry=registry,
+)
+quota_remaining = Gauge(
+    "perplexity_quota_remaining",
+    "Remaining pro query (copilot) and file upload quota of each pool account",
+    ("account", "kind"),
+    registry=registry,
+)
+
+
+def has_answer_text(event):
+    """Whether a response event carries any answer text yet."""
+    if isinstance(event, SearchEvent):
+        return bool(event.chunks or event.final_answer)
+    for block in event.get("blocks") or ():
+        if block.get("intended_usage") != "ask_text":
+            continue
+        markdown_block = block.get("markdown_block")
+        if isinstance(markdown_block, dict) and (
+            markdown_block.get("chunks") or markdown_block.get("answer")
+        ):
+            return True
+    return False
+
+
+class MetricsHooks(SearchHooks):
+    """Search hooks that record Prometheus metrics for one API endpoint."""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.answered = set()
+
+    def labels(self, search):
+        return (search.mode, search.model or "default", self.endpoint)
+
+    def on_upload(self, search, seconds):
+        upload_seconds.labels(*self.labels(search)).observe(seconds)
+
+    def on_first_byte(self, search, seconds):
+        first_byte_seconds.labels(*self.labels(search)).observe(seconds)
+
+    def on_event(self, search, event, size):
+        if id(search) not in self.answered and has_answer_text(event):
+            self.answered.add(id(search))
+            first_token_seconds.labels(*self.labels(search)).observe(search.elapsed)
+
+    def on_stream_end(self, search, seconds):
+        self.answered.discard(id(search))
+        labels = self.labels(search)
+        stream_seconds.labels(*labels).observe(seconds)
+        stream_events.labels(*labels).observe(search.events)
+        stream_bytes.labels(*labels).observe(search.bytes)
+
+    def on_error(self, search, error):
+        upstream_errors.labels(*self.labels(search), type(error).__name__).inc()
+
+
+def request_started(endpoint):
+    """Count a request as in flight."""
+    in_flight_requests.labels(endpoint).inc()
+
+
+def request_finished(endpoint, error=None):
+    """Count a request as done, and its error by type if it failed."""
+    in_flight_requests.labels(endpoint).dec()
+    if error is not None:
+        request_errors.labels(endpoint, type(error).__name__).inc()
+
+
+@contextmanager
+def track_request(endpoint):
+    """Count a request as in flight while the block runs, and its error if one escapes."""
+    request_started(endpoint)
+    error = None
+    try:
+        yield
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        request_finished(endpoint, error)
+
+
+def render(pool):
+    """Render all metrics in the Prometheus text format, with current pool state."""
+    for account in pool.accounts:
+        account_in_flight.labels(account.name).set(account.in_flight)
+        copilot, file_upload = account.remaining
+        quota_remaining.labels(account.name, "copilot").set(copilot)
+        quota_remaining.labels(account.name, "file_upload").set(file_upload)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,91 @@
+from lib.hooks import SearchHooks
+
+from .cache import ResponseCache
+
+
+class Conversation:
+    """
+    Follow-up state of one server-side conversation.
+
+    Holds the `backend_uuid` of the latest answer, every attachment URL the
+    conversation has used so far, and the account that started it. Perplexity
+    threads belong to an account, so follow-ups must go to the same one.
+    """
+
+    def __init__(self, id=None, backend_uuid=None, attachments=(), account=None):
+        self.id = id
+        self.backend_uuid = backend_uuid
+        self.attachments = list(attachments)
+        self.account = account
+
+    @property
+    def follow_up(self):
+        """The `follow_up` argument for the next search, or None before the first."""
+        if self.backend_uuid is None:
+            return None
+        return {
+            "backend_uuid": self.backend_uuid,
+            "attachments": list(self.attachments),
+        }
+
+    def update(self, result, account, attachments=()):
+        """
+        Record a finished search of this conversation, run on `account` with
+        the attachment URLs `attachments`.
+        """
+        self.backend_uuid = result.get("backend_uuid") or self.backend_uuid
+        for url in attachments:
+            if url not in self.attachments:
+                self.attachments.append(url)
+        self.account = self.account or account
+
+    def to_dict(self):
+        return {
+            "backend_uuid": self.backend_uuid,
+            "attachments": self.attachments,
+            "account": self.account,
+        }
+
+
+class AttachmentRecorder(SearchHooks):
+    """Search hooks that keep the attachment URLs a search sent."""
+
+    def __init__(self):
+        self.attachments = []
+
+    def on_stream_end(self, search, seconds):
+        self.attachments = search.attachments
+
+
+class ConversationStore:
+    """
+    Conversations keyed by id, in an in-memory LRU with an optional SQLite
+    backend. A conversation expires `ttl` seconds after its latest turn.
+    """
+
+    def __init__(self, maxsize=4096, ttl=86400, path=None):
+        self.entries = ResponseCache(maxsize, ttl, path, table="conversations")
+
+    def get(self, conversation_id):
+        """Return the conversation called `conversation_id`, or None."""
+        state = self.entries.get(conversation_id)
+        if state is None:
+            return None
+        return Conversation(conversation_id, **state)
+
+    async def get_async(self, conversation_id):
+        """`get`, reading the SQLite backend in a worker thread."""
+        state = await self.entries.get_async(conversation_id)
+        if state is None:
+            return None
+        return Conversation(conversation_id, **state)
+
+    async def open_async(self, conversation_id):
+        """Return the conversation called `conversation_id`, starting it if new."""
+        return await self.get_async(conversation_id) or Conversation(conversation_id)
+
+    def save(self, conversation):
+        self.entries.set(conversation.id, conversation.to_dict())
+
+    async def save_async(self, conversation):
+        await self.entries.set_async(conversation.id, conversation.to_dict())
@@ -0,0 +1,96 @@
+import json
+import asyncio
+
+from lib.pool import ClientPool
+
+
+def load_cookie_sets(path):
+    """Read the cookies file, which holds one cookie dict or a list of them, one per account."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            cookies = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        print("Cookies file not found or invalid. Using empty cookies.")
+        cookies = {}
+
+    cookie_sets = cookies if isinstance(cookies, list) else [cookies]
+    return [cookies for cookies in cookie_sets if cookies]
+
+
+class Upstream:
+    """
+    The account pool, built on first use and kept warm in the background.
+
+    `start` runs from the app's lifespan. It opens each account's auth session
+    and `connections` connections without holding up startup, then sends a
+    request on each account every `keepalive` seconds so idle connections
+    stay open. Requests that arrive before the warm-up finishes just use the
+    pool as usual.
+    """
+
+    def __init__(
+        self, cookie_path, anonymous=0, connections=2, keepalive=60, **pool_options
+    ):
+        """
+        Parameters:
+        - cookie_path: Cookies file, read when the pool is first needed.
+        - anonymous: Extra sessions without cookies; at least one is added
+          when the file holds no cookies.
+        - connections: Connections to open per account at startup, or 0 to
+          skip the warm-up.
+        - keepalive: Seconds between keep-alive requests, or 0 to send none.
+        - pool_options: Further `ClientPool` arguments.
+        """
+        self.cookie_path = cookie_path
+        self.anonymous = anonymous
+        self.connections = connections
+        self.keepalive = keepalive
+        self.pool_options = pool_options
+        self._pool = None
+        self._task = None
+
+    @property
+    def pool(self):
+        """The `ClientPool`, built on first access."""
+        if self._pool is None:
+            cookie_sets = load_cookie_sets(self.cookie_path)
+            self._pool = ClientPool(
+                cookie_sets,
+                anonymous=self.anonymous if cookie_sets else max(self.anonymous, 1),
+                **self.pool_options,
+            )
+        return self._pool
+
+    def start(self):
+        """Start warming up the pool in a background task."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background task and close every client's session."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._pool is not None:
+            await asyncio.gather(
+                *(account.client.close() for account in self._pool.accounts),
+                return_exceptions=True,
+            )
+
+    async def _run(self):
+        if self.connections:
+            await self._warm_up(self.connections)
+        while self.keepalive:
+            await asyncio.sleep(self.keepalive)
+            await self._warm_up(1)
+
+    async def _warm_up(self, connections):
+        accounts = self.pool.accounts
+        results = await asyncio.gather(
+            *(account.client.warm_up(connections) for account in accounts),
+            return_exceptions=True,
+        )
+        for account, result in zip(accounts, results):
+            if isinstance(result, Exception):
+                print(f"Warm-up of {account.name} failed: {result!r}")
@@ -1,18 +1,16 @@
 import os
-import json
+import base64
+import shutil
+import asyncio
+import tempfile
 
-logs_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../logs")
-if not os.path.exists(logs_dir):
-    os.makedirs(logs_dir)
 
-
-def extract_answer(res, file_name):
-    """Extract answer from Perplexity API response."""
-    backend_uuid = res.get("backend_uuid", None)
+def find_answer_block(res, file_name):
+    """Find the markdown block holding the answer in a Perplexity API response."""
     blocks = res.get("blocks", [])
     if not isinstance(blocks, list):
         print(f"Unexpected blocks format in {file_name}: {blocks}")
-        return {"answer": None, "backend_uuid": backend_uuid}
+        return None
 
     for block in blocks:
         intended_usage = block.get("intended_usage", "")
@@ -30,37 +28,283 @@ def extract_answer(res, file_name):
             if not isinstance(chunks, list):
                 print(f"Unexpected chunks format in {file_name}: {chunks}")
                 continue
+            return mardown_block
+
+        if progress == "DONE":
+            return mardown_block
+
+        print(f"Unexpected progress state in {file_name}: {progress} for block {block}")
+        return None
+
+    return None
+
+
+def extract_answer(res, file_name):
+    """Extract answer from Perplexity API response."""
+    return BlockExtractor(["answer"]).extract(res, file_name)
+
+
+# Projection fields, with the `intended_usage` of the block each one is read
+# from, the key of the block's content and the key of the list it holds.
+# Related questions come from the top-level `related_queries`.
+BLOCK_FIELDS = {
+    "answer": ("ask_text", "markdown_block", "chunks"),
+    "web_results": ("web_results", "web_result_block", "web_results"),
+    "images": ("media_items", "media_block", "media_items"),
+}
+FIELDS = (*BLOCK_FIELDS, "related_questions")
 
-            answer = "".join(chunks)
-            return {
-                "progress": progress,
-                "answer": answer,
-                "backend_uuid": backend_uuid,
-            }
 
+def parse_fields(fields, answer_only=False, stream_mode=None):
+    """
+    Return the projection fields named in a comma-separated `fields` string,
+    or ["answer"] for `answer_only`. Returns None for the full response, and
+    raises ValueError for unknown fields, or for fields other than the answer
+    with `stream_mode` delta, which only streams the answer.
+    """
+    if not fields:
+        return ["answer"] if answer_only else None
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in FIELDS]
+    if unknown or not names:
+        raise ValueError(
+            f"Unknown fields: {', '.join(unknown)}. Use any of {', '.join(FIELDS)}."
+        )
+    names = list(dict.fromkeys(names))
+    if stream_mode == "delta" and names != ["answer"]:
+        raise ValueError(
+            "stream_mode=delta only streams the answer. "
+            "Use snapshot or patch to stream other fields."
+        )
+    return names
+
+
+class BlockExtractor:
+    """
+    Project the response events of one stream onto a few fields.
+
+    Each event's blocks are indexed by `intended_usage` in a single pass, and
+    only the blocks of the chosen fields are looked at. The answer remembers
+    how many chunks it has joined, so only new chunks are joined, and the
+    other fields remember what they last read, so unchanged ones are skipped.
+    """
+
+    def __init__(self, fields):
+        self.fields = list(fields)
+        self.usages = {
+            BLOCK_FIELDS[field][0]: field
+            for field in self.fields
+            if field in BLOCK_FIELDS
+        }
+        self.values = dict.fromkeys(self.fields)
+        self.versions = {}
+        self.progress = None
+        self.backend_uuid = None
+        self.answer_chunks = 0
+
+    def update(self, res, file_name):
+        """Return the projection of `res`, or None if it is unchanged."""
+        return self.projection() if self.read(res, file_name) else None
+
+    def extract(self, res, file_name):
+        """Return the projection of `res`, whether or not it changed."""
+        self.read(res, file_name)
+        return self.projection()
+
+    def projection(self):
+        result = {}
+        if "answer" in self.values and self.progress is not None:
+            result["progress"] = self.progress
+        result.update(self.values)
+        result["backend_uuid"] = self.backend_uuid
+        return result
+
+    def read(self, res, file_name):
+        """Read the chosen fields of `res`, and return whether any of them changed."""
+        changed = False
+        backend_uuid = res.get("backend_uuid", self.backend_uuid)
+        if backend_uuid != self.backend_uuid:
+            self.backend_uuid = backend_uuid
+            changed = True
+
+        for field, content in self.index(res, file_name).items():
+            if field == "answer":
+                changed |= self.read_answer(content)
+            elif field == "related_questions":
+                changed |= self.read_list(field, None, content)
+            else:
+                items = content.get(BLOCK_FIELDS[field][2])
+                changed |= self.read_list(field, content.get("progress"), items)
+        return changed
+
+    def index(self, res, file_name):
+        """Map each chosen field to its content in `res`, in one pass over the blocks."""
+        found = {}
+        blocks = res.get("blocks", [])
+        if not isinstance(blocks, list):
+            print(f"Unexpected blocks format in {file_name}: {blocks}")
+            blocks = []
+
+        for block in blocks:
+            if not isinstance(block, dict):
+                continue
+            field = self.usages.get(block.get("intended_usage"))
+            if field is None or field in found:
+                continue
+            content = block.get(BLOCK_FIELDS[field][1])
+            if not isinstance(content, dict):
+                print(f"Unexpected {field} block format in {file_name}: {content}")
+                continue
+            found[field] = content
+            if len(found) == len(self.usages):
+                break
+
+        if "related_questions" in self.values:
+            related = res.get("related_queries")
+            if isinstance(related, list):
+                found["related_questions"] = [
+                    item.get("text") if isinstance(item, dict) else item
+                    for item in related
+                ]
+        return found
+
+    def read_answer(self, markdown_block):
+        progress = markdown_block.get("progress")
+        chunks = markdown_block.get("chunks") or []
+        if not isinstance(chunks, list):
+            return False
+
+        if progress == "DONE" and markdown_block.get("answer") is not None:
+            version = (progress, markdown_block["answer"])
+            answer = markdown_block["answer"]
+        else:
+            version = (progress, len(chunks))
+            answer = self.values["answer"] or ""
+            if len(chunks) < self.answer_chunks:
+                # The answer was rewritten upstream, so join it again
+                self.answer_chunks = 0
+                answer = ""
+            answer += "".join(chunks[self.answer_chunks :])
+            self.answer_chunks = len(chunks)
+
+        if self.versions.get("answer") == version:
+            return False
+        self.versions["answer"] = version
+        self.progress = progress
+        self.values["answer"] = answer
+        return True
+
+    def read_list(self, field, progress, items):
+        if not isinstance(items, list):
+            return False
+        # Compare the items themselves, as upstream may update a list in place
+        version = (progress, items)
+        if self.versions.get(field) == version:
+            return False
+        self.versions[field] = version
+        self.values[field] = items
+        return True
+
+
+class AnswerDelta:
+    """Track the answer text a client has received and emit only what is new."""
+
+    def __init__(self):
+        self.sent = []
+        self.reset = False
+        self.backend_uuid = None
+        self.done = False
+
+    def update(self, res, file_name):
+        """Return the new answer text in `res`, or None if there is nothing new."""
+        self.backend_uuid = res.get("backend_uuid", self.backend_uuid)
+        mardown_block = find_answer_block(res, file_name)
+        if mardown_block is None or self.done:
+            return None
+
+        progress = mardown_block["progress"]
         if progress == "DONE":
-            answer = mardown_block.get("answer")
+            self.done = True
+            return None
+
+        chunks = mardown_block.get("chunks", [])
+        if chunks[: len(self.sent)] != self.sent:
+            # The answer was rewritten upstream, so start over. The next delta
+            # tells the client, even if this event has no text yet.
+            self.sent = []
+            self.reset = True
 
-            return {
-                "progress": progress,
-                "answer": answer,
-                "backend_uuid": backend_uuid,
-            }
+        if len(chunks) == len(self.sent):
+            return None
 
+        delta = "".join(chunks[len(self.sent) :])
+        self.sent.extend(chunks[len(self.sent) :])
+        reset, self.reset = self.reset, False
+        return {
+            "progress": progress,
+            "delta": delta,
+            "reset": reset,
+            "backend_uuid": self.backend_uuid,
+        }
+
+    def final(self, res, file_name):
+        """Return the consolidated answer once the stream has ended."""
+        mardown_block = find_answer_block(res, file_name) if res else None
+        if mardown_block is not None and mardown_block["progress"] == "DONE":
+            answer = mardown_block.get("answer")
         else:
-            print(
-                f"Unexpected progress state in {file_name}: {progress} for block {block}"
-            )
-            return {"answer": None, "backend_uuid": backend_uuid}
+            answer = "".join(self.sent)
+
+        return {
+            "progress": "DONE",
+            "answer": answer,
+            "backend_uuid": self.backend_uuid,
+        }
+
+
+def unique_name(filename, taken):
+    """Return `filename`, or `name (1).ext`, `name (2).ext`... if it is in `taken`."""
+    stem, ext = os.path.splitext(filename)
+    n = 0
+    while filename in taken:
+        n += 1
+        filename = f"{stem} ({n}){ext}"
+    return filename
+
+
+async def spool_uploads(files):
+    """
+    Copy uploaded files to a temporary directory so they can be streamed from
+    disk. Files sent under the same name are numbered so none is dropped.
+    """
+    directory = tempfile.mkdtemp(prefix="perplexity-upload-")
+    paths = {}
+    try:
+        for i, upload in enumerate(files):
+            filename = os.path.basename(upload.filename or f"file-{i}")
+            filename = unique_name(filename, paths)
+            path = os.path.join(directory, f"{i}-{filename}")
+            with open(path, "wb") as f:
+                await asyncio.to_thread(shutil.copyfileobj, upload.file, f, 2**20)
+            paths[filename] = path
+    except BaseException:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+    return directory, paths
+
 
-    return {"answer": None, "backend_uuid": backend_uuid}
+def encode_cursor(offset):
+    """Encode an entry offset as an opaque paging cursor."""
+    return base64.urlsafe_b64encode(f"o:{offset}".encode()).decode().rstrip("=")
 
 
-def save_resp(res, file_name):
-    """Save response to file for logging/debugging."""
+def decode_cursor(cursor):
+    """Return the entry offset in a cursor from `encode_cursor`, or raise ValueError."""
     try:
-        with open(os.path.join(logs_dir, file_name), "w", encoding="utf-8") as f:
-            json.dump(res, f, indent=2, ensure_ascii=False)
-    except Exception:
-        # Silently fail if we can't save
-        pass
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+    prefix, _, offset = raw.partition(":")
+    if prefix != "o" or not offset.isdigit():
+        raise ValueError("Invalid cursor")
+    return int(offset)
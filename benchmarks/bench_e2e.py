@@ -0,0 +1,252 @@
+"""
+End-to-end throughput, latency, CPU and peak memory against the local fake
+upstream in `benchmarks.fake_upstream`.
+
+Drives `Client.search` and `AsyncClient.search` in this process, then
+`/api/query_sync` and `/api/query_async` on an API server started for each
+scenario. Server CPU and peak memory are read from /proc, so they are only
+reported on Linux.
+
+Usage: python -m benchmarks.bench_e2e [--requests 200] [--concurrency 20]
+           [--delay 0.005] [--events 50] [--token-bytes 32] [--logs DIR]
+"""
+
+import os
+import sys
+import time
+import socket
+import asyncio
+import argparse
+import resource
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from curl_cffi import requests
+
+from lib.perplexity import AsyncClient, Client
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start(args, port, env=None):
+    """Starts a server subprocess and waits until it accepts connections."""
+    proc = subprocess.Popen(
+        [sys.executable, *args],
+        cwd=ROOT,
+        env={**os.environ, **(env or {})},
+        stdout=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{args} exited with {proc.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            return proc
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError(f"{args} did not start")
+
+
+def stop(proc):
+    proc.terminate()
+    try:
+        proc.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+def proc_usage(pid):
+    """CPU seconds and peak RSS in bytes of a process, or None off Linux."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rpartition(")")[2].split()
+        with open(f"/proc/{pid}/status") as f:
+            hwm = next(line for line in f if line.startswith("VmHWM:"))
+    except (OSError, StopIteration):
+        return None, None
+    cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    return cpu, int(hwm.split()[1]) * 1024
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * q), len(ordered) - 1)]
+
+
+def report(name, latencies, elapsed, cpu, peak):
+    print(
+        f"{name:<22} {len(latencies) / elapsed:>9.1f} "
+        f"{percentile(latencies, 0.5) * 1000:>9.1f} "
+        f"{percentile(latencies, 0.99) * 1000:>9.1f} "
+        + (f"{cpu:>8.2f}" if cpu is not None else f"{'n/a':>8}")
+        + (f" {peak / 2**20:>9.1f}" if peak is not None else f" {'n/a':>9}")
+    )
+
+
+def bench_client(base_url, n, concurrency):
+    client = Client({}, base_url=base_url)
+
+    def one(i):
+        start = time.perf_counter()
+        client.search(f"question {i}")
+        return time.perf_counter() - start
+
+    cpu = time.process_time()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        latencies = list(pool.map(one, range(n)))
+    elapsed = time.perf_counter() - start
+    return latencies, elapsed, time.process_time() - cpu
+
+
+async def bench_async_client(base_url, n, concurrency):
+    client = AsyncClient({}, base_url=base_url)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            await client.search(f"question {i}")
+            return time.perf_counter() - start
+
+    cpu = time.process_time()
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(one(i) for i in range(n)))
+    elapsed = time.perf_counter() - start
+    await client.close()
+    return latencies, elapsed, time.process_time() - cpu
+
+
+async def load(url, n, concurrency, stream):
+    """Sends `n` queries to an API endpoint and returns latencies and duration."""
+    semaphore = asyncio.Semaphore(concurrency)
+    async with requests.AsyncSession(timeout=120) as session:
+
+        async def one(i):
+            params = {"q": f"question {i}", "cache": "false"}
+            async with semaphore:
+                start = time.perf_counter()
+                resp = await session.get(url, params=params, stream=stream)
+                if stream:
+                    async for _ in resp.aiter_content():
+                        pass
+                    await resp.aclose()
+                if resp.status_code != 200:
+                    raise RuntimeError(f"{url} returned {resp.status_code}")
+                return time.perf_counter() - start
+
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*(one(i) for i in range(n)))
+        return latencies, time.perf_counter() - start
+
+
+def bench_api(base_url, endpoint, n, concurrency):
+    port = free_port()
+    with tempfile.TemporaryDirectory() as tmp:
+        server = start(
+            [
+                "-m",
+                "uvicorn",
+                "api.main:app",
+                "--port",
+                str(port),
+                "--log-level",
+                "error",
+            ],
+            port,
+            env={
+                "PERPLEXITY_BASE_URL": base_url,
+                "PERPLEXITY_LOG_MODE": "off",
+                "PERPLEXITY_MIRROR_PATH": os.path.join(tmp, "threads.db"),
+                "PERPLEXITY_JOB_PATH": os.path.join(tmp, "jobs.db"),
+            },
+        )
+        try:
+            cpu, _ = proc_usage(server.pid)
+            latencies, elapsed = asyncio.run(
+                load(
+                    f"http://127.0.0.1:{port}/api/{endpoint}",
+                    n,
+                    concurrency,
+                    stream=endpoint == "query_async",
+                )
+            )
+            cpu_after, peak = proc_usage(server.pid)
+        finally:
+            stop(server)
+    return latencies, elapsed, cpu_after - cpu if cpu is not None else None, peak
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--delay", type=float, default=0.005)
+    parser.add_argument("--events", type=int, default=50)
+    parser.add_argument("--token-bytes", type=int, default=32)
+    parser.add_argument("--logs", help="directory of recorded response logs to replay")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    port = free_port()
+    upstream_args = [
+        "-m",
+        "benchmarks.fake_upstream",
+        "--port",
+        str(port),
+        "--delay",
+        str(args.delay),
+        "--events",
+        str(args.events),
+        "--token-bytes",
+        str(args.token_bytes),
+    ]
+    if args.logs:
+        upstream_args += ["--logs", os.path.abspath(args.logs)]
+    upstream = start(upstream_args, port)
+    base_url = f"http://127.0.0.1:{port}"
+
+    print(
+        f"{args.requests} requests, concurrency {args.concurrency}, "
+        f"{args.delay * 1000:g} ms between events"
+    )
+    print(
+        f"{'scenario':<22} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} "
+        f"{'cpu s':>8} {'peak MiB':>9}"
+    )
+    try:
+        latencies, elapsed, cpu = bench_client(
+            base_url, args.requests, args.concurrency
+        )
+        # ru_maxrss is the peak of this whole process so far, in KiB on Linux
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        report("Client.search", latencies, elapsed, cpu, peak)
+
+        latencies, elapsed, cpu = asyncio.run(
+            bench_async_client(base_url, args.requests, args.concurrency)
+        )
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        report("AsyncClient.search", latencies, elapsed, cpu, peak)
+
+        for endpoint in ("query_sync", "query_async"):
+            report(
+                f"/api/{endpoint}",
+                *bench_api(base_url, endpoint, args.requests, args.concurrency),
+            )
+    finally:
+        stop(upstream)
+
+
+if __name__ == "__main__":
+    main()
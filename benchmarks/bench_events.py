@@ -0,0 +1,114 @@
+"""
+Parse time and memory per event of the typed `SearchEvent` layer against the
+fully decoded dicts `Client.search` yields by default. Each consumer reads the
+answer text of every event, as `extract_answer` does for the API.
+
+Usage: python -m benchmarks.bench_events [events]
+"""
+
+import sys
+import json
+import time
+import tracemalloc
+
+from api.utils import extract_answer
+from lib import events, sse
+
+
+def make_payloads(events):
+    """Builds message payloads with a growing answer, sources and search steps."""
+    results = [
+        {
+            "name": f"Result {k}",
+            "url": f"https://example.com/{k}",
+            "snippet": "lorem ipsum " * 20,
+        }
+        for k in range(10)
+    ]
+    payloads = []
+    for i in range(events):
+        steps = [
+            {"step_type": "SEARCH_RESULTS", "uuid": str(i), "content": results},
+            {"step_type": "FINAL", "content": {"answer": "x" * (i % 200)}},
+        ]
+        event = {
+            "backend_uuid": "bench",
+            "status": "PENDING",
+            "text": json.dumps(steps),
+            "blocks": [
+                {
+                    "intended_usage": "ask_text",
+                    "markdown_block": {
+                        "progress": "IN_PROGRESS",
+                        "chunks": [f"token {j} " for j in range(i % 200)],
+                    },
+                },
+                {
+                    "intended_usage": "web_results",
+                    "web_result_block": {"web_results": results},
+                },
+            ],
+        }
+        payloads.append(json.dumps(event).encode())
+    return payloads
+
+
+def dict_answer(loads):
+    def parse(data):
+        message = sse.parse_message(data, loads)
+        extract_answer(message, "bench")
+        return message
+
+    return parse
+
+
+def typed_answer(parse_event):
+    def parse(data):
+        event = parse_event(data)
+        event.answer
+        return event
+
+    return parse
+
+
+def fallback_event(data):
+    return events._from_dict(data, sse.json_loads(data))
+
+
+def run(label, parse, payloads, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for data in payloads:
+            parse(data)
+        best = min(best, time.perf_counter() - start)
+
+    # Memory retained by the parsed events, as with keep_chunks=None
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    kept = [parse(data) for data in payloads]
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+
+    print(
+        f"{label:<28} {len(payloads) / best:>12,.0f} events/sec "
+        f"{(after - before) / len(payloads):>10,.0f} bytes/event"
+    )
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    payloads = make_payloads(count)
+    print(f"{count} events, {sum(map(len, payloads)) / 2**20:.1f} MiB of payloads")
+
+    run("dict + json", dict_answer(sse.json_loads), payloads)
+    if sse.backend != "json":
+        run(f"dict + {sse.backend}", dict_answer(sse.loads), payloads)
+    run("SearchEvent + json", typed_answer(fallback_event), payloads)
+    if events.msgspec is not None:
+        run("SearchEvent + msgspec", typed_answer(events.parse_event), payloads)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Peak memory of a long replayed search stream under each chunk retention policy.
+
+Usage: python -m benchmarks.bench_memory [events]
+"""
+
+import sys
+import json
+import asyncio
+import tracemalloc
+
+from lib.perplexity import AsyncClient
+
+
+def make_frames(events):
+    """Builds a synthetic stream whose answer grows by one chunk per event."""
+    frames = []
+    for i in range(events):
+        chunks = [f"token {j} " for j in range(i + 1)]
+        event = {
+            "backend_uuid": "bench",
+            "status": "PENDING",
+            "text": json.dumps([{"step_type": "SEARCH_RESULTS", "content": {}}]),
+            "blocks": [
+                {
+                    "intended_usage": "ask_text",
+                    "markdown_block": {"progress": "IN_PROGRESS", "chunks": chunks},
+                }
+            ],
+        }
+        frames.append(b"event: message\r\ndata: " + json.dumps(event).encode())
+    frames.append(b"event: end_of_stream\r\ndata: {}")
+    return frames
+
+
+class ReplayResponse:
+    """Stands in for a curl_cffi streaming response."""
+
+    ok = True
+
+    def __init__(self, frames):
+        self.frames = frames
+
+    def raise_for_status(self):
+        pass
+
+    async def aiter_content(self, chunk_size=None):
+        for frame in self.frames:
+            yield frame + b"\r\n\r\n"
+
+    async def aclose(self):
+        pass
+
+
+async def peak_memory(frames, keep_chunks):
+    client = AsyncClient({}, keep_chunks=keep_chunks)
+    client._session_ready = True
+
+    async def post(*args, **kwargs):
+        return ReplayResponse(frames)
+
+    client.session.post = post
+
+    tracemalloc.start()
+    async for _ in await client.search("bench", stream=True):
+        pass
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    await client.close()
+    return peak
+
+
+def main():
+    events = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    frames = make_frames(events)
+    print(f"{events} events, {sum(map(len, frames)) / 2**20:.1f} MiB on the wire")
+    for keep_chunks in (1, 10, None):
+        peak = asyncio.run(peak_memory(frames, keep_chunks))
+        label = "all" if keep_chunks is None else f"last {keep_chunks}"
+        print(f"keep {label:>8}: peak {peak / 2**20:8.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Events/sec of the response parsing loop: the original per-frame string
+handling against `lib.sse.SSEParser` with the stdlib and the fastest
+installed JSON backend.
+
+Usage: python -m benchmarks.bench_sse [events] [chunk_size]
+"""
+
+import sys
+import json
+import time
+
+from lib import sse
+
+
+def make_body(events):
+    """Builds a synthetic response body with a growing answer and sources."""
+    frames = []
+    for i in range(events):
+        event = {
+            "backend_uuid": "bench",
+            "status": "PENDING",
+            "text": json.dumps([{"step_type": "SEARCH_RESULTS", "uuid": str(i)}]),
+            "blocks": [
+                {
+                    "intended_usage": "ask_text",
+                    "markdown_block": {
+                        "progress": "IN_PROGRESS",
+                        "chunks": [f"token {j} " for j in range(i % 200)],
+                    },
+                },
+                {
+                    "intended_usage": "web_results",
+                    "web_result_block": {
+                        "web_results": [
+                            {"name": f"Result {k}", "url": f"https://example.com/{k}"}
+                            for k in range(10)
+                        ]
+                    },
+                },
+            ],
+        }
+        frames.append(b"event: message\r\ndata: " + json.dumps(event).encode())
+    frames.append(b"event: end_of_stream\r\ndata: {}")
+    return b"\r\n\r\n".join(frames) + b"\r\n\r\n"
+
+
+def chunked(body, chunk_size):
+    return [body[i : i + chunk_size] for i in range(0, len(body), chunk_size)]
+
+
+def iter_lines(chunks, delimiter):
+    """curl_cffi's Response.iter_lines, which the original loop read from."""
+    pending = None
+    for chunk in chunks:
+        if pending is not None:
+            chunk = pending + chunk
+        lines = chunk.split(delimiter)
+        pending = (
+            lines.pop()
+            if lines and lines[-1] and chunk and lines[-1][-1] == chunk[-1]
+            else None
+        )
+        yield from lines
+    if pending is not None:
+        yield pending
+
+
+def original(chunks):
+    """The parsing loop Client.search used before lib.sse existed."""
+    count = 0
+    for chunk in iter_lines(chunks, b"\r\n\r\n"):
+        content = chunk.decode("utf-8")
+        if content.startswith("event: message\r\n"):
+            content_json = json.loads(content[len("event: message\r\ndata: ") :])
+            if "text" in content_json:
+                content_json["text"] = json.loads(content_json["text"])
+            count += 1
+        elif content.startswith("event: end_of_stream\r\n"):
+            break
+    return count
+
+
+def incremental(chunks, loads):
+    parser = sse.SSEParser()
+    count = 0
+    for data in chunks:
+        for event in parser.feed(data):
+            if event.event == "end_of_stream":
+                return count
+            if event.event == "message":
+                sse.parse_message(event.data, loads)
+                count += 1
+    return count
+
+
+def run(cases, repeat=10):
+    """
+    Times each `(label, fn, *args)` case, taking turns so that noise from
+    other processes hits them alike, and prints the best run of each.
+    """
+    best = {case[0]: float("inf") for case in cases}
+    for _ in range(repeat):
+        for label, fn, *args in cases:
+            start = time.perf_counter()
+            count = fn(*args)
+            best[label] = min(best[label], time.perf_counter() - start)
+    for label, seconds in best.items():
+        print(f"{label:<28} {count / seconds:>12,.0f} events/sec")
+
+
+def main():
+    events = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    chunk_size = int(sys.argv[2]) if len(sys.argv) > 2 else 16384
+    body = make_body(events)
+    chunks = chunked(body, chunk_size)
+    print(f"{events} events, {len(body) / 2**20:.1f} MiB, {chunk_size} byte chunks")
+
+    cases = [
+        ("original", original, chunks),
+        ("SSEParser + json", incremental, chunks, sse.json_loads),
+    ]
+    if sse.backend != "json":
+        cases.append((f"SSEParser + {sse.backend}", incremental, chunks, sse.loads))
+    run(cases)
+
+
+if __name__ == "__main__":
+    main()
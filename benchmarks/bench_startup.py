@@ -0,0 +1,116 @@
+"""
+API server startup cost: time to import `api.main`, time until uvicorn accepts
+connections, and latency of the first query with and without connection
+warm-up.
+
+Queries go to the local fake upstream unless `--base-url` points elsewhere,
+e.g. https://www.perplexity.ai to include real TLS handshakes.
+
+Usage: python -m benchmarks.bench_startup [--runs 5] [--base-url URL]
+"""
+
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+from curl_cffi import requests
+
+from .bench_e2e import ROOT, free_port, start, stop
+
+
+def import_time():
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-c", "import api.main"],
+        cwd=ROOT,
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+    return time.perf_counter() - start
+
+
+def server_run(base_url, warm_connections, settle):
+    """Starts the API server and returns (seconds until ready, first query seconds)."""
+    port = free_port()
+    started = time.perf_counter()
+    server = start(
+        [
+            "-m",
+            "uvicorn",
+            "api.main:app",
+            "--port",
+            str(port),
+            "--log-level",
+            "error",
+        ],
+        port,
+        env={
+            "PERPLEXITY_BASE_URL": base_url,
+            "PERPLEXITY_LOG_MODE": "off",
+            "PERPLEXITY_WARM_CONNECTIONS": str(warm_connections),
+            "PERPLEXITY_KEEPALIVE_INTERVAL": "0",
+        },
+    )
+    ready = time.perf_counter() - started
+    try:
+        # Give the background warm-up a moment, as a real server would have
+        time.sleep(settle)
+        start_query = time.perf_counter()
+        requests.get(
+            f"http://127.0.0.1:{port}/api/query_sync",
+            params={"q": "first", "cache": "false"},
+            timeout=120,
+        )
+        return ready, time.perf_counter() - start_query
+    finally:
+        stop(server)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--base-url", help="upstream to query instead of the fake")
+    parser.add_argument("--warm-connections", type=int, default=2)
+    parser.add_argument(
+        "--settle", type=float, default=1.0, help="seconds between ready and query"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    upstream = None
+    base_url = args.base_url
+    if base_url is None:
+        port = free_port()
+        upstream = start(
+            ["-m", "benchmarks.fake_upstream", "--port", str(port), "--delay", "0"],
+            port,
+        )
+        base_url = f"http://127.0.0.1:{port}"
+
+    try:
+        imports = [import_time() for _ in range(args.runs)]
+        print(f"import api.main         {statistics.median(imports) * 1000:>8.1f} ms")
+        for label, connections in (
+            ("cold", 0),
+            (f"warmed ({args.warm_connections})", args.warm_connections),
+        ):
+            runs = [
+                server_run(base_url, connections, args.settle) for _ in range(args.runs)
+            ]
+            ready = statistics.median(run[0] for run in runs)
+            first = statistics.median(run[1] for run in runs)
+            print(
+                f"{label:<12} ready {ready * 1000:>8.1f} ms, "
+                f"first query {first * 1000:>8.1f} ms"
+            )
+    finally:
+        if upstream is not None:
+            stop(upstream)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Throughput of the API server with 1, 2, 4... uvicorn workers sharing their
+state through `PERPLEXITY_STATE_PATH`, and a check that the workers together
+never run more pro queries than the accounts' quota allows.
+
+Each scenario starts a server against the local fake upstream with
+`--accounts` signed-in accounts of `--quota` pro queries each. It sends
+`--requests` auto queries to measure throughput, then more pro queries than
+the quota covers, all at once. Exactly `accounts * quota` of those must
+succeed, whatever the number of workers.
+
+Throughput can only scale with the workers up to the number of CPUs, which
+also run the fake upstream and the load generator. Run it on a machine with
+more CPUs than the largest worker count to see the scaling.
+
+Usage: python -m benchmarks.bench_workers [--workers 1,2,4] [--requests 400]
+           [--concurrency 32] [--accounts 4] [--quota 25] [--delay 0.002]
+"""
+
+import os
+import json
+import sqlite3
+import asyncio
+import argparse
+import tempfile
+
+from curl_cffi import requests
+
+from .bench_e2e import free_port, percentile, start, stop
+
+
+async def load(url, params, n, concurrency):
+    """Sends `n` queries and returns their status codes, latencies and duration."""
+    semaphore = asyncio.Semaphore(concurrency)
+    loop = asyncio.get_running_loop()
+    async with requests.AsyncSession(timeout=120) as session:
+
+        async def one(i):
+            async with semaphore:
+                start = loop.time()
+                resp = await session.get(
+                    url, params={**params, "q": f"question {i}", "cache": "false"}
+                )
+                return resp.status_code, loop.time() - start
+
+        start = loop.time()
+        results = await asyncio.gather(*(one(i) for i in range(n)))
+        return results, loop.time() - start
+
+
+def remaining_quota(path):
+    with sqlite3.connect(path) as db:
+        return db.execute("SELECT SUM(copilot) FROM accounts").fetchone()[0]
+
+
+def bench_workers(base_url, workers, args):
+    port = free_port()
+    with tempfile.TemporaryDirectory() as tmp:
+        cookies_path = os.path.join(tmp, "cookies.json")
+        with open(cookies_path, "w") as f:
+            json.dump([{"session": f"bench-{i}"} for i in range(args.accounts)], f)
+        state_path = os.path.join(tmp, "state.db")
+        server = start(
+            [
+                "-m",
+                "uvicorn",
+                "api.main:app",
+                "--port",
+                str(port),
+                "--workers",
+                str(workers),
+                "--log-level",
+                "error",
+            ],
+            port,
+            env={
+                "PERPLEXITY_BASE_URL": base_url,
+                "PERPLEXITY_COOKIES_PATH": cookies_path,
+                "PERPLEXITY_STATE_PATH": state_path,
+                "PERPLEXITY_PRO_QUOTA": str(args.quota),
+                "PERPLEXITY_LOG_MODE": "off",
+                "PERPLEXITY_MIRROR_PATH": os.path.join(tmp, "threads.db"),
+                "PERPLEXITY_CONCURRENCY_LIMIT": str(args.concurrency),
+                "PERPLEXITY_WARM_CONNECTIONS": "0",
+            },
+        )
+        url = f"http://127.0.0.1:{port}/api/query_sync"
+        try:
+            # Let every worker finish starting before timing anything
+            asyncio.run(load(url, {"mode": "auto"}, workers * 4, workers * 4))
+            results, elapsed = asyncio.run(
+                load(url, {"mode": "auto"}, args.requests, args.concurrency)
+            )
+            failed = sum(status != 200 for status, _ in results)
+            latencies = [latency for _, latency in results]
+
+            quota = args.accounts * args.quota
+            pro, _ = asyncio.run(
+                load(url, {"mode": "pro"}, quota + quota // 2, args.concurrency)
+            )
+            answered = sum(status == 200 for status, _ in pro)
+            refused = sum(status == 503 for status, _ in pro)
+            left = remaining_quota(state_path)
+        finally:
+            stop(server)
+
+    print(
+        f"{workers:>7} {args.requests / elapsed:>9.1f} "
+        f"{percentile(latencies, 0.5) * 1000:>9.1f} "
+        f"{percentile(latencies, 0.99) * 1000:>9.1f} {failed:>7} "
+        f"{answered:>5}/{quota:<5} {refused:>8} {left:>5g} "
+        + ("ok" if answered == quota and not left else "QUOTA MISMATCH")
+    )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--accounts", type=int, default=4)
+    parser.add_argument("--quota", type=int, default=25)
+    parser.add_argument("--delay", type=float, default=0.002)
+    parser.add_argument("--events", type=int, default=50)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workers = list(map(int, args.workers.split(",")))
+    port = free_port()
+    upstream = start(
+        [
+            "-m",
+            "benchmarks.fake_upstream",
+            "--port",
+            str(port),
+            "--delay",
+            str(args.delay),
+            "--events",
+            str(args.events),
+        ],
+        port,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+
+    print(
+        f"{args.requests} requests, concurrency {args.concurrency}, "
+        f"{args.accounts} accounts x {args.quota} pro queries, {os.cpu_count()} CPUs"
+    )
+    if max(workers) >= (os.cpu_count() or 1):
+        print(
+            f"Note: {max(workers)} workers on {os.cpu_count()} CPUs, so the "
+            "throughput numbers do not show how it scales"
+        )
+    print(
+        f"{'workers':>7} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7} "
+        f"{'pro ok':>11} {'refused':>8} {'left':>5}"
+    )
+    try:
+        for count in workers:
+            bench_workers(base_url, count, args)
+    finally:
+        stop(upstream)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+Local stand-in for the Perplexity endpoints the wrapper talks to: the auth
+session, `/rest/sse/perplexity_ask`, file uploads and the thread endpoints.
+
+Search streams are replayed from response logs when `--logs` is given, either
+`responses*.jsonl[.gz]` files from the API's response logger or legacy
+`API-*` snapshot files, and are otherwise synthesized. Point a client at it
+with `base_url`, or the API server with `PERPLEXITY_BASE_URL`.
+
+Usage: python -m benchmarks.fake_upstream [--port 8765] [--delay 0.01]
+           [--events 50] [--token-bytes 32] [--logs DIR]
+"""
+
+import os
+import gzip
+import json
+import asyncio
+import argparse
+import itertools
+from uuid import uuid4
+from collections import defaultdict, deque
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+END_OF_STREAM = b"event: end_of_stream\r\ndata: {}\r\n\r\n"
+
+
+def encode_event(event):
+    """Encodes a parsed response event as it arrives on the wire."""
+    if "text" in event and not isinstance(event["text"], str):
+        event = dict(event, text=json.dumps(event["text"]))
+    return b"event: message\r\ndata: " + json.dumps(event).encode() + b"\r\n\r\n"
+
+
+def synthetic_stream(events=50, token_bytes=32, web_results=10):
+    """Builds a stream whose answer grows by `token_bytes` per event."""
+    token = "x" * max(token_bytes - 1, 0) + " "
+    backend_uuid = str(uuid4())
+    results = [
+        {"name": f"Result {i}", "url": f"https://example.com/{i}", "snippet": token * 4}
+        for i in range(web_results)
+    ]
+    frames = []
+    for i in range(events):
+        done = i == events - 1
+        chunks = [token] * (i + 1)
+        markdown_block = {"progress": "DONE" if done else "IN_PROGRESS"}
+        if done:
+            markdown_block["answer"] = "".join(chunks)
+        markdown_block["chunks"] = chunks
+        frames.append(
+            encode_event(
+                {
+                    "backend_uuid": backend_uuid,
+                    "status": "COMPLETED" if done else "PENDING",
+                    "text": [{"step_type": "SEARCH_RESULTS", "uuid": str(i)}],
+                    "blocks": [
+                        {
+                            "intended_usage": "ask_text",
+                            "markdown_block": markdown_block,
+                        },
+                        {
+                            "intended_usage": "web_results",
+                            "web_result_block": {"web_results": results},
+                        },
+                    ],
+                }
+            )
+        )
+    return frames
+
+
+def _read_jsonl(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def load_recorded(directory):
+    """
+    Loads recorded streams from a logs directory as lists of encoded frames.
+    """
+    streams = defaultdict(list)
+    legacy = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if name.startswith("responses") and ".jsonl" in name:
+            for record in _read_jsonl(path):
+                streams[record["request_id"]].append((record["seq"], record["event"]))
+        elif name.startswith("API-"):
+            # save_resp wrote one snapshot per file, named API-<time>-<n>
+            parts = name.split("-")
+            order = (parts[1], int(parts[-1]) if parts[-1].isdigit() else 0)
+            with open(path, encoding="utf-8") as f:
+                legacy.append((order, json.load(f)))
+
+    # Legacy snapshots carry no request id, so group them by backend_uuid
+    for key, event in sorted(legacy, key=lambda item: item[0]):
+        streams[event.get("backend_uuid")].append((key, event))
+
+    return [
+        [encode_event(event) for _, event in sorted(events, key=lambda item: item[0])]
+        for events in streams.values()
+        if events
+    ]
+
+
+def create_app(streams, delay=0.0, threads=100, entries=150):
+    """
+    Builds the fake upstream app.
+
+    Parameters:
+    - streams: Lists of encoded frames, replayed round-robin per search.
+    - delay: Seconds to wait between events.
+    - threads: Number of threads the thread list reports.
+    - entries: Number of entries in every thread.
+
+    The latest search requests are kept in `app.state.queries`, so tests can
+    check what the client sent.
+    """
+    app = FastAPI(title="Fake Perplexity upstream")
+    app.state.queries = deque(maxlen=100)
+    next_stream = itertools.cycle(streams).__next__
+
+    @app.get("/api/auth/session")
+    async def auth_session():
+        return {}
+
+    @app.post("/rest/sse/perplexity_ask")
+    async def perplexity_ask(request: Request):
+        app.state.queries.append(json.loads(await request.body()))
+        frames = next_stream()
+
+        async def replay():
+            for frame in frames:
+                if delay:
+                    await asyncio.sleep(delay)
+                yield frame
+            yield END_OF_STREAM
+
+        return StreamingResponse(replay(), media_type="text/event-stream")
+
+    @app.post("/rest/uploads/create_upload_url")
+    async def create_upload_url(request: Request):
+        body = await request.json()
+        base = str(request.base_url).rstrip("/")
+        key = f"{uuid4().hex}/{body.get('filename', 'file')}"
+        return {
+            "s3_bucket_url": f"{base}/fake-s3",
+            "s3_object_url": f"{base}/fake-s3/{key}",
+            "fields": {"key": key},
+        }
+
+    @app.post("/fake-s3")
+    async def upload(request: Request):
+        async for _ in request.stream():
+            pass
+        return Response(status_code=204)
+
+    @app.post("/rest/thread/list_ask_threads")
+    async def list_threads(request: Request):
+        body = await request.json()
+        offset, limit = body.get("offset", 0), body.get("limit", 20)
+        return [
+            {
+                "slug": f"thread-{i}",
+                "title": f"Thread {i}",
+                "last_query_datetime": f"2024-01-01T00:00:{threads - i:06d}",
+            }
+            for i in range(offset, min(offset + limit, threads))
+        ]
+
+    @app.get("/rest/thread/{slug}")
+    async def thread_details(slug: str, limit: int = 100, offset: int = 0):
+        page = range(offset, min(offset + limit, entries))
+        return JSONResponse(
+            {
+                "status": "success",
+                "entries": [
+                    {"query_str": f"{slug} question {i}", "blocks": []} for i in page
+                ],
+                "has_next_page": offset + limit < entries,
+            }
+        )
+
+    return app
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument(
+        "--delay", type=float, default=0.01, help="seconds between events"
+    )
+    parser.add_argument(
+        "--events", type=int, default=50, help="events per synthetic stream"
+    )
+    parser.add_argument(
+        "--token-bytes",
+        type=int,
+        default=32,
+        help="answer bytes added per synthetic event",
+    )
+    parser.add_argument("--logs", help="directory of recorded response logs to replay")
+    parser.add_argument("--threads", type=int, default=100)
+    parser.add_argument("--entries", type=int, default=150)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    import uvicorn
+
+    args = parse_args(argv)
+    streams = load_recorded(args.logs) if args.logs else []
+    if not streams:
+        streams = [synthetic_stream(args.events, args.token_bytes)]
+    app = create_app(streams, args.delay, args.threads, args.entries)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="error")
+
+
+if __name__ == "__main__":
+    main()
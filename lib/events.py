@@ -0,0 +1,156 @@
+from typing import Optional
+
+from .sse import loads, parse_message
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+class SearchEvent:
+    """
+    A search response event with only its hot fields decoded.
+
+    The backend UUID, status, answer and sources are pulled out when the
+    event arrives. Everything else, including the nested JSON in `text`,
+    stays in `raw` and is decoded on first access to `data`. Without msgspec,
+    see `parse_event` for what is decoded up front.
+    """
+
+    __slots__ = (
+        "raw",
+        "backend_uuid",
+        "status",
+        "progress",
+        "chunks",
+        "final_answer",
+        "sources",
+        "_data",
+    )
+
+    def __init__(
+        self,
+        raw,
+        backend_uuid=None,
+        status=None,
+        progress=None,
+        chunks=(),
+        final_answer=None,
+        sources=(),
+    ):
+        self.raw = raw
+        self.backend_uuid = backend_uuid
+        self.status = status
+        self.progress = progress
+        self.chunks = chunks
+        self.final_answer = final_answer
+        self.sources = sources
+        self._data = None
+
+    @property
+    def answer(self):
+        """The answer text so far, or the consolidated answer once done."""
+        if self.progress == "DONE" and self.final_answer is not None:
+            return self.final_answer
+        return "".join(self.chunks)
+
+    @property
+    def citations(self):
+        """URLs of the sources, in the order the answer's [n] markers refer to."""
+        return [source.get("url") for source in self.sources]
+
+    @property
+    def data(self):
+        """The whole event as `parse_message` would return it, decoded once."""
+        if self._data is None:
+            self._data = parse_message(self.raw)
+        return self._data
+
+    def __repr__(self):
+        return (
+            f"SearchEvent(backend_uuid={self.backend_uuid!r}, "
+            f"status={self.status!r}, progress={self.progress!r}, "
+            f"answer={len(self.answer)} chars, sources={len(self.sources)})"
+        )
+
+
+def _from_dict(raw, message):
+    event = SearchEvent(raw, message.get("backend_uuid"), message.get("status"))
+    blocks = message.get("blocks")
+    for block in blocks if isinstance(blocks, list) else ():
+        if not isinstance(block, dict):
+            continue
+        usage = block.get("intended_usage")
+        if usage == "ask_text" and event.progress is None:
+            markdown_block = block.get("markdown_block")
+            if isinstance(markdown_block, dict):
+                event.progress = markdown_block.get("progress")
+                event.chunks = markdown_block.get("chunks") or ()
+                event.final_answer = markdown_block.get("answer")
+        elif usage == "web_results" and not event.sources:
+            web_result_block = block.get("web_result_block")
+            if isinstance(web_result_block, dict):
+                event.sources = web_result_block.get("web_results") or ()
+    return event
+
+
+if msgspec is not None:
+    # Only the hot fields are declared, so msgspec skips over the rest of the
+    # payload without building objects for it
+
+    class _MarkdownBlock(msgspec.Struct):
+        progress: Optional[str] = None
+        chunks: list = []
+        answer: Optional[str] = None
+
+    class _WebResultBlock(msgspec.Struct):
+        web_results: list = []
+
+    class _Block(msgspec.Struct):
+        intended_usage: Optional[str] = None
+        markdown_block: Optional[_MarkdownBlock] = None
+        web_result_block: Optional[_WebResultBlock] = None
+
+    class _Message(msgspec.Struct):
+        backend_uuid: Optional[str] = None
+        status: Optional[str] = None
+        blocks: list[_Block] = []
+
+    _decode_message = msgspec.json.Decoder(_Message).decode
+
+    def _from_struct(raw, message):
+        event = SearchEvent(raw, message.backend_uuid, message.status)
+        for block in message.blocks:
+            if block.intended_usage == "ask_text" and event.progress is None:
+                if block.markdown_block is not None:
+                    event.progress = block.markdown_block.progress
+                    event.chunks = block.markdown_block.chunks
+                    event.final_answer = block.markdown_block.answer
+            elif block.intended_usage == "web_results" and not event.sources:
+                if block.web_result_block is not None:
+                    event.sources = block.web_result_block.web_results
+        return event
+
+
+def parse_event(data):
+    """
+    Decodes the JSON payload of a Perplexity `message` event into a
+    `SearchEvent`. Uses msgspec when installed, and falls back to the full
+    decoder for payloads whose hot fields don't have the expected shape.
+
+    msgspec skips the fields that aren't hot without building them. The
+    standard library decoder can't skip anything, so without msgspec the
+    whole outer payload is decoded eagerly, and only the nested JSON in
+    `text` is left for `data`. The rest of the decoded payload is dropped
+    once the hot fields are read, so either way the event keeps only those.
+
+    Parameters:
+    - data: The event's data as bytes.
+    """
+    if msgspec is not None:
+        try:
+            return _from_struct(data, _decode_message(data))
+        except msgspec.ValidationError:
+            pass
+    return _from_dict(data, loads(data))
@@ -0,0 +1,106 @@
+import time
+from collections import deque
+
+
+class SearchHooks:
+    """
+    Callbacks that observe a search as it runs.
+
+    Pass an instance to a client, or to a single `search` call, and override
+    the methods you need; the base class ignores everything. Durations are in
+    seconds, measured with `time.perf_counter`. `search` is the `SearchTrace`
+    of the query the callback is about.
+    """
+
+    def on_upload(self, search, seconds):
+        """
+        Called once the query's files are uploaded.
+        """
+
+    def on_first_byte(self, search, seconds):
+        """
+        Called when the first bytes of the response arrive, `seconds` after
+        the query request was sent.
+        """
+
+    def on_event(self, search, event, size):
+        """
+        Called for each parsed response event, with its size in bytes.
+        """
+
+    def on_stream_end(self, search, seconds):
+        """
+        Called when the response stream ends, `seconds` after the search started.
+        """
+
+    def on_error(self, search, error):
+        """
+        Called when uploading, sending the query or reading the response fails.
+        """
+
+
+class MultiHooks(SearchHooks):
+    """
+    Forwards every callback to several `SearchHooks` in turn.
+    """
+
+    def __init__(self, *hooks):
+        self.hooks = hooks
+
+    def on_upload(self, search, seconds):
+        for hooks in self.hooks:
+            hooks.on_upload(search, seconds)
+
+    def on_first_byte(self, search, seconds):
+        for hooks in self.hooks:
+            hooks.on_first_byte(search, seconds)
+
+    def on_event(self, search, event, size):
+        for hooks in self.hooks:
+            hooks.on_event(search, event, size)
+
+    def on_stream_end(self, search, seconds):
+        for hooks in self.hooks:
+            hooks.on_stream_end(search, seconds)
+
+    def on_error(self, search, error):
+        for hooks in self.hooks:
+            hooks.on_error(search, error)
+
+
+class SearchTrace:
+    """
+    Timing and volume of one search, passed to every `SearchHooks` callback.
+    `parse_seconds` adds up the time spent decoding response events,
+    `chunks` holds the latest `keep_chunks` response chunks (all of them
+    with None), and `attachments` lists the attachment URLs the query sent:
+    the files it uploaded, then those of the thread it follows up on.
+    """
+
+    __slots__ = (
+        "mode",
+        "model",
+        "started",
+        "events",
+        "bytes",
+        "parse_seconds",
+        "chunks",
+        "attachments",
+    )
+
+    def __init__(self, mode, model, keep_chunks=1):
+        self.mode = mode
+        self.model = model
+        self.started = time.perf_counter()
+        self.events = 0
+        self.bytes = 0
+        self.parse_seconds = 0.0
+        self.chunks = deque(maxlen=keep_chunks)
+        self.attachments = []
+
+    @property
+    def elapsed(self):
+        """
+        Seconds since the search started.
+        """
+        return time.perf_counter() - self.started
@@ -0,0 +1,110 @@
+"""
+Minimal JSON Patch (RFC 6902) support for streaming snapshots.
+
+`make_patch` diffs two consecutive snapshots of a search response and
+`apply_patch` rebuilds the next snapshot from the previous one. Only the
+`add`, `remove` and `replace` operations are produced, and lists are diffed
+positionally, which fits responses that mostly grow by appending.
+"""
+
+import copy
+
+
+def _escape(key):
+    return str(key).replace("~", "~0").replace("/", "~1")
+
+
+def _unescape(token):
+    return token.replace("~1", "/").replace("~0", "~")
+
+
+def _diff(old, new, path, ops):
+    if old is new:
+        return
+
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key in old:
+            if key not in new:
+                ops.append({"op": "remove", "path": f"{path}/{_escape(key)}"})
+        for key, value in new.items():
+            if key in old:
+                _diff(old[key], value, f"{path}/{_escape(key)}", ops)
+            else:
+                ops.append(
+                    {"op": "add", "path": f"{path}/{_escape(key)}", "value": value}
+                )
+        return
+
+    if isinstance(old, list) and isinstance(new, list):
+        common = min(len(old), len(new))
+        for i in range(common):
+            _diff(old[i], new[i], f"{path}/{i}", ops)
+        for i in range(common, len(new)):
+            ops.append({"op": "add", "path": f"{path}/{i}", "value": new[i]})
+        # Remove from the end so earlier indexes stay valid
+        for i in range(len(old) - 1, common - 1, -1):
+            ops.append({"op": "remove", "path": f"{path}/{i}"})
+        return
+
+    if type(old) is not type(new) or old != new:
+        ops.append({"op": "replace", "path": path, "value": new})
+
+
+def make_patch(old, new):
+    """
+    Returns the list of JSON Patch operations that turns `old` into `new`.
+
+    Parameters:
+    - old: Previous JSON-compatible value.
+    - new: Current JSON-compatible value.
+    """
+    ops = []
+    _diff(old, new, "", ops)
+    return ops
+
+
+def apply_patch(doc, patch, in_place=False):
+    """
+    Applies JSON Patch operations produced by `make_patch` and returns the result.
+
+    Parameters:
+    - doc: JSON-compatible value to patch.
+    - patch: List of `add`, `remove` and `replace` operations.
+    - in_place: Whether to modify `doc` instead of a deep copy of it.
+    """
+    if not in_place:
+        doc = copy.deepcopy(doc)
+
+    for op in patch:
+        if op["path"] == "":
+            if op["op"] == "remove":
+                doc = None
+            else:
+                doc = op["value"]
+            continue
+
+        tokens = [_unescape(t) for t in op["path"].split("/")[1:]]
+        parent = doc
+        for token in tokens[:-1]:
+            parent = parent[int(token)] if isinstance(parent, list) else parent[token]
+        last = tokens[-1]
+
+        if isinstance(parent, list):
+            index = len(parent) if last == "-" else int(last)
+            if op["op"] == "add":
+                parent.insert(index, op["value"])
+            elif op["op"] == "remove":
+                del parent[index]
+            elif op["op"] == "replace":
+                parent[index] = op["value"]
+            else:
+                raise ValueError(f"Unsupported patch operation: {op['op']}")
+        else:
+            if op["op"] in ("add", "replace"):
+                parent[last] = op["value"]
+            elif op["op"] == "remove":
+                del parent[last]
+            else:
+                raise ValueError(f"Unsupported patch operation: {op['op']}")
+
+    return doc
@@ -0,0 +1,259 @@
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+
+
+def _fingerprint(item):
+    return hashlib.sha256(json.dumps(item, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+async def _fetch_detail(client, slug, page_size=100):
+    """
+    Fetches a thread's details with all of its entries, paging past the
+    first `page_size` when the thread is longer.
+    """
+    detail = await client.get_thread_details_by_slug(
+        slug, {"limit": page_size, "offset": 0}
+    )
+    entries = detail.get("entries") or []
+    if entries and detail.get("has_next_page", len(entries) >= page_size):
+        async for entry in client.iter_thread_entries(
+            slug, page_size, offset=len(entries)
+        ):
+            entries.append(entry)
+        detail["entries"] = entries
+        if "has_next_page" in detail:
+            detail["has_next_page"] = False
+    return detail
+
+
+def _entry_text(entry):
+    """
+    Collects the searchable text of a thread entry: its query and answer.
+    """
+    parts = [entry.get("query_str") or ""]
+    for block in entry.get("blocks") or []:
+        markdown_block = block.get("markdown_block")
+        if block.get("intended_usage") == "ask_text" and isinstance(
+            markdown_block, dict
+        ):
+            parts.append(
+                markdown_block.get("answer")
+                or "".join(markdown_block.get("chunks") or [])
+            )
+    return "\n".join(parts)
+
+
+class ThreadMirror:
+    """
+    Local SQLite copy of an account's threads with a full-text index.
+
+    `sync` pages through the thread list and fetches the details of new or
+    changed threads concurrently, and records when it finished, so an account
+    without threads still counts as synced. Reads are served from the local
+    store and never touch the network.
+    """
+
+    def __init__(self, path="threads.db"):
+        """
+        Parameters:
+        - path: SQLite database file.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._sync_lock = asyncio.Lock()
+        self._conn = None
+
+    @property
+    def _db(self):
+        # Opened on first use, so creating a mirror never touches the disk
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS threads ("
+                "slug TEXT PRIMARY KEY, sort_key TEXT, item TEXT NOT NULL, "
+                "detail TEXT, fingerprint TEXT NOT NULL, synced_at REAL NOT NULL)"
+            )
+            db.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS threads_fts "
+                "USING fts5(slug UNINDEXED, title, body)"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS syncs ("
+                "id INTEGER PRIMARY KEY CHECK (id = 1), synced_at REAL NOT NULL)"
+            )
+            db.commit()
+            self._conn = db
+        return self._conn
+
+    def synced_at(self):
+        """
+        Returns when the last sync finished, or None if the mirror has never
+        been synced. Opens the database, so async code should run it in a
+        thread.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT synced_at FROM syncs").fetchone()
+        return row[0] if row else None
+
+    async def sync(self, client, full=False, page_size=50, concurrency=8):
+        """
+        Brings the mirror up to date and returns the slugs that were fetched.
+
+        Parameters:
+        - client: An `AsyncClient` for the account to mirror.
+        - full: Page through every thread instead of stopping at the first
+          page without changes, and drop threads that no longer exist.
+        - page_size: Threads per list request.
+        - concurrency: Most thread detail requests in flight at once.
+        """
+        async with self._sync_lock:
+            semaphore = asyncio.Semaphore(concurrency)
+            fetched = []
+            seen = set()
+            offset = 0
+
+            async def fetch(item):
+                async with semaphore:
+                    detail = await _fetch_detail(client, item["slug"])
+                await asyncio.to_thread(self._store, item, detail)
+                fetched.append(item["slug"])
+
+            while True:
+                page = await client.get_threads(limit=page_size, offset=offset)
+                items = page if isinstance(page, list) else page.get("threads", [])
+                items = [item for item in items if item.get("slug")]
+                if not items:
+                    break
+
+                seen.update(item["slug"] for item in items)
+                fingerprints = await asyncio.to_thread(
+                    self._fingerprints, [item["slug"] for item in items]
+                )
+                changed = [
+                    item
+                    for item in items
+                    if fingerprints.get(item["slug"]) != _fingerprint(item)
+                ]
+                await asyncio.gather(*(fetch(item) for item in changed))
+
+                # Threads are listed newest first, so an unchanged page means
+                # everything after it is unchanged too
+                if (not changed and not full) or len(items) < page_size:
+                    break
+                offset += page_size
+
+            if full:
+                await asyncio.to_thread(self._prune, seen)
+            await asyncio.to_thread(self._mark_synced)
+            return fetched
+
+    async def refresh_thread(self, client, slug):
+        """
+        Fetches one thread's details into the mirror and returns them.
+        """
+        detail = await _fetch_detail(client, slug)
+        item = await asyncio.to_thread(self._item, slug)
+        await asyncio.to_thread(self._store, item or {"slug": slug}, detail)
+        return detail
+
+    def list_threads(self, limit=20, offset=0, search_term=""):
+        """
+        Returns mirrored thread list items, newest first, optionally filtered
+        by a full-text search over titles, queries and answers.
+        """
+        with self._lock:
+            if search_term:
+                rows = self._db.execute(
+                    "SELECT t.item FROM threads_fts f JOIN threads t ON t.slug = f.slug "
+                    "WHERE threads_fts MATCH ? ORDER BY f.rank LIMIT ? OFFSET ?",
+                    (self._match_query(search_term), limit, offset),
+                ).fetchall()
+            else:
+                rows = self._db.execute(
+                    "SELECT item FROM threads ORDER BY sort_key DESC LIMIT ? OFFSET ?",
+                    (limit, offset),
+                ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def get_thread(self, slug):
+        """
+        Returns the mirrored details of a thread, or None.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT detail FROM threads WHERE slug = ?", (slug,)
+            ).fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+
+    @staticmethod
+    def _match_query(search_term):
+        # Quote each word so user input can't be parsed as FTS syntax
+        words = search_term.replace('"', " ").split()
+        return " ".join(f'"{word}"' for word in words)
+
+    def _fingerprints(self, slugs):
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT slug, fingerprint FROM threads WHERE slug IN ({','.join('?' * len(slugs))})",
+                slugs,
+            ).fetchall()
+        return dict(rows)
+
+    def _item(self, slug):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT item FROM threads WHERE slug = ?", (slug,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _store(self, item, detail):
+        entries = (detail.get("entries") or []) if isinstance(detail, dict) else []
+        title = item.get("title") or (entries[0].get("query_str") if entries else "")
+        body = "\n".join(_entry_text(entry) for entry in entries)
+        sort_key = item.get("last_query_datetime") or (
+            entries[-1].get("updated_datetime") if entries else ""
+        )
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO threads VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    item["slug"],
+                    sort_key or "",
+                    json.dumps(item),
+                    json.dumps(detail),
+                    _fingerprint(item),
+                    time.time(),
+                ),
+            )
+            self._db.execute("DELETE FROM threads_fts WHERE slug = ?", (item["slug"],))
+            self._db.execute(
+                "INSERT INTO threads_fts VALUES (?, ?, ?)",
+                (item["slug"], title or "", body),
+            )
+            self._db.commit()
+
+    def _mark_synced(self):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO syncs VALUES (1, ?)", (time.time(),)
+            )
+            self._db.commit()
+
+    def _prune(self, slugs):
+        with self._lock:
+            stale = [
+                row[0]
+                for row in self._db.execute("SELECT slug FROM threads").fetchall()
+                if row[0] not in slugs
+            ]
+            for slug in stale:
+                self._db.execute("DELETE FROM threads WHERE slug = ?", (slug,))
+                self._db.execute("DELETE FROM threads_fts WHERE slug = ?", (slug,))
+            self._db.commit()
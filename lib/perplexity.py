@@ -1,45 +1,125 @@
 import re
-import sys
-import json
+import time
+import asyncio
+import threading
 import random
-import mimetypes
 from uuid import uuid4
-from curl_cffi import requests, CurlMime
+from itertools import chain
+from urllib.parse import urlencode
+from concurrent.futures import ThreadPoolExecutor
+from curl_cffi import requests
 
+from .events import parse_event
+from .hooks import SearchHooks, SearchTrace
+from .resilience import Resilience, UpstreamTimeout
+from .sse import SSEParser, parse_message
+from .uploads import upload_files, upload_files_async
 
-class Client:
+BASE_URL = "https://www.perplexity.ai"
+THREAD_LIST_PATH = "/rest/thread/list_ask_threads?version=2.18&source=default"
+
+# Thread detail parameters that never change between requests. `limit` and
+# `offset` are appended per request.
+THREAD_DETAILS_PARAMS = {
+    "with_parent_info": "true",
+    "with_schematized_response": "true",
+    "version": "2.18",
+    "source": "default",
+    "from_first": "true",
+    "supported_block_use_cases": [
+        "answer_modes",
+        "media_items",
+        "knowledge_cards",
+        "inline_entity_cards",
+        "place_widgets",
+        "finance_widgets",
+        "sports_widgets",
+        "shopping_widgets",
+        "jobs_widgets",
+        "search_result_widgets",
+        "clarification_responses",
+        "inline_images",
+        "inline_assets",
+        "inline_finance_widgets",
+        "placeholder_cards",
+        "diff_blocks",
+        "inline_knowledge_cards",
+    ],
+}
+
+
+def _encode_thread_params(params):
+    # List values become one query parameter per item
+    return urlencode(
+        [
+            (key, item)
+            for key, value in params.items()
+            for item in (value if isinstance(value, list) else [value])
+        ]
+    )
+
+
+_THREAD_DETAILS_QUERY = _encode_thread_params(THREAD_DETAILS_PARAMS)
+
+
+class _BaseClient:
     """
-    A client for interacting with the Perplexity AI API.
+    Shared request building and quota bookkeeping for the sync and async clients.
     """
 
-    def __init__(self, cookies={}):
-        # Initialize an HTTP session with default headers and optional cookies
-        self.session = requests.Session(
-            headers={
-                "accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
-                "accept-language": "en-US,en;q=0.9",
-                "cache-control": "max-age=0",
-                "dnt": "1",
-                "priority": "u=0, i",
-                "sec-ch-ua": '"Not;A=Brand";v="24", "Chromium";v="128"',
-                "sec-ch-ua-arch": '"x86"',
-                "sec-ch-ua-bitness": '"64"',
-                "sec-ch-ua-full-version": '"128.0.6613.120"',
-                "sec-ch-ua-full-version-list": '"Not;A=Brand";v="24.0.0.0", "Chromium";v="128.0.6613.120"',
-                "sec-ch-ua-mobile": "?0",
-                "sec-ch-ua-model": '""',
-                "sec-ch-ua-platform": '"Windows"',
-                "sec-ch-ua-platform-version": '"19.0.0"',
-                "sec-fetch-dest": "document",
-                "sec-fetch-mode": "navigate",
-                "sec-fetch-site": "same-origin",
-                "sec-fetch-user": "?1",
-                "upgrade-insecure-requests": "1",
-                "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/128.0.0.0 Safari/537.36",
-            },
-            cookies=cookies,
-            impersonate="chrome",
-        )
+    headers = {
+        "accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
+        "accept-language": "en-US,en;q=0.9",
+        "cache-control": "max-age=0",
+        "dnt": "1",
+        "priority": "u=0, i",
+        "sec-ch-ua": '"Not;A=Brand";v="24", "Chromium";v="128"',
+        "sec-ch-ua-arch": '"x86"',
+        "sec-ch-ua-bitness": '"64"',
+        "sec-ch-ua-full-version": '"128.0.6613.120"',
+        "sec-ch-ua-full-version-list": '"Not;A=Brand";v="24.0.0.0", "Chromium";v="128.0.6613.120"',
+        "sec-ch-ua-mobile": "?0",
+        "sec-ch-ua-model": '""',
+        "sec-ch-ua-platform": '"Windows"',
+        "sec-ch-ua-platform-version": '"19.0.0"',
+        "sec-fetch-dest": "document",
+        "sec-fetch-mode": "navigate",
+        "sec-fetch-site": "same-origin",
+        "sec-fetch-user": "?1",
+        "upgrade-insecure-requests": "1",
+        "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/128.0.0.0 Safari/537.36",
+    }
+
+    def __init__(
+        self,
+        cookies={},
+        keep_chunks=1,
+        hooks=None,
+        base_url=BASE_URL,
+        resilience=None,
+        typed=False,
+    ):
+        """
+        Parameters:
+        - cookies: Perplexity cookies; empty for an anonymous session.
+        - keep_chunks: How many parsed response chunks a search retains, in
+          the `chunks` of the `SearchTrace` its hooks receive. 1 keeps only
+          the latest, N keeps the last N and None keeps all of them for
+          debugging.
+        - hooks: `SearchHooks` that observe every search, e.g. for metrics.
+        - base_url: Origin to send requests to, e.g. a local stand-in server.
+        - resilience: `Resilience` policy for query timeouts, retries and
+          hedging. Clients may share one, so hedging learns from all of them.
+        - typed: Yield `SearchEvent`s, which decode only the answer, sources
+          and status up front, instead of fully decoded dicts.
+        """
+        self.base_url = base_url.rstrip("/")
+        self.resilience = resilience or Resilience()
+        self.parse = parse_event if typed else parse_message
+        if keep_chunks is not None and keep_chunks < 1:
+            raise ValueError("keep_chunks must be at least 1, or None for all.")
+        self.keep_chunks = keep_chunks
+        self.hooks = hooks or SearchHooks()
         self.own = bool(cookies)
         self.copilot = 0 if not cookies else float("inf")
         self.file_upload = 0 if not cookies else float("inf")
@@ -47,33 +127,10 @@ class Client:
             r'"(https://www\.perplexity\.ai/api/auth/callback/email\?callbackUrl=.*?)"'
         )
         self.timestamp = format(random.getrandbits(32), "08x")
-        self.session.get("https://www.perplexity.ai/api/auth/session")
 
-    def search(
-        self,
-        query,
-        mode="auto",
-        model=None,
-        sources=["web"],
-        files={},
-        stream=False,
-        language="en-US",
-        follow_up=None,
-        incognito=False,
-    ):
+    def _reserve(self, mode, model, sources, files):
         """
-        Executes a search query on Perplexity AI.
-
-        Parameters:
-        - query: The search query string.
-        - mode: Search mode ('auto', 'pro', 'reasoning', 'deep research').
-        - model: Specific model to use for the query.
-        - sources: List of sources ('web', 'scholar', 'social').
-        - files: Dictionary of files to upload.
-        - stream: Whether to stream the response.
-        - language: Language code (ISO 639).
-        - follow_up: Information for follow-up queries.
-        - incognito: Whether to enable incognito mode.
+        Validates search parameters and takes the query and upload quota they need.
         """
         # Validate input parameters
         assert mode in ["auto", "pro", "reasoning", "deep research"], (
@@ -116,52 +173,14 @@ class Client:
         )
         self.file_upload = self.file_upload - len(files) if files else self.file_upload
 
-        # Upload files and prepare the query payload
-        uploaded_files = []
-        for filename, file in files.items():
-            file_type = mimetypes.guess_type(filename)[0]
-            file_upload_info = (
-                self.session.post(
-                    "https://www.perplexity.ai/rest/uploads/create_upload_url?version=2.18&source=default",
-                    json={
-                        "content_type": file_type,
-                        "file_size": sys.getsizeof(file),
-                        "filename": filename,
-                        "force_image": False,
-                        "source": "default",
-                    },
-                )
-            ).json()
-
-            # Upload the file to the server
-            mp = CurlMime()
-            for key, value in file_upload_info["fields"].items():
-                mp.addpart(name=key, data=value)
-            mp.addpart(
-                name="file", content_type=file_type, filename=filename, data=file
-            )
-
-            upload_resp = self.session.post(
-                file_upload_info["s3_bucket_url"], multipart=mp
-            )
-
-            if not upload_resp.ok:
-                raise Exception("File upload error", upload_resp)
-
-            # Extract the uploaded file URL
-            if "image/upload" in file_upload_info["s3_object_url"]:
-                uploaded_url = re.sub(
-                    r"/private/s--.*?--/v\d+/user_uploads/",
-                    "/private/user_uploads/",
-                    upload_resp.json()["secure_url"],
-                )
-            else:
-                uploaded_url = file_upload_info["s3_object_url"]
-
-            uploaded_files.append(uploaded_url)
-
-        # Prepare the JSON payload for the query
-        json_data = {
+    @staticmethod
+    def _query_payload(
+        query, mode, model, sources, uploaded_files, language, follow_up, incognito
+    ):
+        """
+        Builds the JSON payload for a query.
+        """
+        return {
             "query_str": query,
             "params": {
                 "attachments": uploaded_files + follow_up["attachments"]
@@ -198,49 +217,268 @@ class Client:
             },
         }
 
-        # Send the query request and handle the response
-        resp = self.session.post(
-            "https://www.perplexity.ai/rest/sse/perplexity_ask",
-            json=json_data,
-            stream=True,
+    def _thread_details_url(self, slug, query_params=None):
+        """
+        Builds the URL for fetching thread details by slug.
+        """
+        params = {"limit": 100, "offset": 0}
+        if query_params:
+            params.update(query_params)
+        if THREAD_DETAILS_PARAMS.keys() & params.keys():
+            # An override of a constant parameter, so build the query from scratch
+            merged = {**THREAD_DETAILS_PARAMS, **params}
+            query_string = _encode_thread_params(merged)
+        else:
+            query_string = f"{_THREAD_DETAILS_QUERY}&{_encode_thread_params(params)}"
+        return f"{self.base_url}/rest/thread/{slug}?{query_string}"
+
+    @staticmethod
+    def _thread_list_page(page, page_size):
+        """
+        Splits a thread list response into its items and whether more follow.
+        """
+        items = page if isinstance(page, list) else page.get("threads", [])
+        return items, len(items) >= page_size
+
+    @staticmethod
+    def _thread_entries_page(detail, page_size):
+        """
+        Splits a thread details response into its entries and whether more follow.
+        """
+        entries = detail.get("entries") or []
+        return entries, bool(detail.get("has_next_page", len(entries) >= page_size))
+
+    @staticmethod
+    def _emit(trace, hooks, chunk, size):
+        """
+        Records a response chunk the caller is about to receive.
+        """
+        trace.chunks.append(chunk)
+        trace.events += 1
+        hooks.on_event(trace, chunk, size)
+        return chunk
+
+
+class Client(_BaseClient):
+    """
+    A client for interacting with the Perplexity AI API.
+    """
+
+    def __init__(
+        self,
+        cookies={},
+        keep_chunks=1,
+        hooks=None,
+        base_url=BASE_URL,
+        resilience=None,
+        typed=False,
+    ):
+        super().__init__(cookies, keep_chunks, hooks, base_url, resilience, typed)
+        # Initialize an HTTP session with default headers and optional cookies
+        self.session = requests.Session(
+            headers=self.headers,
+            cookies=cookies,
+            impersonate="chrome",
         )
-        chunks = []
+        self._session_ready = False
+        self._session_lock = threading.Lock()
+
+    def _ensure_session(self):
+        """
+        Fetches the auth session on first use, so constructing a client never
+        touches the network.
+        """
+        if self._session_ready:
+            return
+        with self._session_lock:
+            if not self._session_ready:
+                self.session.get(f"{self.base_url}/api/auth/session")
+                self._session_ready = True
+
+    def warm_up(self, connections=1):
+        """
+        Fetches the auth session and opens connections ahead of the first
+        query, so it doesn't pay for the TLS handshakes.
+
+        Parameters:
+        - connections: Requests to send at once after the auth session. Over
+          HTTP/2 they may share a single connection. Call it again with 1
+          now and then to keep an idle connection from being closed.
+        """
+        self._ensure_session()
+        if connections > 0:
+            with ThreadPoolExecutor(max_workers=connections) as executor:
+                list(executor.map(lambda _: self._ping(), range(connections)))
+
+    def _ping(self):
+        self.session.head(f"{self.base_url}/api/auth/session")
+
+    def search(
+        self,
+        query,
+        mode="auto",
+        model=None,
+        sources=["web"],
+        files={},
+        stream=False,
+        language="en-US",
+        follow_up=None,
+        incognito=False,
+        hooks=None,
+    ):
+        """
+        Executes a search query on Perplexity AI.
+
+        Parameters:
+        - query: The search query string.
+        - mode: Search mode ('auto', 'pro', 'reasoning', 'deep research').
+        - model: Specific model to use for the query.
+        - sources: List of sources ('web', 'scholar', 'social').
+        - files: Dictionary of filename to bytes, a path, or a binary file object.
+        - stream: Whether to stream the response.
+        - language: Language code (ISO 639).
+        - follow_up: Information for follow-up queries.
+        - incognito: Whether to enable incognito mode.
+        - hooks: `SearchHooks` for this search instead of the client's.
+        """
+        self._reserve(mode, model, sources, files)
+        hooks = hooks or self.hooks
+        trace = SearchTrace(mode, model, self.keep_chunks)
+
+        try:
+            self._ensure_session()
 
-        def stream_response(resp):
+            # Upload files and prepare the query payload
+            uploaded_files = []
+            if files:
+                started = time.perf_counter()
+                uploaded_files = self.upload_files(files)
+                hooks.on_upload(trace, time.perf_counter() - started)
+
+            json_data = self._query_payload(
+                query,
+                mode,
+                model,
+                sources,
+                uploaded_files,
+                language,
+                follow_up,
+                incognito,
+            )
+            trace.attachments = json_data["params"]["attachments"]
+        except Exception as e:
+            hooks.on_error(trace, e)
+            raise
+
+        def stream_response():
             """
             Generator for streaming responses.
             """
-            for chunk in resp.iter_lines(delimiter=b"\r\n\r\n"):
-                content = chunk.decode("utf-8")
+            events = None
+            try:
+                events, first = self._first_event(json_data, follow_up, trace, hooks)
+                if first is None:
+                    return
+                yield self._emit(trace, hooks, *first)
+                for chunk, size in events:
+                    yield self._emit(trace, hooks, chunk, size)
+            finally:
+                if events is not None:
+                    events.close()
+                hooks.on_stream_end(trace, trace.elapsed)
 
-                if content.startswith("event: message\r\n"):
-                    content_json = json.loads(
-                        content[len("event: message\r\ndata: ") :]
-                    )
-                    if "text" in content_json:
-                        content_json["text"] = json.loads(content_json["text"])
+        if stream:
+            return stream_response()
 
-                    chunks.append(content_json)
-                    yield chunks[-1]
+        for _ in stream_response():
+            pass
 
-                elif content.startswith("event: end_of_stream\r\n"):
-                    return
+        return trace.chunks[-1] if trace.chunks else None
 
-        if stream:
-            return stream_response(resp)
+    def _first_event(self, json_data, follow_up, trace, hooks):
+        """
+        Sends the query, retrying as the resilience policy allows until an
+        attempt gets through. Returns the attempt and its first (chunk, size),
+        or None for it if the response held no messages.
+        """
+        policy = self.resilience
+        for attempt in range(policy.retries + 1):
+            if attempt:
+                time.sleep(policy.backoff_delay(attempt))
+            events = self._attempt(json_data, trace, hooks)
+            try:
+                return events, next(events, None)
+            except Exception as e:
+                if attempt == policy.retries or not policy.retryable(
+                    e, follow_up is not None
+                ):
+                    raise
+
+    def _attempt(self, json_data, trace, hooks):
+        """
+        Sends the query once and yields (chunk, size) for each message.
 
-        for chunk in resp.iter_lines(delimiter=b"\r\n\r\n"):
-            content = chunk.decode("utf-8")
+        curl aborts a connection that stays silent for the whole request
+        timeout. The first-event and inter-event timeouts are checked as
+        data arrives, since a blocking read can't be interrupted.
+        """
+        policy = self.resilience
+        sent = time.perf_counter()
+        resp = None
+        try:
+            resp = self.session.post(
+                f"{self.base_url}/rest/sse/perplexity_ask",
+                json=json_data,
+                stream=True,
+                timeout=policy.request_timeout,
+            )
+            resp.raise_for_status()
+            parser = SSEParser()
+            first, timeout = True, policy.first_event_timeout
+            deadline = sent + timeout
+            # None marks the end of the body, which may end without a blank
+            # line after its last event
+            for data in chain(resp.iter_content(), [None]):
+                if data is None:
+                    events = parser.close()
+                else:
+                    if not trace.bytes:
+                        hooks.on_first_byte(trace, time.perf_counter() - sent)
+                    trace.bytes += len(data)
+                    events = parser.feed(data)
+                for event in events:
+                    if event.event == "end_of_stream":
+                        return
 
-            if content.startswith("event: message\r\n"):
-                content_json = json.loads(content[len("event: message\r\ndata: ") :])
-                if "text" in content_json:
-                    content_json["text"] = json.loads(content_json["text"])
+                    if event.event == "message":
+                        if first:
+                            policy.record_first_event(time.perf_counter() - sent)
+                        first, timeout = False, policy.event_timeout
+                        parsing = time.perf_counter()
+                        chunk = self.parse(event.data)
+                        trace.parse_seconds += time.perf_counter() - parsing
+                        yield chunk, len(event.data)
+                        deadline = time.perf_counter() + timeout
+                if time.perf_counter() > deadline:
+                    raise UpstreamTimeout(
+                        f"No event from Perplexity within {timeout}s."
+                    )
+        except Exception as e:
+            hooks.on_error(trace, e)
+            raise
+        finally:
+            if resp is not None:
+                resp.close()
 
-                chunks.append(content_json)
+    def upload_files(self, files):
+        """
+        Uploads files in parallel and returns their attachment URLs.
 
-            elif content.startswith("event: end_of_stream\r\n"):
-                return chunks[-1]
+        Parameters:
+        - files: Dictionary of filename to bytes, a path, or a binary file object.
+        """
+        self._ensure_session()
+        return upload_files(self.session, files, self.base_url)
 
     def get_threads(self, limit=20, offset=0, search_term=""):
         """
@@ -251,9 +489,9 @@ class Client:
         - offset: Offset for pagination (default 0)
         - search_term: Search term to filter threads (default empty)
         """
-        url = "https://www.perplexity.ai/rest/thread/list_ask_threads?version=2.18&source=default"
+        self._ensure_session()
         payload = {"limit": limit, "offset": offset, "search_term": search_term}
-        resp = self.session.post(url, json=payload)
+        resp = self.session.post(self.base_url + THREAD_LIST_PATH, json=payload)
         resp.raise_for_status()
         return resp.json()
 
@@ -265,51 +503,439 @@ class Client:
         - slug: The thread slug (string)
         - query_params: Optional dict of query parameters to override defaults
         """
-        from urllib.parse import urlencode
-
-        default_params = {
-            "with_parent_info": "true",
-            "with_schematized_response": "true",
-            "version": "2.18",
-            "source": "default",
-            "limit": 100,
-            "offset": 0,
-            "from_first": "true",
-            "supported_block_use_cases": [
-                "answer_modes",
-                "media_items",
-                "knowledge_cards",
-                "inline_entity_cards",
-                "place_widgets",
-                "finance_widgets",
-                "sports_widgets",
-                "shopping_widgets",
-                "jobs_widgets",
-                "search_result_widgets",
-                "clarification_responses",
-                "inline_images",
-                "inline_assets",
-                "inline_finance_widgets",
-                "placeholder_cards",
-                "diff_blocks",
-                "inline_knowledge_cards",
-            ],
-        }
-        # Merge user params
-        params = dict(default_params)
-        if query_params:
-            for k, v in query_params.items():
-                params[k] = v
-        # Handle list params for supported_block_use_cases
-        query_items = []
-        for k, v in params.items():
-            if isinstance(v, list):
-                for item in v:
-                    query_items.append((k, item))
-            else:
-                query_items.append((k, v))
-        query_string = urlencode(query_items)
-        url = f"https://www.perplexity.ai/rest/thread/{slug}?{query_string}"
-        resp = self.session.get(url)
+        self._ensure_session()
+        resp = self.session.get(self._thread_details_url(slug, query_params))
+        resp.raise_for_status()
+        return resp.json()
+
+    def iter_threads(self, page_size=20, search_term=""):
+        """
+        Yields every thread, newest first, fetching pages on demand.
+
+        Parameters:
+        - page_size: Threads per request (default 20)
+        - search_term: Search term to filter threads (default empty)
+        """
+        return self._prefetch_pages(
+            lambda offset: self._thread_list_page(
+                self.get_threads(page_size, offset, search_term), page_size
+            ),
+            page_size,
+        )
+
+    def iter_thread_entries(self, slug, page_size=100, offset=0):
+        """
+        Yields every entry of a thread, oldest first, fetching pages on demand.
+
+        Parameters:
+        - slug: The thread slug (string)
+        - page_size: Entries per request (default 100)
+        - offset: Index of the first entry to yield (default 0)
+        """
+        return self._prefetch_pages(
+            lambda offset: self._thread_entries_page(
+                self.get_thread_details_by_slug(
+                    slug, {"limit": page_size, "offset": offset}
+                ),
+                page_size,
+            ),
+            page_size,
+            offset,
+        )
+
+    @staticmethod
+    def _prefetch_pages(fetch, page_size, offset=0):
+        # Requests the next page in a background thread while the caller
+        # works through the current one
+        executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            future = executor.submit(fetch, offset)
+            while future is not None:
+                items, has_more = future.result()
+                offset += page_size
+                future = executor.submit(fetch, offset) if has_more and items else None
+                yield from items
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+class AsyncClient(_BaseClient):
+    """
+    An asyncio client for interacting with the Perplexity AI API.
+
+    Mirrors `Client`, but every network call is awaited on curl_cffi's async
+    session so that many searches can share one event loop.
+    """
+
+    def __init__(
+        self,
+        cookies={},
+        keep_chunks=1,
+        hooks=None,
+        base_url=BASE_URL,
+        resilience=None,
+        typed=False,
+    ):
+        super().__init__(cookies, keep_chunks, hooks, base_url, resilience, typed)
+        # Initialize an async HTTP session with default headers and optional cookies
+        self.session = requests.AsyncSession(
+            headers=self.headers,
+            cookies=cookies,
+            impersonate="chrome",
+        )
+        self._session_ready = False
+        self._session_lock = asyncio.Lock()
+        self._hedge = None
+
+    async def _ensure_session(self):
+        """
+        Fetches the auth session on first use, since it can't be awaited in __init__.
+        """
+        if self._session_ready:
+            return
+        async with self._session_lock:
+            if not self._session_ready:
+                await self.session.get(f"{self.base_url}/api/auth/session")
+                self._session_ready = True
+
+    async def warm_up(self, connections=1):
+        """
+        Fetches the auth session and opens connections ahead of the first
+        query, so it doesn't pay for the TLS handshakes.
+
+        Takes the same parameters as `Client.warm_up`.
+        """
+        await self._ensure_session()
+        if connections > 0:
+            await asyncio.gather(
+                *(
+                    self.session.head(f"{self.base_url}/api/auth/session")
+                    for _ in range(connections)
+                )
+            )
+
+    async def close(self):
+        """
+        Closes the underlying HTTP sessions.
+        """
+        await self.session.close()
+        if self._hedge is not None:
+            await self._hedge.close()
+
+    async def search(
+        self,
+        query,
+        mode="auto",
+        model=None,
+        sources=["web"],
+        files={},
+        stream=False,
+        language="en-US",
+        follow_up=None,
+        incognito=False,
+        hooks=None,
+    ):
+        """
+        Executes a search query on Perplexity AI.
+
+        Takes the same parameters as `Client.search`. With `stream=True` the
+        awaited result is an async generator of response chunks, otherwise it
+        is the final chunk.
+        """
+        self._reserve(mode, model, sources, files)
+        hooks = hooks or self.hooks
+        trace = SearchTrace(mode, model, self.keep_chunks)
+
+        try:
+            await self._ensure_session()
+
+            # Upload files and prepare the query payload
+            uploaded_files = []
+            if files:
+                started = time.perf_counter()
+                uploaded_files = await self.upload_files(files)
+                hooks.on_upload(trace, time.perf_counter() - started)
+
+            json_data = self._query_payload(
+                query,
+                mode,
+                model,
+                sources,
+                uploaded_files,
+                language,
+                follow_up,
+                incognito,
+            )
+            trace.attachments = json_data["params"]["attachments"]
+        except Exception as e:
+            hooks.on_error(trace, e)
+            raise
+
+        async def stream_response():
+            """
+            Async generator for streaming responses.
+            """
+            events = None
+            try:
+                events, first = await self._first_event(
+                    json_data, follow_up, trace, hooks
+                )
+                if first is None:
+                    return
+                yield self._emit(trace, hooks, *first)
+                async for chunk, size in events:
+                    yield self._emit(trace, hooks, chunk, size)
+            finally:
+                if events is not None:
+                    await events.aclose()
+                hooks.on_stream_end(trace, trace.elapsed)
+
+        if stream:
+            return stream_response()
+
+        async for _ in stream_response():
+            pass
+
+        return trace.chunks[-1] if trace.chunks else None
+
+    async def _first_event(self, json_data, follow_up, trace, hooks):
+        """
+        Sends the query, retrying as the resilience policy allows until an
+        attempt gets through. Returns the attempt and its first (chunk, size),
+        or None for it if the response held no messages.
+        """
+        policy = self.resilience
+        # A hedged follow-up would add its question to the thread twice
+        hedge = policy.hedge and follow_up is None
+        for attempt in range(policy.retries + 1):
+            if attempt:
+                await asyncio.sleep(policy.backoff_delay(attempt))
+            try:
+                return await self._race(json_data, hedge, trace, hooks)
+            except Exception as e:
+                if attempt == policy.retries or not policy.retryable(
+                    e, follow_up is not None
+                ):
+                    raise
+
+    async def _race(self, json_data, hedge, trace, hooks):
+        """
+        Starts an attempt and waits for its first event. With `hedge`, an
+        attempt still waiting after the policy's hedge delay is raced by a
+        duplicate on the hedge session, and the first to produce an event
+        wins. The loser is aborted.
+
+        Aborting the loser relies on the `quit_now` event and `queue` that
+        curl_cffi sets on streaming responses, as `aclose` would read the
+        rest of the body first. The supported curl_cffi versions are pinned
+        in pyproject.toml for that reason.
+        """
+        attempt = self._attempt(self.session, json_data, trace, hooks)
+        pending = {asyncio.ensure_future(anext(attempt, None)): attempt}
+        timeout = self.resilience.hedge_delay() if hedge else None
+        error = None
+        try:
+            while pending:
+                done, _ = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    timeout = None
+                    # The duplicate is a second query on the account, so it
+                    # takes a second pro query from the quota too
+                    if trace.mode in ["pro", "reasoning", "deep research"]:
+                        self.copilot -= 1
+                    attempt = self._attempt(
+                        self._hedge_session(), json_data, trace, hooks
+                    )
+                    pending[asyncio.ensure_future(anext(attempt, None))] = attempt
+                    continue
+                for task in done:
+                    attempt = pending.pop(task)
+                    error = task.exception()
+                    if error is None and (task.result() is not None or not pending):
+                        return attempt, task.result()
+                    await attempt.aclose()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            for attempt in pending.values():
+                await attempt.aclose()
+
+    async def _attempt(self, session, json_data, trace, hooks):
+        """
+        Sends the query once and yields (chunk, size) for each message,
+        enforcing the resilience policy's event timeouts.
+        """
+        policy = self.resilience
+        sent = time.perf_counter()
+        first, timeout = True, policy.first_event_timeout
+        deadline = sent + timeout
+        resp = None
+        try:
+            try:
+                # curl_cffi can't abort a transfer before its headers arrive,
+                # so one given up on here runs until curl's own timeout
+                resp = await asyncio.wait_for(
+                    session.post(
+                        f"{self.base_url}/rest/sse/perplexity_ask",
+                        json=json_data,
+                        stream=True,
+                        timeout=policy.request_timeout,
+                    ),
+                    timeout,
+                )
+            except TimeoutError:
+                raise UpstreamTimeout(
+                    f"No response from Perplexity within {timeout}s."
+                ) from None
+            resp.raise_for_status()
+            parser = SSEParser()
+            content = resp.aiter_content()
+            buffered = getattr(resp, "queue", None)
+            while True:
+                try:
+                    if buffered is None or buffered.empty():
+                        data = await asyncio.wait_for(
+                            anext(content), deadline - time.perf_counter()
+                        )
+                    else:
+                        # Already buffered, so skip arming a timer
+                        data = await anext(content)
+                except StopAsyncIteration:
+                    # The body may end without a blank line after its last event
+                    data = None
+                except TimeoutError:
+                    raise UpstreamTimeout(
+                        f"No event from Perplexity within {timeout}s."
+                    ) from None
+                if data is None:
+                    events = parser.close()
+                else:
+                    if not trace.bytes:
+                        hooks.on_first_byte(trace, time.perf_counter() - sent)
+                    trace.bytes += len(data)
+                    events = parser.feed(data)
+                for event in events:
+                    if event.event == "end_of_stream":
+                        return
+
+                    if event.event == "message":
+                        if first:
+                            policy.record_first_event(time.perf_counter() - sent)
+                        first, timeout = False, policy.event_timeout
+                        parsing = time.perf_counter()
+                        chunk = self.parse(event.data)
+                        trace.parse_seconds += time.perf_counter() - parsing
+                        yield chunk, len(event.data)
+                        deadline = time.perf_counter() + timeout
+                if data is None:
+                    return
+        except Exception as e:
+            hooks.on_error(trace, e)
+            raise
+        finally:
+            if resp is not None:
+                # Abort the transfer instead of letting aclose read it to the
+                # end, so a consumer that stops early frees the connection.
+                # curl only notices at its next write, or at its own timeout
+                # if the stream has stalled, so don't wait for it.
+                quit_now = getattr(resp, "quit_now", None)
+                if quit_now is not None:
+                    quit_now.set()
+                else:
+                    await resp.aclose()
+
+    def _hedge_session(self):
+        """
+        The second session hedged attempts run on, created on first use with
+        this client's cookies so it doesn't queue behind the first one.
+        """
+        if self._hedge is None:
+            self._hedge = requests.AsyncSession(
+                headers=self.headers,
+                cookies=self.session.cookies,
+                impersonate="chrome",
+            )
+        return self._hedge
+
+    async def upload_files(self, files):
+        """
+        Uploads files concurrently and returns their attachment URLs.
+
+        Takes the same parameters as `Client.upload_files`.
+        """
+        await self._ensure_session()
+        return await upload_files_async(self.session, files, self.base_url)
+
+    async def get_threads(self, limit=20, offset=0, search_term=""):
+        """
+        Fetches a list of threads from Perplexity AI.
+
+        Takes the same parameters as `Client.get_threads`.
+        """
+        await self._ensure_session()
+        payload = {"limit": limit, "offset": offset, "search_term": search_term}
+        resp = await self.session.post(self.base_url + THREAD_LIST_PATH, json=payload)
+        resp.raise_for_status()
+        return resp.json()
+
+    async def get_thread_details_by_slug(self, slug, query_params=None):
+        """
+        Fetches thread details using the provided slug from the new endpoint.
+
+        Takes the same parameters as `Client.get_thread_details_by_slug`.
+        """
+        await self._ensure_session()
+        resp = await self.session.get(self._thread_details_url(slug, query_params))
         resp.raise_for_status()
         return resp.json()
+
+    def iter_threads(self, page_size=20, search_term=""):
+        """
+        Asynchronously yields every thread, newest first, fetching pages on demand.
+
+        Takes the same parameters as `Client.iter_threads`.
+        """
+
+        async def fetch(offset):
+            page = await self.get_threads(page_size, offset, search_term)
+            return self._thread_list_page(page, page_size)
+
+        return self._prefetch_pages(fetch, page_size)
+
+    def iter_thread_entries(self, slug, page_size=100, offset=0):
+        """
+        Asynchronously yields every entry of a thread, oldest first, fetching
+        pages on demand.
+
+        Takes the same parameters as `Client.iter_thread_entries`.
+        """
+
+        async def fetch(offset):
+            detail = await self.get_thread_details_by_slug(
+                slug, {"limit": page_size, "offset": offset}
+            )
+            return self._thread_entries_page(detail, page_size)
+
+        return self._prefetch_pages(fetch, page_size, offset)
+
+    @staticmethod
+    async def _prefetch_pages(fetch, page_size, offset=0):
+        # Requests the next page in a task while the caller works through
+        # the current one
+        task = asyncio.ensure_future(fetch(offset))
+        try:
+            while task is not None:
+                items, has_more = await task
+                offset += page_size
+                task = (
+                    asyncio.ensure_future(fetch(offset)) if has_more and items else None
+                )
+                for item in items:
+                    yield item
+        finally:
+            if task is not None:
+                task.cancel()
@@ -0,0 +1,365 @@
+import time
+import random
+import asyncio
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+
+from curl_cffi.requests.exceptions import HTTPError
+
+from .perplexity import AsyncClient
+
+PRO_MODES = ("pro", "reasoning", "deep research")
+
+
+class NoAccountAvailable(Exception):
+    """
+    Raised when every account in a pool is quarantined or out of quota.
+    """
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AccountGone(NoAccountAvailable):
+    """
+    Raised when a query is pinned to an account that is no longer in the pool,
+    such as a conversation started before the cookies file changed. Threads
+    belong to their account, so the query can't go to another one.
+    """
+
+
+class Account:
+    """
+    A client in a `ClientPool` together with its scheduling state.
+    """
+
+    def __init__(self, name, client, rate_limit=None):
+        self.name = name
+        self.client = client
+        self.rate_limit = rate_limit
+        self.in_flight = 0
+        self.failures = 0
+        self.quarantined_until = 0.0
+        self.next_start = 0.0
+        self.quota = None
+        self.refill_at = 0.0
+        self.shared_quota = None
+
+    @property
+    def ready_at(self):
+        """
+        Time at which the account may start its next query. Wall-clock time,
+        so it means the same in every worker sharing the pool's state.
+        """
+        return max(self.quarantined_until, self.next_start)
+
+    @property
+    def available(self):
+        return time.time() >= self.ready_at
+
+    def start(self):
+        """
+        Marks a query as started and spaces the next one out by the rate limit.
+        """
+        self.in_flight += 1
+        if self.rate_limit:
+            self.next_start = max(time.time(), self.next_start) + (60 / self.rate_limit)
+
+    @property
+    def remaining(self):
+        """
+        Pro queries and uploads the account has left: the shared state's
+        count when there is one, else its client's own counters.
+        """
+        if self.shared_quota is not None:
+            return self.shared_quota
+        return self.client.copilot, self.client.file_upload
+
+    @remaining.setter
+    def remaining(self, value):
+        if self.shared_quota is not None:
+            self.shared_quota = tuple(value)
+        else:
+            self.client.copilot, self.client.file_upload = value
+
+    def has_quota(self, mode, files=0):
+        """
+        Checks whether the account can run a query in `mode` with `files` uploads.
+        """
+        copilot, file_upload = self.remaining
+        if mode in PRO_MODES and copilot <= 0:
+            return False
+        if files and file_upload - files < 0:
+            return False
+        return True
+
+    @property
+    def exhausted(self):
+        """
+        Whether the account has run out of pro queries or uploads.
+        """
+        copilot, file_upload = self.remaining
+        return copilot <= 0 or file_upload <= 0
+
+
+class ClientPool:
+    """
+    Spreads queries over several Perplexity accounts.
+
+    Each query goes to the least-loaded account that still has quota for the
+    requested mode. Accounts that fail are quarantined with exponential
+    backoff, and accounts that run out of quota sit out `exhausted_cooldown`
+    seconds before they are tried again. A signed-in account that used up
+    its quota gets it back `exhausted_cooldown` seconds after it ran out.
+    With `rate_limit`, each account starts at most that many queries per
+    minute.
+
+    With a `SharedState`, quota, leases, quarantines and rate limits live in
+    a database that every worker process schedules against, rather than in
+    this process alone. Its transactions may wait for other workers, so
+    async code should use `acquire_async`, `release_async` and
+    `lease_async`, which run them in a worker thread.
+    """
+
+    def __init__(
+        self,
+        cookie_sets=(),
+        anonymous=0,
+        client_cls=AsyncClient,
+        quarantine=30,
+        max_quarantine=900,
+        exhausted_cooldown=3600,
+        rate_limit=None,
+        state=None,
+        pro_quota=None,
+        upload_quota=None,
+    ):
+        """
+        Parameters:
+        - cookie_sets: Iterable of cookie dicts, one per account.
+        - anonymous: Number of extra sessions without cookies.
+        - client_cls: Client class to build for each account.
+        - quarantine: Seconds an account sits out after its first failure.
+        - max_quarantine: Upper bound for the backoff after repeated failures.
+        - exhausted_cooldown: Seconds an account sits out once out of quota,
+          after which its starting quota is restored.
+        - rate_limit: Most queries per minute per account, or None for no limit.
+        - state: `SharedState` to schedule against, or None to keep the state
+          in this process.
+        - pro_quota: Pro queries each signed-in account may run, or None for
+          no limit.
+        - upload_quota: Files each signed-in account may upload, or None for
+          no limit.
+        """
+        self.accounts = [
+            Account(f"account-{i}", client_cls(cookies), rate_limit)
+            for i, cookies in enumerate(cookie_sets)
+        ] + [
+            Account(f"anonymous-{i}", client_cls({}), rate_limit)
+            for i in range(anonymous)
+        ]
+        if not self.accounts:
+            raise ValueError("A client pool needs at least one account.")
+        self.quarantine = quarantine
+        self.max_quarantine = max_quarantine
+        self.exhausted_cooldown = exhausted_cooldown
+        for account in self.accounts:
+            if account.client.own and pro_quota is not None:
+                account.client.copilot = pro_quota
+            if account.client.own and upload_quota is not None:
+                account.client.file_upload = upload_quota
+            if account.client.own:
+                account.quota = (account.client.copilot, account.client.file_upload)
+        self.state = state
+        if state is not None:
+            state.register(self.accounts)
+            for account in self.accounts:
+                account.shared_quota = (
+                    account.client.copilot,
+                    account.client.file_upload,
+                )
+                if account.client.own:
+                    # The shared state gates quota, and other workers' queries
+                    # never reach this process's client counters
+                    account.client.copilot = float("inf")
+                    account.client.file_upload = float("inf")
+
+    @property
+    def primary(self):
+        """
+        The first account, used for account-bound calls such as thread listing.
+        """
+        return self.accounts[0]
+
+    def get(self, name):
+        """
+        Returns the account called `name`, or None.
+        """
+        for account in self.accounts:
+            if account.name == name:
+                return account
+        return None
+
+    def acquire(self, mode="auto", files=0, account=None):
+        """
+        Picks an account for a query and marks it busy.
+
+        Parameters:
+        - mode: Search mode of the query.
+        - files: Number of files the query uploads.
+        - account: Optional account name to pin the query to.
+        """
+        if account and self.get(account) is None:
+            raise AccountGone(
+                f"Account '{account}' is no longer in the pool, "
+                "so its threads can't be continued."
+            )
+        with self._synced():
+            now = time.time()
+            for a in self.accounts:
+                self._refill(a, now)
+            candidates = [self.get(account)] if account else self.accounts
+            ready = [a for a in candidates if a.available and a.has_quota(mode, files)]
+            if ready:
+                chosen = min(ready, key=lambda a: (a.in_flight, random.random()))
+                chosen.start()
+                if self.state is not None:
+                    self.state.lease(chosen, mode, files)
+                return chosen
+            waiting = [
+                a.ready_at
+                for a in candidates
+                if not a.available and a.has_quota(mode, files)
+            ] + [max(a.ready_at, a.refill_at) for a in candidates if a.refill_at]
+
+        # Raised once the transaction is committed, so started cooldowns stick
+        retry_after = max(min(waiting) - time.time(), 0) if waiting else None
+        raise NoAccountAvailable(
+            f"No account available for mode '{mode}'.", retry_after
+        )
+
+    def release(self, account, error=None):
+        """
+        Marks a query on `account` as finished and records its outcome.
+        """
+        with self._synced():
+            account.in_flight -= 1
+            if error is None:
+                account.failures = 0
+            elif self._is_exhausted(error):
+                account.quarantined_until = time.time() + self.exhausted_cooldown
+            elif isinstance(error, AssertionError):
+                # Invalid parameters are the caller's fault, not the account's
+                pass
+            else:
+                account.failures += 1
+                backoff = min(
+                    self.quarantine * 2 ** (account.failures - 1), self.max_quarantine
+                )
+                account.quarantined_until = time.time() + backoff
+            if self.state is not None:
+                self.state.release(account)
+
+    def _refill(self, account, now):
+        """
+        Starts the cooldown of an account that just ran out of quota, and
+        restores its starting quota once the cooldown is over.
+        """
+        if account.quota is None:
+            return
+        if not account.refill_at:
+            if not account.exhausted:
+                return
+            account.refill_at = now + self.exhausted_cooldown
+        elif now >= account.refill_at:
+            account.remaining = [
+                start if left <= 0 else left
+                for start, left in zip(account.quota, account.remaining)
+            ]
+            account.refill_at = 0.0
+        else:
+            return
+        if self.state is not None:
+            self.state.save_quota(account)
+
+    def _synced(self):
+        """
+        Context for a scheduling decision. With shared state, it runs in one
+        transaction on the latest state of every account.
+        """
+        if self.state is None:
+            return nullcontext()
+        return self.state.synced(self.accounts)
+
+    @contextmanager
+    def lease(self, mode="auto", files=0, account=None):
+        """
+        Context manager that acquires an account and releases it on exit.
+        """
+        leased = self.acquire(mode, files, account)
+        try:
+            yield leased
+        except BaseException as e:
+            # Cancellation and generator shutdown are not the account's fault
+            self.release(leased, e if isinstance(e, Exception) else None)
+            raise
+        else:
+            self.release(leased)
+
+    async def acquire_async(self, mode="auto", files=0, account=None):
+        """
+        `acquire` for async code. With shared state, the transaction runs in
+        a worker thread so waiting on other workers never blocks the loop.
+        """
+        if self.state is None:
+            return self.acquire(mode, files, account)
+        acquiring = asyncio.ensure_future(
+            asyncio.to_thread(self.acquire, mode, files, account)
+        )
+        try:
+            return await asyncio.shield(acquiring)
+        except asyncio.CancelledError:
+            # The thread may still take the account, so give it back then
+            acquiring.add_done_callback(self._release_abandoned)
+            raise
+
+    def _release_abandoned(self, acquiring):
+        if not acquiring.cancelled() and acquiring.exception() is None:
+            asyncio.ensure_future(self.release_async(acquiring.result()))
+
+    async def release_async(self, account, error=None):
+        """
+        `release` for async code, run to completion even if the caller is
+        cancelled.
+        """
+        if self.state is None:
+            self.release(account, error)
+            return
+        await asyncio.shield(asyncio.to_thread(self.release, account, error))
+
+    @asynccontextmanager
+    async def lease_async(self, mode="auto", files=0, account=None):
+        """
+        `lease` for async code, with `acquire_async` and `release_async`.
+        """
+        leased = await self.acquire_async(mode, files, account)
+        try:
+            yield leased
+        except BaseException as e:
+            await self.release_async(leased, e if isinstance(e, Exception) else None)
+            raise
+        else:
+            await self.release_async(leased)
+
+    @staticmethod
+    def _is_exhausted(error):
+        """
+        Tells quota exhaustion apart from other failures.
+        """
+        if isinstance(error, AssertionError):
+            return "No remaining pro queries" in str(error) or "limit exceeded" in str(
+                error
+            )
+        if isinstance(error, HTTPError):
+            return getattr(error.response, "status_code", None) == 429
+        return False
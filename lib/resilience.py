@@ -0,0 +1,118 @@
+import random
+from collections import deque
+
+from curl_cffi.requests.exceptions import ConnectTimeout, HTTPError, RequestException
+
+# curl errors raised before the query reached Perplexity: DNS, TCP connect and
+# TLS handshake failures. Retrying these never sends a query twice.
+NOT_SENT_CURL_CODES = {6, 7, 35}
+
+
+class UpstreamTimeout(TimeoutError):
+    """
+    Raised when Perplexity sends no event within the first-event or
+    inter-event timeout.
+    """
+
+
+class Resilience:
+    """
+    Timeout, retry and hedging policy for searches.
+
+    A search may be retried only before its first event arrives, so callers
+    never see an answer start over. Follow-ups are retried only when the query
+    provably never reached Perplexity, as a repeat would add a second entry to
+    the thread. With `hedge`, a new query with no event after the p95 of
+    recent first-event latencies is sent again on a second session, and the
+    first of the two to answer is kept. Both reach Perplexity, so a hedged pro
+    query takes two pro queries from the client's quota. A `ClientPool`
+    with a `SharedState` still books one per lease, so leave headroom in its
+    quota when hedging.
+    """
+
+    def __init__(
+        self,
+        connect_timeout=10,
+        first_event_timeout=60,
+        event_timeout=60,
+        retries=2,
+        backoff=0.5,
+        max_backoff=8,
+        hedge=False,
+        hedge_quantile=0.95,
+        hedge_after=5,
+        min_hedge_after=0.5,
+    ):
+        """
+        Parameters:
+        - connect_timeout: Seconds to establish the connection.
+        - first_event_timeout: Seconds from sending the query to its first event.
+        - event_timeout: Longest silence in seconds between two events.
+        - retries: Extra attempts after a failure before the first event.
+        - backoff: Base of the exponential backoff between attempts, in seconds.
+        - max_backoff: Upper bound of the backoff.
+        - hedge: Send a duplicate of slow new queries (AsyncClient only).
+        - hedge_quantile: First-event latency quantile after which to hedge.
+        - hedge_after: Hedge delay in seconds until enough latencies are known.
+        - min_hedge_after: Lower bound of the hedge delay.
+        """
+        self.connect_timeout = connect_timeout
+        self.first_event_timeout = first_event_timeout
+        self.event_timeout = event_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_after = hedge_after
+        self.min_hedge_after = min_hedge_after
+        self.first_event_latencies = deque(maxlen=256)
+
+    @property
+    def request_timeout(self):
+        """
+        curl timeout for the query request. curl also aborts a stream that
+        stays silent for this long in total, as a backstop.
+        """
+        return (self.connect_timeout, max(self.first_event_timeout, self.event_timeout))
+
+    def backoff_delay(self, attempt):
+        """
+        Seconds to wait before retry number `attempt`, counting from 1, with
+        full jitter.
+        """
+        return random.uniform(
+            0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        )
+
+    def retryable(self, error, follow_up=False):
+        """
+        Tells whether a failure before the first event may be retried.
+        """
+        if isinstance(error, HTTPError):
+            status = getattr(error.response, "status_code", None)
+            # 429 means out of quota or rate limited; retrying only makes it worse
+            return not follow_up and status is not None and status >= 500
+        if isinstance(error, RequestException):
+            return (
+                not follow_up
+                or isinstance(error, ConnectTimeout)
+                or getattr(error, "code", None) in NOT_SENT_CURL_CODES
+            )
+        if isinstance(error, UpstreamTimeout):
+            return not follow_up
+        return False
+
+    def record_first_event(self, seconds):
+        self.first_event_latencies.append(seconds)
+
+    def hedge_delay(self):
+        """
+        Seconds to wait for the first event before hedging.
+        """
+        latencies = self.first_event_latencies
+        if len(latencies) < 20:
+            return self.hedge_after
+        ordered = sorted(latencies)
+        index = min(int(len(ordered) * self.hedge_quantile), len(ordered) - 1)
+        return max(ordered[index], self.min_hedge_after)
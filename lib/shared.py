@@ -0,0 +1,221 @@
+import os
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from .pool import PRO_MODES
+
+
+def process_alive(pid):
+    """Whether the process `pid` is still running."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class SharedState:
+    """
+    Scheduling state of a `ClientPool` in a SQLite database in WAL mode, so
+    every worker process that opens the same file schedules against it.
+
+    It holds each account's remaining quota, failures, quarantine and rate
+    limit slot, one lease row per running query, and the keys of queries in
+    flight. Leases and flights are tagged with the process that holds them,
+    so those of a process that died are dropped instead of counting forever.
+    """
+
+    def __init__(self, path="state.db", busy_timeout=5.0, flight_ttl=900):
+        """
+        Parameters:
+        - path: SQLite database file shared by the workers.
+        - busy_timeout: Seconds to wait for another worker's transaction.
+        - flight_ttl: Seconds after which an in-flight query is assumed lost.
+        """
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.flight_ttl = flight_ttl
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    @property
+    def _db(self):
+        # Opened on first use in each process, as connections must not cross a fork
+        if self._pid != os.getpid():
+            db = sqlite3.connect(
+                self.path,
+                timeout=self.busy_timeout,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS accounts ("
+                "name TEXT PRIMARY KEY, copilot REAL NOT NULL, "
+                "file_upload REAL NOT NULL, failures INTEGER NOT NULL DEFAULT 0, "
+                "quarantined_until REAL NOT NULL DEFAULT 0, "
+                "next_start REAL NOT NULL DEFAULT 0, "
+                "refill_at REAL NOT NULL DEFAULT 0)"
+            )
+            db.execute("CREATE TABLE IF NOT EXISTS leases (account TEXT, pid INTEGER)")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS flights "
+                "(key TEXT PRIMARY KEY, pid INTEGER, started REAL)"
+            )
+            self._conn, self._pid = db, os.getpid()
+        return self._conn
+
+    @contextmanager
+    def transaction(self):
+        """
+        Holds the database's write lock, so a read-decide-write sequence is
+        atomic across processes.
+        """
+        with self._lock:
+            db = self._db
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            else:
+                db.execute("COMMIT")
+
+    @contextmanager
+    def synced(self, accounts):
+        """
+        Runs a transaction with `accounts` loaded from the shared state.
+        """
+        with self.transaction():
+            self.load(accounts)
+            yield
+
+    def register(self, accounts):
+        """
+        Adds accounts with their clients' starting quota. Accounts that are
+        already known keep their shared state. Also drops the leases and
+        flights of processes that are gone.
+        """
+        with self.transaction() as db:
+            db.executemany(
+                "INSERT OR IGNORE INTO accounts (name, copilot, file_upload) "
+                "VALUES (?, ?, ?)",
+                [(a.name, a.client.copilot, a.client.file_upload) for a in accounts],
+            )
+            for table in ("leases", "flights"):
+                pids = [
+                    row[0] for row in db.execute(f"SELECT DISTINCT pid FROM {table}")
+                ]
+                db.executemany(
+                    f"DELETE FROM {table} WHERE pid = ?",
+                    [(pid,) for pid in pids if not process_alive(pid)],
+                )
+
+    def load(self, accounts):
+        """
+        Copies the shared state into `accounts`. Must run in a transaction.
+        """
+        db = self._conn
+        in_flight = dict(
+            db.execute("SELECT account, COUNT(*) FROM leases GROUP BY account")
+        )
+        rows = {
+            row[0]: row[1:]
+            for row in db.execute(
+                "SELECT name, copilot, file_upload, failures, quarantined_until, "
+                "next_start, refill_at FROM accounts"
+            )
+        }
+        for account in accounts:
+            row = rows.get(account.name)
+            if row is None:
+                continue
+            (
+                copilot,
+                file_upload,
+                account.failures,
+                account.quarantined_until,
+                account.next_start,
+                account.refill_at,
+            ) = row
+            account.shared_quota = (copilot, file_upload)
+            account.in_flight = in_flight.get(account.name, 0)
+
+    def lease(self, account, mode, files=0):
+        """
+        Records a query started on `account` and takes the quota it needs.
+        Must run in a transaction.
+        """
+        self._conn.execute(
+            "INSERT INTO leases VALUES (?, ?)", (account.name, os.getpid())
+        )
+        self._conn.execute(
+            "UPDATE accounts SET copilot = copilot - ?, "
+            "file_upload = file_upload - ?, next_start = ? WHERE name = ?",
+            (int(mode in PRO_MODES), files, account.next_start, account.name),
+        )
+
+    def release(self, account):
+        """
+        Drops one lease of `account` held by this process and stores its
+        failures and quarantine. Must run in a transaction.
+        """
+        self._conn.execute(
+            "DELETE FROM leases WHERE rowid = "
+            "(SELECT rowid FROM leases WHERE account = ? AND pid = ? LIMIT 1)",
+            (account.name, os.getpid()),
+        )
+        self._conn.execute(
+            "UPDATE accounts SET failures = ?, quarantined_until = ? WHERE name = ?",
+            (account.failures, account.quarantined_until, account.name),
+        )
+
+    def save_quota(self, account):
+        """
+        Stores the quota of `account` and when it is due to be restored.
+        Must run in a transaction.
+        """
+        self._conn.execute(
+            "UPDATE accounts SET copilot = ?, file_upload = ?, refill_at = ? "
+            "WHERE name = ?",
+            (
+                *account.remaining,
+                account.refill_at,
+                account.name,
+            ),
+        )
+
+    def claim(self, key):
+        """
+        Registers this process as running the query `key`. Returns False if
+        another live process already is.
+        """
+        with self.transaction() as db:
+            row = db.execute(
+                "SELECT pid, started FROM flights WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                pid, started = row
+                if pid == os.getpid():
+                    return True
+                if process_alive(pid) and started > time.time() - self.flight_ttl:
+                    return False
+            db.execute(
+                "INSERT OR REPLACE INTO flights VALUES (?, ?, ?)",
+                (key, os.getpid(), time.time()),
+            )
+            return True
+
+    def unclaim(self, key):
+        """Removes this process's registration of the query `key`."""
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM flights WHERE key = ? AND pid = ?", (key, os.getpid())
+            )
@@ -0,0 +1,243 @@
+import json
+from collections import namedtuple
+
+
+_decoder = json.JSONDecoder()
+
+
+def json_loads(data):
+    """
+    Stdlib JSON decoder for bytes or str. Decoding to str first beats
+    json.loads' own handling of bytes, and `raw_decode` skips the whitespace
+    matching json.loads does around every document.
+    """
+    if isinstance(data, bytes):
+        data = data.decode("utf-8")
+    try:
+        value, end = _decoder.raw_decode(data)
+    except json.JSONDecodeError:
+        end = None
+    if end != len(data):
+        # Surrounding whitespace or trailing data, or an error to raise
+        return json.loads(data)
+    return value
+
+
+# Prefer a faster JSON decoder when one is installed. All of them accept bytes.
+try:
+    import orjson
+
+    loads = orjson.loads
+    backend = "orjson"
+except ImportError:
+    try:
+        import msgspec
+
+        loads = msgspec.json.Decoder().decode
+        backend = "msgspec"
+    except ImportError:
+        loads = json_loads
+        backend = "json"
+
+SSEEvent = namedtuple("SSEEvent", ["event", "data", "id"])
+# Skips the Python-level __new__ of the namedtuple, once per event
+_new_event = tuple.__new__
+
+
+class SSEParser:
+    """
+    Incremental parser for `text/event-stream` bodies.
+
+    Feed it raw bytes as they arrive and it returns the events completed so
+    far. It follows the SSE framing rules: `\\r\\n`, `\\n` and `\\r` line
+    endings, `:` comment lines, and multi-line `data` fields joined by `\\n`.
+    Field values stay as bytes so payloads can go straight to a JSON decoder.
+
+    Once the first line ending shows whether the stream uses `\\r\\n` or
+    `\\n`, the body is split on the blank line between events, and the usual
+    `event:` plus `data:` pair is read without going line by line. Other
+    events fall back to the line parser, so streams that mix line endings
+    still parse, though an event ended by another kind of blank line waits
+    for the next delimiter.
+    """
+
+    def __init__(self):
+        self._pending = []
+        self._event = None
+        self._data = []
+        self._id = None
+        # Line ending and blank-line delimiter, once known; False for \r
+        self._newline = None
+        self._delimiter = None
+        self._names = {}
+
+    def feed(self, chunk):
+        """
+        Parses `chunk` and returns a list of completed `SSEEvent`s.
+
+        Parameters:
+        - chunk: The next bytes of the response body.
+        """
+        if self._delimiter is None:
+            self._detect(chunk)
+            if self._delimiter is None:
+                self._pending.append(chunk)
+                return []
+        if not self._delimiter:
+            return self._feed_lines(chunk)
+
+        delimiter = self._delimiter
+        pending = self._pending
+        if pending:
+            # Hold chunks without a delimiter until one arrives, so a large
+            # payload split over many chunks is scanned only once
+            tail = b"".join(pending[-3:])[-3:]
+            pending.append(chunk)
+            if delimiter not in tail + chunk[:3] and delimiter not in chunk:
+                return []
+            chunk = b"".join(pending)
+        elif delimiter not in chunk:
+            pending.append(chunk)
+            return []
+
+        blocks = chunk.split(delimiter)
+        rest = blocks.pop()
+        self._pending = [rest] if rest else []
+        events = []
+        marker = self._newline + b"data: "
+        skip = len(marker)
+        for block in blocks:
+            # The usual event is one `event:` line and one `data:` line
+            split = block.find(marker)
+            if (
+                split != -1
+                and block.startswith(b"event: ")
+                and block.find(b"\n", split + skip) == -1
+                and block.find(b"\r", split + skip) == -1
+            ):
+                name = self._names.get(block[7:split]) or self._name(block[7:split])
+                if name:
+                    data = block[split + skip :]
+                    events.append(_new_event(SSEEvent, (name, data, self._id)))
+                    continue
+            self._block(block, events)
+        return events
+
+    def close(self):
+        """
+        Flushes a final event that was not followed by a blank line.
+        """
+        events = []
+        tail = b"".join(self._pending)
+        self._pending = []
+        for line in tail.splitlines():
+            self._line(line, events)
+        self._line(b"", events)
+        return events
+
+    def _detect(self, chunk):
+        """
+        Picks the delimiter from the first line ending, holding on to the
+        bytes seen so far until there is one.
+        """
+        head = b"".join(self._pending) + chunk
+        cr, lf = head.find(b"\r"), head.find(b"\n")
+        if lf != -1 and (cr == -1 or lf < cr):
+            self._newline = b"\n"
+        elif cr != -1 and cr + 1 < len(head):
+            self._newline = b"\r\n" if head[cr + 1] == 0x0A else False
+        else:
+            return
+        self._delimiter = self._newline and self._newline * 2
+
+    def _name(self, raw):
+        """
+        Decodes and remembers an event name, or returns None if `raw` spans
+        more than one line.
+        """
+        if raw.find(b"\n") != -1 or raw.find(b"\r") != -1:
+            return None
+        name = self._names[raw] = raw.decode("utf-8")
+        return name
+
+    def _block(self, block, events):
+        """
+        Reads the event in `block`, the bytes between two blank lines, line
+        by line. Handles comments, ids, multi-line data and mixed line endings.
+        """
+        for line in block.splitlines():
+            self._line(line, events)
+        self._line(b"", events)
+
+    def _feed_lines(self, chunk):
+        """
+        Line-by-line parsing for streams whose lines end in a bare `\\r`.
+        """
+        if b"\n" not in chunk and b"\r" not in chunk:
+            self._pending.append(chunk)
+            return []
+        if self._pending:
+            self._pending.append(chunk)
+            chunk = b"".join(self._pending)
+            self._pending = []
+
+        lines = chunk.splitlines()
+        last = chunk[-1:]
+        if last == b"\r":
+            # May be the first half of a \r\n split across chunks
+            self._pending.append(lines.pop() + b"\r")
+        elif last != b"\n":
+            self._pending.append(lines.pop())
+
+        events = []
+        for line in lines:
+            self._line(line, events)
+        return events
+
+    def _line(self, line, events):
+        if not line:
+            if self._data or self._event is not None:
+                data = self._data
+                events.append(
+                    SSEEvent(
+                        (self._event or b"message").decode("utf-8"),
+                        data[0] if len(data) == 1 else b"\n".join(data),
+                        self._id,
+                    )
+                )
+            self._event = None
+            self._data = []
+            return
+
+        if line.startswith(b"data: "):
+            self._data.append(line[6:])
+            return
+
+        if line[0] == 0x3A:  # ":" starts a comment
+            return
+
+        field, sep, value = line.partition(b":")
+        if sep and value[:1] == b" ":
+            value = value[1:]
+
+        if field == b"data":
+            self._data.append(value)
+        elif field == b"event":
+            self._event = value
+        elif field == b"id":
+            self._id = value.decode("utf-8")
+
+
+def parse_message(data, loads=loads):
+    """
+    Decodes the JSON payload of a Perplexity `message` event, including the
+    JSON-encoded `text` field nested inside it.
+
+    Parameters:
+    - data: The event's data as bytes.
+    - loads: JSON decoder to use; defaults to the fastest one installed.
+    """
+    content_json = loads(data)
+    if isinstance(content_json.get("text"), str):
+        content_json["text"] = loads(content_json["text"])
+    return content_json
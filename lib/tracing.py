@@ -0,0 +1,220 @@
+import os
+import time
+import contextlib
+from contextvars import ContextVar
+
+from .hooks import SearchHooks
+
+# The trace of the request being served, if it is traced
+current_trace = ContextVar("current_trace", default=None)
+
+
+class Span:
+    """
+    One timed stage of a trace. Times are `time.perf_counter` values.
+
+    A stage that runs once per event is recorded as one span from its first
+    to its last run, with the time actually spent in it as `busy` and the
+    number of runs as `count`.
+    """
+
+    __slots__ = ("name", "span_id", "start", "end", "busy", "count", "attributes")
+
+    def __init__(self, name, start, end=None, attributes=None):
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.start = start
+        self.end = end
+        self.busy = None
+        self.count = 0
+        self.attributes = attributes or {}
+
+    @property
+    def seconds(self):
+        """Time spent in the span: its busy time, or else its length."""
+        if self.busy is not None:
+            return self.busy
+        return (self.end or time.perf_counter()) - self.start
+
+
+class _Timer:
+    __slots__ = ("trace", "name", "started")
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        end = time.perf_counter()
+        self.trace.stage(self.name, end - self.started, end)
+
+
+class Trace:
+    """
+    Spans of one request, under a root span for the whole request.
+
+    Export it with `server_timing` for a `Server-Timing` header, or with
+    `to_otlp` as OpenTelemetry (OTLP/JSON) spans.
+    """
+
+    def __init__(self, name, attributes=None):
+        self.trace_id = os.urandom(16).hex()
+        self._wall = time.time_ns()
+        self._perf = time.perf_counter()
+        self.root = Span(name, self._perf, attributes=attributes)
+        self.spans = []
+        self._stages = {}
+
+    def add(self, name, start, end=None, **attributes):
+        """Record a span from `start` to `end`, or to now."""
+        span = Span(name, start, end or time.perf_counter(), attributes)
+        self.spans.append(span)
+        return span
+
+    def stage(self, name, seconds, end=None):
+        """Add `seconds` spent in a stage that runs many times, ending at `end`."""
+        end = end or time.perf_counter()
+        span = self._stages.get(name)
+        if span is None:
+            span = self._stages[name] = self.add(name, end - seconds, end)
+            span.busy = 0.0
+        span.end = end
+        span.busy += seconds
+        span.count += 1
+
+    def timer(self, name):
+        """Context manager that adds the time spent in its block to a stage."""
+        return _Timer(self, name)
+
+    def finish(self, **attributes):
+        self.root.end = time.perf_counter()
+        self.root.attributes.update(attributes)
+
+    def server_timing(self):
+        """The spans as a `Server-Timing` header value, in milliseconds."""
+        return ", ".join(
+            f"{span.name};dur={span.seconds * 1000:.2f}"
+            for span in [*self.spans, self.root]
+        )
+
+    def to_otlp(self, service="perplexity-web-api"):
+        """The trace as an OTLP/JSON `ExportTraceServiceRequest`."""
+        spans = [self._otlp_span(self.root, None)] + [
+            self._otlp_span(span, self.root.span_id) for span in self.spans
+        ]
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {"attributes": _attributes({"service.name": service})},
+                    "scopeSpans": [{"scope": {"name": "lib.tracing"}, "spans": spans}],
+                }
+            ]
+        }
+
+    def _otlp_span(self, span, parent_id):
+        attributes = dict(span.attributes)
+        if span.busy is not None:
+            attributes["busy_ms"] = round(span.busy * 1000, 3)
+            attributes["count"] = span.count
+        data = {
+            "traceId": self.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": 2 if parent_id is None else 1,
+            "startTimeUnixNano": str(self._unix_nano(span.start)),
+            "endTimeUnixNano": str(self._unix_nano(span.end or time.perf_counter())),
+            "attributes": _attributes(attributes),
+        }
+        if parent_id is not None:
+            data["parentSpanId"] = parent_id
+        if "error" in span.attributes:
+            data["status"] = {"code": 2, "message": str(span.attributes["error"])}
+        return data
+
+    def _unix_nano(self, perf):
+        return self._wall + int((perf - self._perf) * 1e9)
+
+
+# What `timer_for` hands out without a trace. A no-op context manager is
+# reusable, so every untraced request shares this one.
+_untimed = contextlib.nullcontext()
+
+
+def _untimed_timer(name):
+    return _untimed
+
+
+def timer_for(trace):
+    """
+    Return `trace.timer`, or for an untraced request (`trace` is None) a timer
+    whose context managers record nothing, so callers can time stages with
+    `with timer("name"):` either way.
+    """
+    return trace.timer if trace is not None else _untimed_timer
+
+
+def _attributes(values):
+    attributes = []
+    for key, value in values.items():
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            encoded = {"boolValue": value}
+        elif isinstance(value, int):
+            # OTLP/JSON carries 64-bit integers as strings
+            encoded = {"intValue": str(value)}
+        elif isinstance(value, float):
+            encoded = {"doubleValue": value}
+        else:
+            encoded = {"stringValue": str(value)}
+        attributes.append({"key": key, "value": encoded})
+    return attributes
+
+
+class TraceHooks(SearchHooks):
+    """
+    Search hooks that add the stages of a search to the current trace:
+    file upload, the wait for the first bytes (connection setup and request),
+    the wait for the first event (upstream thinking), event parsing and the
+    whole upstream stream. Searches outside a traced request are ignored.
+    """
+
+    def on_upload(self, search, seconds):
+        trace = current_trace.get()
+        if trace is not None:
+            now = time.perf_counter()
+            trace.add("upload", now - seconds, now)
+
+    def on_first_byte(self, search, seconds):
+        trace = current_trace.get()
+        if trace is not None:
+            now = time.perf_counter()
+            trace.add("upstream.first_byte", now - seconds, now)
+
+    def on_event(self, search, event, size):
+        if search.events == 1:
+            trace = current_trace.get()
+            if trace is not None:
+                trace.add("upstream.first_event", search.started)
+
+    def on_stream_end(self, search, seconds):
+        trace = current_trace.get()
+        if trace is not None:
+            trace.add(
+                "upstream.search",
+                search.started,
+                mode=search.mode,
+                model=search.model,
+                events=search.events,
+                bytes=search.bytes,
+            )
+            parse = trace.add("parse", search.started)
+            parse.busy, parse.count = search.parse_seconds, search.events
+
+    def on_error(self, search, error):
+        trace = current_trace.get()
+        if trace is not None:
+            trace.add("upstream.error", time.perf_counter(), error=repr(error))
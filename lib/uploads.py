@@ -0,0 +1,169 @@
+import os
+import re
+import asyncio
+import mimetypes
+from concurrent.futures import ThreadPoolExecutor
+
+from curl_cffi import CurlMime
+
+CREATE_UPLOAD_PATH = "/rest/uploads/create_upload_url?version=2.18&source=default"
+
+
+class UploadError(Exception):
+    """
+    Raised when a file could not be uploaded.
+    """
+
+
+class UploadSource:
+    """
+    A file to attach to a query.
+
+    Accepts bytes, a filesystem path, or a binary file object. Paths and file
+    objects backed by a file on disk are streamed by curl from disk, so
+    large files never have to be loaded into memory.
+    """
+
+    def __init__(self, filename, file):
+        self.filename = filename
+        self.content_type = mimetypes.guess_type(filename)[0]
+        self.data = None
+        self.path = None
+
+        if isinstance(file, (bytes, bytearray, memoryview)):
+            self.data = bytes(file)
+            self.size = len(self.data)
+        elif isinstance(file, (str, os.PathLike)):
+            self.path = os.fspath(file)
+            self.size = os.path.getsize(self.path)
+        elif isinstance(getattr(file, "name", None), str) and os.path.isfile(file.name):
+            self.path = file.name
+            self.size = os.fstat(file.fileno()).st_size
+        elif hasattr(file, "read"):
+            self.data = file.read()
+            self.size = len(self.data)
+        else:
+            raise TypeError(f"Unsupported file type for {filename}: {type(file)}")
+
+    def upload_url_request(self):
+        """
+        Builds the JSON body used to request a presigned upload URL.
+        """
+        return {
+            "content_type": self.content_type,
+            "file_size": self.size,
+            "filename": self.filename,
+            "force_image": False,
+            "source": "default",
+        }
+
+    def multipart(self, file_upload_info):
+        """
+        Builds the multipart form that uploads the file to its presigned URL.
+        """
+        mp = CurlMime()
+        for key, value in file_upload_info["fields"].items():
+            mp.addpart(name=key, data=value)
+        mp.addpart(
+            name="file",
+            content_type=self.content_type,
+            filename=self.filename,
+            local_path=self.path,
+            data=self.data,
+        )
+        return mp
+
+
+def uploaded_url(file_upload_info, upload_resp):
+    """
+    Extracts the attachment URL of an uploaded file.
+    """
+    if "image/upload" in file_upload_info["s3_object_url"]:
+        return re.sub(
+            r"/private/s--.*?--/v\d+/user_uploads/",
+            "/private/user_uploads/",
+            upload_resp.json()["secure_url"],
+        )
+    return file_upload_info["s3_object_url"]
+
+
+def upload_file(session, source, base_url):
+    """
+    Uploads one `UploadSource` with a sync session and returns its URL.
+    """
+    file_upload_info = session.post(
+        base_url + CREATE_UPLOAD_PATH, json=source.upload_url_request()
+    ).json()
+
+    mp = source.multipart(file_upload_info)
+    try:
+        upload_resp = session.post(file_upload_info["s3_bucket_url"], multipart=mp)
+    finally:
+        mp.close()
+
+    if not upload_resp.ok:
+        raise UploadError(f"File upload error for {source.filename}", upload_resp)
+    return uploaded_url(file_upload_info, upload_resp)
+
+
+async def upload_file_async(session, source, base_url):
+    """
+    Uploads one `UploadSource` with an async session and returns its URL.
+    """
+    file_upload_info = (
+        await session.post(
+            base_url + CREATE_UPLOAD_PATH, json=source.upload_url_request()
+        )
+    ).json()
+
+    mp = source.multipart(file_upload_info)
+    try:
+        upload_resp = await session.post(
+            file_upload_info["s3_bucket_url"], multipart=mp
+        )
+    finally:
+        mp.close()
+
+    if not upload_resp.ok:
+        raise UploadError(f"File upload error for {source.filename}", upload_resp)
+    return uploaded_url(file_upload_info, upload_resp)
+
+
+def upload_files(session, files, base_url, max_workers=4):
+    """
+    Uploads files in parallel threads and returns their URLs in input order.
+
+    Parameters:
+    - session: A curl_cffi `Session`.
+    - files: Dictionary of filename to bytes, path or file object.
+    - base_url: Origin of the Perplexity API.
+    - max_workers: Most uploads in flight at once.
+    """
+    sources = [UploadSource(filename, file) for filename, file in files.items()]
+    if len(sources) <= 1:
+        return [upload_file(session, source, base_url) for source in sources]
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(sources))) as pool:
+        return list(
+            pool.map(lambda source: upload_file(session, source, base_url), sources)
+        )
+
+
+async def upload_files_async(session, files, base_url, max_workers=4):
+    """
+    Uploads files concurrently and returns their URLs in input order.
+
+    Parameters:
+    - session: A curl_cffi `AsyncSession`.
+    - files: Dictionary of filename to bytes, path or file object.
+    - base_url: Origin of the Perplexity API.
+    - max_workers: Most uploads in flight at once.
+    """
+    sources = [UploadSource(filename, file) for filename, file in files.items()]
+    semaphore = asyncio.Semaphore(max_workers)
+
+    async def upload(source):
+        async with semaphore:
+            return await upload_file_async(session, source, base_url)
+
+    return list(await asyncio.gather(*(upload(source) for source in sources)))
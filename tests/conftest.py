@@ -0,0 +1,59 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from functools import partial
+
+import pytest
+import uvicorn
+
+from benchmarks.bench_e2e import free_port
+from benchmarks.fake_upstream import create_app, synthetic_stream
+
+# api.main configures itself from the environment when it is imported, so
+# point its files somewhere disposable before any test imports it
+_data_dir = tempfile.mkdtemp(prefix="perplexity-tests-")
+os.environ.setdefault("PERPLEXITY_DATA_DIR", _data_dir)
+os.environ.setdefault("PERPLEXITY_LOG_MODE", "off")
+os.environ.setdefault(
+    "PERPLEXITY_COOKIES_PATH", os.path.join(_data_dir, "perplexity_cookies.json")
+)
+
+
+@pytest.fixture(scope="session")
+def fake_upstream():
+    """The local stand-in for Perplexity, served from a thread."""
+    app = create_app([synthetic_stream(events=5)])
+    port = free_port()
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=port, log_level="error")
+    )
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    app.state.base_url = f"http://127.0.0.1:{port}"
+    yield app
+    server.should_exit = True
+    thread.join()
+
+
+@pytest.fixture
+def api(fake_upstream, monkeypatch, tmp_path):
+    """api.main with one signed-in account on the fake upstream."""
+    from api import main
+    from api.upstream import Upstream
+    from lib.perplexity import AsyncClient
+
+    cookies_path = tmp_path / "cookies.json"
+    cookies_path.write_text(json.dumps([{"session": "test"}]))
+    upstream = Upstream(
+        str(cookies_path),
+        connections=0,
+        keepalive=0,
+        client_cls=partial(AsyncClient, base_url=fake_upstream.state.base_url),
+    )
+    monkeypatch.setattr(main, "upstream", upstream)
+    fake_upstream.state.queries.clear()
+    return main
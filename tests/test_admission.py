@@ -0,0 +1,121 @@
+import asyncio
+
+import httpx
+import pytest
+
+from api.admission import AdmissionController, AdmissionRejected, parse_limits
+
+
+def test_parse_limits():
+    assert parse_limits("pro=2, auto=8,bogus") == {"pro": 2, "auto": 8}
+    assert parse_limits(None) == {}
+
+
+def test_waiters_are_admitted_by_priority_then_arrival():
+    async def run():
+        admission = AdmissionController(default_limit=1)
+        held = await admission.acquire("auto")
+        admitted = []
+
+        async def wait(name, priority):
+            slot = await admission.acquire("auto", priority)
+            admitted.append(name)
+            slot.release()
+
+        tasks = []
+        for name, priority in [
+            ("batch 1", "batch"),
+            ("interactive 1", "interactive"),
+            ("batch 2", "batch"),
+            ("interactive 2", "interactive"),
+        ]:
+            tasks.append(asyncio.create_task(wait(name, priority)))
+            await asyncio.sleep(0)
+        held.release()
+        await asyncio.wait_for(asyncio.gather(*tasks), 1)
+        return admitted
+
+    assert asyncio.run(run()) == [
+        "interactive 1",
+        "interactive 2",
+        "batch 1",
+        "batch 2",
+    ]
+
+
+def test_release_hands_the_slot_to_the_next_waiter():
+    async def run():
+        admission = AdmissionController(default_limit=1)
+        held = await admission.acquire("auto")
+        waiting = asyncio.create_task(admission.acquire("auto"))
+        await asyncio.sleep(0)
+        assert not waiting.done()
+
+        held.release()
+        # Releasing twice must not free a second slot
+        held.release()
+        slot = await asyncio.wait_for(waiting, 1)
+        lane = admission.lanes["auto"]
+        assert (lane.active, lane.waiters) == (1, [])
+        slot.release()
+        return lane.active
+
+    assert asyncio.run(run()) == 0
+
+
+def test_a_wait_that_runs_out_is_rejected():
+    async def run():
+        admission = AdmissionController(default_limit=1, max_wait=0.05)
+        held = await admission.acquire("auto")
+        with pytest.raises(AdmissionRejected, match="Timed out") as exc_info:
+            await admission.acquire("auto")
+        lane = admission.lanes["auto"]
+        assert lane.waiters == []
+        held.release()
+        assert lane.active == 0
+        return exc_info.value.retry_after
+
+    assert asyncio.run(run()) >= 1
+
+
+def test_a_full_queue_rejects_at_once():
+    async def run():
+        admission = AdmissionController(default_limit=1, queue_size=1)
+        await admission.acquire("auto")
+        waiting = asyncio.create_task(admission.acquire("auto"))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected, match="Too many"):
+            await admission.acquire("auto")
+        waiting.cancel()
+
+    asyncio.run(run())
+
+
+def test_limits_are_per_mode():
+    async def run():
+        admission = AdmissionController({"pro": 1}, default_limit=2, max_wait=0.01)
+        await admission.acquire("pro")
+        with pytest.raises(AdmissionRejected):
+            await admission.acquire("pro")
+        await admission.acquire("auto")
+        await admission.acquire("auto")
+
+    asyncio.run(run())
+
+
+def test_rejected_requests_get_429_with_retry_after(api, monkeypatch):
+    admission = AdmissionController(default_limit=1, max_wait=0.05)
+    monkeypatch.setattr(api, "admission", admission)
+
+    async def run():
+        held = await admission.acquire("auto")
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://api") as c:
+            response = await c.get("/api/query_sync", params={"q": "q"})
+        held.release()
+        return response
+
+    response = asyncio.run(run())
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    assert "Timed out" in response.json()["error"]
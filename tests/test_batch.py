@@ -0,0 +1,21 @@
+import asyncio
+import json
+
+from api import main
+
+
+def test_every_query_reports_even_when_building_it_fails(monkeypatch):
+    async def broken_spec_search(spec, fields, endpoint):
+        raise RuntimeError(f"cannot build {spec.q}")
+
+    monkeypatch.setattr(main, "spec_search", broken_spec_search)
+    specs = [main.BatchQuery(q=f"question {i}") for i in range(3)]
+
+    async def run():
+        stream = main.generate_batch(specs, concurrency=2)
+        return [json.loads(line) async for line in stream]
+
+    records = asyncio.run(asyncio.wait_for(run(), 5))
+    assert sorted(record["index"] for record in records) == [0, 1, 2]
+    assert all(record["status"] == 500 for record in records)
+    assert records[0]["error"].startswith("cannot build")
@@ -0,0 +1,169 @@
+import asyncio
+
+import pytest
+
+from api import cache as cache_module
+from api.cache import MemoryCache, ResponseCache, SingleFlight, cache_key
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, "time", lambda: now[0])
+    return now
+
+
+def test_cache_key_normalizes_equivalent_queries():
+    key = cache_key("What is  Rust?", "auto", None, ["web", "scholar"], "en-US", False)
+    assert key == cache_key(
+        " what is rust? ", "auto", None, ["scholar", "web", "web"], "EN-us", False
+    )
+    assert key != cache_key("What is Rust?", "pro", None, ["web"], "en-US", False)
+    assert key != cache_key("What is Rust?", "auto", None, ["web"], "en-US", True)
+
+
+def test_memory_cache_evicts_least_recently_used(clock):
+    cache = MemoryCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+
+def test_memory_cache_entries_expire(clock):
+    cache = MemoryCache(ttl=10)
+    cache.set("a", 1)
+    clock[0] += 10
+    assert cache.get("a") == 1
+    clock[0] += 1
+    assert cache.get("a") is None
+
+
+def test_disk_hits_are_promoted_until_they_expire(clock, tmp_path):
+    path = str(tmp_path / "cache.db")
+    ResponseCache(ttl=10, path=path).set("a", {"answer": 1})
+
+    cache = ResponseCache(ttl=10, path=path)
+    clock[0] += 5
+    assert cache.get("a") == {"answer": 1}
+    assert cache.memory.get("a") == {"answer": 1}
+    clock[0] += 6
+    assert cache.get("a") is None
+
+
+def collect(stream):
+    async def run():
+        return [event async for event in stream]
+
+    return run()
+
+
+def test_identical_searches_share_one_upstream_stream():
+    calls = []
+
+    async def search():
+        calls.append(1)
+        for i in range(3):
+            await asyncio.sleep(0.01)
+            yield {"seq": i}
+
+    async def run():
+        flights = SingleFlight()
+        results = await asyncio.gather(
+            *(collect(flights.stream("key", search)) for _ in range(5))
+        )
+        return flights, results
+
+    flights, results = asyncio.run(run())
+    assert len(calls) == 1
+    # Every subscriber ends on the final snapshot, though it may skip some
+    assert all(events[-1] == {"seq": 2} for events in results)
+    assert not flights.flights
+
+
+def test_errors_reach_every_subscriber():
+    async def search():
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream failed")
+        yield
+
+    async def run():
+        flights = SingleFlight()
+        return await asyncio.gather(
+            *(collect(flights.stream("key", search)) for _ in range(3)),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_search_is_cancelled_when_every_subscriber_leaves():
+    async def run():
+        stopped = asyncio.Event()
+
+        async def search():
+            try:
+                while True:
+                    yield {}
+                    await asyncio.sleep(0.01)
+            finally:
+                stopped.set()
+
+        flights = SingleFlight()
+        stream = flights.stream("key", search)
+        await anext(stream)
+        await stream.aclose()
+        await asyncio.wait_for(stopped.wait(), 1)
+        await asyncio.sleep(0)
+        return flights
+
+    assert not asyncio.run(run()).flights
+
+
+def test_a_finished_search_is_not_reused():
+    calls = []
+
+    async def search():
+        calls.append(1)
+        yield {"n": len(calls)}
+
+    async def run():
+        flights = SingleFlight()
+        first = await collect(flights.stream("key", search))
+        second = await collect(flights.stream("key", search))
+        return first, second
+
+    assert asyncio.run(run()) == ([{"n": 1}], [{"n": 2}])
+
+
+def test_search_started_while_the_last_one_winds_down_is_fresh():
+    async def run():
+        calls = []
+        release = asyncio.Event()
+
+        async def search():
+            calls.append(1)
+            try:
+                for i in range(3):
+                    yield {"n": len(calls), "seq": i}
+                    await asyncio.sleep(0.01)
+            finally:
+                # Releasing the account and the shared claim takes a while
+                await release.wait()
+
+        flights = SingleFlight()
+        stream = flights.stream("key", search)
+        await anext(stream)
+        await stream.aclose()
+        events = asyncio.create_task(collect(flights.stream("key", search)))
+        await asyncio.sleep(0.05)
+        release.set()
+        return calls, await asyncio.wait_for(events, 1)
+
+    calls, events = asyncio.run(run())
+    assert len(calls) == 2
+    assert events[-1] == {"n": 2, "seq": 2}
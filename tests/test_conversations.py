@@ -0,0 +1,88 @@
+import asyncio
+
+import httpx
+
+
+def request(main, calls):
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://api") as c:
+            return [await call(c) for call in calls]
+
+    return asyncio.run(run())
+
+
+def test_follow_up_keeps_the_files_of_earlier_turns(api, fake_upstream):
+    first, second = request(
+        api,
+        [
+            lambda c: c.post(
+                "/api/query_upload",
+                data={"q": "Summarize this", "conversation_id": "c1"},
+                files=[("files", ("report.txt", b"numbers"))],
+            ),
+            lambda c: c.get(
+                "/api/query_sync",
+                params={"q": "And the totals?", "conversation_id": "c1"},
+            ),
+        ],
+    )
+    assert first.status_code == 200
+    assert second.status_code == 200
+
+    sent = [query["params"] for query in fake_upstream.state.queries]
+    uploaded = sent[0]["attachments"]
+    assert len(uploaded) == 1 and uploaded[0].endswith("/report.txt")
+    assert sent[1]["attachments"] == uploaded
+    assert sent[1]["last_backend_uuid"] == first.json()["backend_uuid"]
+    assert api.conversations.get("c1").attachments == uploaded
+
+
+def test_new_files_are_added_to_the_conversation(api, fake_upstream):
+    request(
+        api,
+        [
+            lambda c: c.post(
+                "/api/query_upload",
+                data={"q": "Read this", "conversation_id": "c2"},
+                files=[("files", ("a.txt", b"a"))],
+            ),
+            lambda c: c.post(
+                "/api/query_upload",
+                data={"q": "And this", "conversation_id": "c2"},
+                files=[("files", ("b.txt", b"b"))],
+            ),
+            lambda c: c.get(
+                "/api/query_sync", params={"q": "Compare them", "conversation_id": "c2"}
+            ),
+        ],
+    )
+    first, second, third = [query["params"] for query in fake_upstream.state.queries]
+    # The second turn sends its own file, then the one the thread already has
+    assert second["attachments"][1:] == first["attachments"]
+    assert sorted(third["attachments"]) == sorted(second["attachments"])
+    assert len(api.conversations.get("c2").attachments) == 2
+
+
+def test_a_conversation_on_a_removed_account_is_gone(api):
+    from api.sessions import Conversation
+
+    api.conversations.save(Conversation("c3", backend_uuid="uuid", account="gone"))
+    sync, chat = request(
+        api,
+        [
+            lambda c: c.get(
+                "/api/query_sync", params={"q": "Still there?", "conversation_id": "c3"}
+            ),
+            lambda c: c.post(
+                "/v1/chat/completions",
+                json={
+                    "messages": [{"role": "user", "content": "Still there?"}],
+                    "conversation_id": "c3",
+                },
+            ),
+        ],
+    )
+    assert sync.status_code == 410
+    assert "no longer in the pool" in sync.json()["error"]
+    assert chat.status_code == 410
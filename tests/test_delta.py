@@ -0,0 +1,91 @@
+import asyncio
+import json
+
+import httpx
+
+from api.utils import AnswerDelta
+
+
+def event(chunks, progress="IN_PROGRESS", answer=None):
+    markdown_block = {"progress": progress, "chunks": chunks}
+    if answer is not None:
+        markdown_block["answer"] = answer
+    return {
+        "backend_uuid": "uuid",
+        "blocks": [{"intended_usage": "ask_text", "markdown_block": markdown_block}],
+    }
+
+
+def deltas(*events):
+    answer_delta = AnswerDelta()
+    updates = [answer_delta.update(res, "f") for res in events]
+    return [
+        None if update is None else (update["delta"], update["reset"])
+        for update in updates
+    ], answer_delta
+
+
+def test_appended_text_is_sent_once():
+    updates, answer_delta = deltas(
+        event(["Rust "]), event(["Rust "]), event(["Rust ", "is ", "fast."])
+    )
+    assert updates == [("Rust ", False), None, ("is fast.", False)]
+    assert answer_delta.final(None, "f")["answer"] == "Rust is fast."
+
+
+def test_a_shorter_answer_starts_over():
+    updates, answer_delta = deltas(event(["a", "b", "c"]), event(["x"]))
+    assert updates == [("abc", False), ("x", True)]
+    assert answer_delta.final(None, "f")["answer"] == "x"
+
+
+def test_a_rewrite_that_is_not_a_prefix_starts_over():
+    # As long as or longer than what was sent, but with different text
+    updates, answer_delta = deltas(
+        event(["Rust ", "is "]), event(["Go ", "is ", "simple."])
+    )
+    assert updates == [("Rust is ", False), ("Go is simple.", True)]
+    assert answer_delta.final(None, "f")["answer"] == "Go is simple."
+
+
+def test_a_reset_without_text_is_sent_with_the_next_delta():
+    updates, _ = deltas(event(["a"]), event([]), event(["b"]))
+    assert updates == [("a", False), None, ("b", True)]
+
+
+def test_an_empty_answer():
+    updates, answer_delta = deltas(event([]), event([], "DONE", answer=""))
+    assert updates == [None, None]
+    final = answer_delta.final(event([], "DONE", answer=""), "f")
+    assert final == {"progress": "DONE", "answer": "", "backend_uuid": "uuid"}
+    # A stream that ended before any answer block
+    assert AnswerDelta().final(None, "f")["answer"] == ""
+
+
+def test_the_final_answer_comes_from_the_done_block():
+    updates, answer_delta = deltas(
+        event(["Rust"]), event(["Rust"], "DONE", answer="Rust!"), event(["more"])
+    )
+    # Nothing is sent once the answer is done
+    assert updates == [("Rust", False), None, None]
+    done = event(["Rust"], "DONE", answer="Rust!")
+    assert answer_delta.final(done, "f")["answer"] == "Rust!"
+
+
+def test_delta_stream_adds_up_to_the_answer(api):
+    async def run():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://api") as c:
+            params = {"q": "delta", "stream_mode": "delta", "cache": False}
+            return (await c.get("/api/query_async", params=params)).text
+
+    events = [
+        json.loads(line[6:])
+        for line in asyncio.run(run()).splitlines()
+        if line.startswith("data: ")
+    ]
+    text = "".join(e["content"]["delta"] for e in events if e["type"] == "delta")
+    final = events[-2]["content"]
+    assert text and final["progress"] == "DONE"
+    assert final["answer"].startswith(text)
+    assert events[-1] == {"type": "content", "content": "", "done": True}
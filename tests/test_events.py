@@ -0,0 +1,86 @@
+import json
+
+import pytest
+
+from lib import events
+from lib.events import parse_event
+from lib.sse import parse_message
+
+
+@pytest.fixture(params=["msgspec", "json"])
+def backend(request, monkeypatch):
+    """Runs a test with msgspec, and again with the standard library fallback."""
+    if request.param == "msgspec":
+        if events.msgspec is None:
+            pytest.skip("msgspec is not installed")
+    else:
+        monkeypatch.setattr(events, "msgspec", None)
+    return request.param
+
+
+def payload(progress="IN_PROGRESS", chunks=("Rust ", "is fast."), answer=None):
+    markdown_block = {"progress": progress, "chunks": list(chunks)}
+    if answer is not None:
+        markdown_block["answer"] = answer
+    return json.dumps(
+        {
+            "backend_uuid": "uuid",
+            "status": "PENDING",
+            "text": json.dumps([{"step_type": "FINAL"}]),
+            "blocks": [
+                {"intended_usage": "pro_search_steps", "plan_block": {"goals": []}},
+                {"intended_usage": "ask_text", "markdown_block": markdown_block},
+                {
+                    "intended_usage": "web_results",
+                    "web_result_block": {
+                        "web_results": [{"url": "https://a"}, {"url": "https://b"}]
+                    },
+                },
+            ],
+        }
+    ).encode()
+
+
+def test_hot_fields(backend):
+    event = parse_event(payload())
+    assert (event.backend_uuid, event.status) == ("uuid", "PENDING")
+    assert (event.progress, event.answer) == ("IN_PROGRESS", "Rust is fast.")
+    assert event.citations == ["https://a", "https://b"]
+
+
+def test_the_consolidated_answer_wins_once_done(backend):
+    event = parse_event(payload("DONE", ["partial"], answer="Final answer."))
+    assert event.answer == "Final answer."
+
+
+def test_the_rest_is_decoded_on_first_access(backend):
+    data = payload()
+    event = parse_event(data)
+    assert event._data is None
+    assert event.data == parse_message(data)
+    assert event.data["text"] == [{"step_type": "FINAL"}]
+    assert event.data is event.data
+
+
+def test_unexpected_shapes_are_skipped(backend):
+    data = json.dumps(
+        {
+            "backend_uuid": "uuid",
+            "blocks": [
+                "oops",
+                {"intended_usage": "ask_text", "markdown_block": "oops"},
+                {
+                    "intended_usage": "ask_text",
+                    "markdown_block": {"progress": "DONE", "chunks": ["a"]},
+                },
+            ],
+        }
+    ).encode()
+    event = parse_event(data)
+    assert (event.backend_uuid, event.progress, event.answer) == ("uuid", "DONE", "a")
+    assert event.citations == []
+
+
+def test_an_event_without_blocks(backend):
+    event = parse_event(b'{"status": "COMPLETED"}')
+    assert (event.status, event.progress, event.answer) == ("COMPLETED", None, "")
@@ -0,0 +1,136 @@
+import asyncio
+
+import httpx
+import pytest
+
+from api.utils import BlockExtractor, extract_answer, parse_fields
+
+
+def event(chunks, progress="IN_PROGRESS", answer=None, results=(), related=None):
+    markdown_block = {"progress": progress, "chunks": chunks}
+    if answer is not None:
+        markdown_block["answer"] = answer
+    res = {
+        "backend_uuid": "uuid",
+        "blocks": [
+            {"intended_usage": "ask_text", "markdown_block": markdown_block},
+            {
+                "intended_usage": "web_results",
+                "web_result_block": {
+                    "progress": progress,
+                    "web_results": [{"url": url} for url in results],
+                },
+            },
+        ],
+    }
+    if related is not None:
+        res["related_queries"] = related
+    return res
+
+
+def test_parse_fields():
+    assert parse_fields(None) is None
+    assert parse_fields(None, answer_only=True) == ["answer"]
+    assert parse_fields(" answer, images,answer ") == ["answer", "images"]
+    # An explicit projection wins over answer_only
+    assert parse_fields("web_results", answer_only=True) == ["web_results"]
+    with pytest.raises(ValueError, match="Unknown fields: sources"):
+        parse_fields("answer,sources")
+    with pytest.raises(ValueError):
+        parse_fields(",")
+    # Delta mode streams only the answer, so other fields are rejected
+    assert parse_fields("answer", stream_mode="delta") == ["answer"]
+    assert parse_fields(None, answer_only=True, stream_mode="delta") == ["answer"]
+    with pytest.raises(ValueError, match="delta"):
+        parse_fields("answer,web_results", stream_mode="delta")
+
+
+def test_projection_holds_only_the_requested_fields():
+    extractor = BlockExtractor(["web_results", "related_questions"])
+    projection = extractor.extract(
+        event(["a"], results=["u1"], related=[{"text": "q1"}, "q2"]), "f"
+    )
+    assert projection == {
+        "web_results": [{"url": "u1"}],
+        "related_questions": ["q1", "q2"],
+        "backend_uuid": "uuid",
+    }
+
+
+def test_missing_fields_are_null():
+    projection = BlockExtractor(["answer", "images"]).extract(event(["a"]), "f")
+    assert projection == {
+        "progress": "IN_PROGRESS",
+        "answer": "a",
+        "images": None,
+        "backend_uuid": "uuid",
+    }
+
+
+def test_update_reports_only_changes():
+    extractor = BlockExtractor(["answer", "web_results"])
+    assert extractor.update(event(["a"]), "f")["answer"] == "a"
+    assert extractor.update(event(["a"]), "f") is None
+    assert extractor.update(event(["a"], results=["u1"]), "f")["web_results"] == [
+        {"url": "u1"}
+    ]
+    assert extractor.update(event(["a", "b"], results=["u1"]), "f")["answer"] == "ab"
+
+
+def test_a_list_updated_in_place_counts_as_changed():
+    extractor = BlockExtractor(["web_results"])
+    extractor.update(event(["a"], results=["u1", "u2"]), "f")
+    changed = extractor.update(event(["a"], results=["u1", "u3"]), "f")
+    assert changed["web_results"] == [{"url": "u1"}, {"url": "u3"}]
+    assert extractor.update(event(["a"], results=["u1", "u3"]), "f") is None
+
+
+def test_answer_is_joined_again_when_rewritten():
+    extractor = BlockExtractor(["answer"])
+    extractor.update(event(["a", "b", "c"]), "f")
+    assert extractor.update(event(["x"]), "f")["answer"] == "x"
+    done = extractor.update(event(["x", "y"], "DONE", answer="xy!"), "f")
+    assert done["progress"] == "DONE"
+    assert done["answer"] == "xy!"
+
+
+def test_extract_answer_matches_a_fresh_extractor():
+    res = event(["Rust ", "is fast."], "DONE", answer="Rust is fast.")
+    assert extract_answer(res, "f") == {
+        "progress": "DONE",
+        "answer": "Rust is fast.",
+        "backend_uuid": "uuid",
+    }
+
+
+def test_unexpected_blocks_are_skipped(capsys):
+    res = {"blocks": [{"intended_usage": "ask_text", "markdown_block": "oops"}]}
+    assert BlockExtractor(["answer"]).extract(res, "f") == {
+        "answer": None,
+        "backend_uuid": None,
+    }
+    assert "Unexpected answer block format" in capsys.readouterr().out
+
+
+def test_endpoints_return_the_projection(api):
+    async def run():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://api") as c:
+            sync = await c.get(
+                "/api/query_sync",
+                params={"q": "fields", "fields": "answer,web_results", "cache": False},
+            )
+            bad = await c.get("/api/query_sync", params={"q": "x", "fields": "nope"})
+            delta = await c.get(
+                "/api/query_async",
+                params={"q": "x", "fields": "web_results", "stream_mode": "delta"},
+            )
+            return sync, bad, delta
+
+    sync, bad, delta = asyncio.run(run())
+    assert sync.status_code == 200
+    assert set(sync.json()) == {"progress", "answer", "web_results", "backend_uuid"}
+    assert sync.json()["progress"] == "DONE"
+    assert bad.status_code == 400
+    assert delta.status_code == 400
+    assert "delta" in delta.json()["error"]
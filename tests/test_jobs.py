@@ -0,0 +1,123 @@
+import os
+import sys
+import json
+import asyncio
+import subprocess
+
+import httpx
+
+from api.jobs import Job, JobStore
+
+
+def events_after(job, last_id):
+    async def run():
+        return [seq async for seq, _ in job.events(last_id)]
+
+    return run()
+
+
+def test_resume_gets_the_missed_events():
+    async def run():
+        job = Job(replay=3)
+        for i in range(6):
+            await job.publish({"n": i})
+        await job.finish("done")
+        return await events_after(job, 2), await events_after(job, 6)
+
+    # Events 3 to 6 were missed, but only the last 3 are kept
+    assert asyncio.run(run()) == ([4, 5, 6], [])
+
+
+def test_a_client_too_far_behind_gets_the_latest_snapshot():
+    async def run():
+        job = Job(replay=0)
+        for i in range(3):
+            await job.publish({"n": i})
+        await job.finish("done")
+        return [event async for event in job.events(1)]
+
+    assert asyncio.run(run()) == [(3, {"n": 2})]
+
+
+def test_followers_see_events_published_later():
+    async def run():
+        job = Job()
+        follower = asyncio.create_task(events_after(job, 0))
+        for i in range(3):
+            await asyncio.sleep(0)
+            await job.publish({"n": i})
+        await job.finish("done")
+        return await asyncio.wait_for(follower, 1)
+
+    assert asyncio.run(run()) == [1, 2, 3]
+
+
+def test_finished_jobs_are_read_back_from_disk(tmp_path):
+    async def run():
+        store = JobStore(path=str(tmp_path / "jobs.db"))
+        job = await store.create("q", "auto")
+        await job.publish({"answer": "a"})
+        await store.finish(job, "done")
+        return job.id
+
+    job_id = asyncio.run(run())
+    job = asyncio.run(JobStore(path=str(tmp_path / "jobs.db")).get(job_id))
+    assert (job.status, job.seq, job.result) == ("done", 1, {"answer": "a"})
+
+
+def sse_ids(text):
+    return [int(line[4:]) for line in text.splitlines() if line.startswith("id: ")], [
+        json.loads(line[6:]) for line in text.splitlines() if line.startswith("data: ")
+    ]
+
+
+def test_job_events_resume_after_last_event_id(api):
+    async def run():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://api") as c:
+            job = (await c.post("/api/jobs", json={"q": "long", "cache": False})).json()
+            events = f"/api/jobs/{job['id']}/events"
+            full = await c.get(events)
+            resumed = await c.get(events, headers={"Last-Event-ID": "3"})
+            invalid = await c.get(events, headers={"Last-Event-ID": "x"})
+            status = await c.get(f"/api/jobs/{job['id']}")
+            return full, resumed, invalid, status
+
+    full, resumed, invalid, status = asyncio.run(run())
+    ids, data = sse_ids(full.text)
+    assert ids == [1, 2, 3, 4, 5, 5]
+    assert data[-1] == {"type": "content", "content": "", "done": True}
+    resumed_ids, resumed_data = sse_ids(resumed.text)
+    assert resumed_ids == [4, 5, 5]
+    assert resumed_data[:2] == data[3:5]
+    assert invalid.status_code == 400
+    assert status.json()["status"] == "done"
+
+
+def test_too_many_jobs_asks_to_retry_later(api, monkeypatch):
+    monkeypatch.setattr(api, "job_limit", 0)
+
+    async def run():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://api") as c:
+            return await c.post("/api/jobs", json={"q": "long"})
+
+    response = asyncio.run(run())
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == str(api.job_retry_after)
+
+
+def test_creating_a_store_does_not_touch_the_disk(tmp_path):
+    JobStore(path=str(tmp_path / "data" / "jobs.db"))
+    assert not (tmp_path / "data").exists()
+
+
+def test_importing_the_app_does_not_touch_the_disk(tmp_path):
+    data_dir = tmp_path / "data"
+    env = {**os.environ, "PERPLEXITY_DATA_DIR": str(data_dir)}
+    env.pop("PERPLEXITY_STATE_PATH", None)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.run(
+        [sys.executable, "-c", "import api.main"], cwd=root, env=env, check=True
+    )
+    assert not data_dir.exists()
@@ -0,0 +1,70 @@
+import copy
+import json
+
+import pytest
+
+from lib.jsonpatch import apply_patch, make_patch
+
+SNAPSHOTS = [
+    {"status": "PENDING", "blocks": []},
+    {
+        "status": "PENDING",
+        "blocks": [{"intended_usage": "ask_text", "chunks": ["Rust "]}],
+    },
+    {
+        "status": "PENDING",
+        "blocks": [{"intended_usage": "ask_text", "chunks": ["Rust ", "is "]}],
+        "a/b~c": 1,
+    },
+    {
+        "status": "COMPLETED",
+        "blocks": [{"intended_usage": "ask_text", "chunks": ["Rust is fast."]}],
+        "a/b~c": [1, 2],
+        "backend_uuid": "uuid",
+    },
+    {"status": "COMPLETED", "blocks": None, "backend_uuid": "uuid"},
+]
+
+
+def test_patches_rebuild_every_snapshot():
+    state = None
+    previous = None
+    for snapshot in SNAPSHOTS:
+        if previous is None:
+            state = copy.deepcopy(snapshot)
+        else:
+            # Patches travel as JSON, so rebuild from what a client would read
+            patch = json.loads(json.dumps(make_patch(previous, snapshot)))
+            state = apply_patch(state, patch, in_place=True)
+        assert state == snapshot
+        previous = snapshot
+
+
+def test_equal_snapshots_give_an_empty_patch():
+    assert make_patch(SNAPSHOTS[2], copy.deepcopy(SNAPSHOTS[2])) == []
+
+
+def test_type_changes_are_replaced():
+    assert make_patch({"a": 1}, {"a": 1.0}) == [
+        {"op": "replace", "path": "/a", "value": 1.0}
+    ]
+    assert make_patch([1], {"0": 1}) == [
+        {"op": "replace", "path": "", "value": {"0": 1}}
+    ]
+
+
+def test_shrinking_list_removes_from_the_end():
+    patch = make_patch([1, 2, 3, 4], [1, 5])
+    assert apply_patch([1, 2, 3, 4], patch) == [1, 5]
+
+
+def test_apply_copies_unless_in_place():
+    doc = {"a": [1]}
+    patched = apply_patch(doc, [{"op": "add", "path": "/a/-", "value": 2}])
+    assert patched == {"a": [1, 2]}
+    assert doc == {"a": [1]}
+
+
+def test_unsupported_operation_is_rejected():
+    with pytest.raises(ValueError):
+        apply_patch({"a": 1}, [{"op": "move", "from": "/a", "path": "/b"}])
@@ -0,0 +1,120 @@
+import os
+import gzip
+import json
+
+import pytest
+
+from api import logger as logger_module
+from api.logger import ResponseLogger
+
+
+def records(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def log_request(response_logger, events, endpoint="query_sync"):
+    request_log = response_logger.open(endpoint)
+    for event in events:
+        request_log.write(event)
+    request_log.close()
+    return request_log
+
+
+def test_every_event_is_written(tmp_path):
+    response_logger = ResponseLogger(str(tmp_path), flush_interval=0.01)
+    request_log = log_request(response_logger, [{"n": 1}, {"n": 2}])
+    response_logger.close()
+
+    written = records(tmp_path / "responses.jsonl")
+    assert [(r["seq"], r["final"], r["event"]) for r in written] == [
+        (1, False, {"n": 1}),
+        (2, False, {"n": 2}),
+    ]
+    assert {r["request_id"] for r in written} == {request_log.request_id}
+    assert {r["endpoint"] for r in written} == {"query_sync"}
+
+
+def test_final_mode_writes_only_the_last_event(tmp_path):
+    response_logger = ResponseLogger(str(tmp_path), mode="final", flush_interval=0.01)
+    log_request(response_logger, [{"n": 1}, {"n": 2}, {"n": 3}])
+    # A request without events writes nothing
+    log_request(response_logger, [])
+    response_logger.close()
+
+    [record] = records(tmp_path / "responses.jsonl")
+    assert (record["seq"], record["final"], record["event"]) == (3, True, {"n": 3})
+
+
+def test_off_mode_writes_nothing(tmp_path):
+    response_logger = ResponseLogger(str(tmp_path), mode="off")
+    request_log = log_request(response_logger, [{"n": 1}])
+    response_logger.close()
+    # Events are still counted, for the file names of extracted answers
+    assert request_log.seq == 1
+    assert os.listdir(tmp_path) == []
+
+
+def test_requests_are_sampled_as_a_whole(tmp_path, monkeypatch):
+    draws = iter([0.1, 0.9, 0.3])
+    monkeypatch.setattr(logger_module.random, "random", lambda: next(draws))
+    response_logger = ResponseLogger(
+        str(tmp_path), sample_rate=0.5, flush_interval=0.01
+    )
+    logged = [
+        log_request(response_logger, [{"n": 1}, {"n": 2}], endpoint=f"e{i}")
+        for i in range(3)
+    ]
+    response_logger.close()
+
+    assert [request_log.sampled for request_log in logged] == [True, False, True]
+    assert [r["endpoint"] for r in records(tmp_path / "responses.jsonl")] == [
+        "e0",
+        "e0",
+        "e2",
+        "e2",
+    ]
+
+
+def batch(*ns):
+    return [{"seq": n, "event": {"n": n}} for n in ns]
+
+
+@pytest.mark.parametrize("compress", [True, False])
+def test_the_log_rotates_by_size(tmp_path, compress):
+    response_logger = ResponseLogger(str(tmp_path), max_bytes=1, compress=compress)
+    response_logger._write(batch(1, 2))
+    response_logger._write(batch(3))
+    response_logger._file.close()
+
+    [rotated] = [name for name in os.listdir(tmp_path) if name.startswith("responses-")]
+    if compress:
+        assert rotated.endswith(".jsonl.gz")
+        with gzip.open(tmp_path / rotated, "rt", encoding="utf-8") as f:
+            old = [json.loads(line) for line in f]
+    else:
+        assert rotated.endswith(".jsonl")
+        old = records(tmp_path / rotated)
+    assert [r["seq"] for r in old] == [1, 2]
+    assert [r["seq"] for r in records(tmp_path / "responses.jsonl")] == [3]
+
+
+def test_the_log_rotates_by_age(tmp_path):
+    response_logger = ResponseLogger(str(tmp_path), max_age=3600)
+    response_logger._write(batch(1))
+    response_logger._write(batch(2))
+    response_logger._opened_at -= 3600
+    response_logger._write(batch(3))
+    response_logger._file.close()
+
+    assert len(os.listdir(tmp_path)) == 2
+    assert [r["seq"] for r in records(tmp_path / "responses.jsonl")] == [3]
+
+
+def test_per_process_files(tmp_path):
+    response_logger = ResponseLogger(
+        str(tmp_path), per_process=True, flush_interval=0.01
+    )
+    log_request(response_logger, [{"n": 1}])
+    response_logger.close()
+    assert os.listdir(tmp_path) == [f"responses.{os.getpid()}.jsonl"]
@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+from benchmarks.bench_memory import ReplayResponse, make_frames, peak_memory
+from lib.hooks import SearchHooks
+from lib.perplexity import AsyncClient
+
+
+def test_peak_memory_is_bounded_when_keeping_the_latest_chunk():
+    for events in (200, 800):
+        frames = make_frames(events)
+        peak = asyncio.run(peak_memory(frames, keep_chunks=1))
+        # Tracks the largest event, not the length of the stream
+        assert peak < 50 * max(map(len, frames))
+    assert peak < sum(map(len, frames)) / 10
+
+
+def test_peak_memory_grows_when_keeping_every_chunk():
+    frames = make_frames(800)
+    peak = asyncio.run(peak_memory(frames, keep_chunks=None))
+    assert peak > sum(map(len, frames))
+
+
+def test_keep_chunks_must_keep_something():
+    with pytest.raises(ValueError):
+        AsyncClient({}, keep_chunks=0)
+
+
+class Collect(SearchHooks):
+    def __init__(self):
+        self.chunks = []
+
+    def on_stream_end(self, search, seconds):
+        self.chunks.append(list(search.chunks))
+
+
+def test_concurrent_searches_keep_their_own_chunks():
+    async def run():
+        client = AsyncClient({}, keep_chunks=None)
+        client._session_ready = True
+        frames = {"first": make_frames(3), "second": make_frames(5)}
+
+        async def post(*args, json, **kwargs):
+            return ReplayResponse(frames[json["query_str"]])
+
+        client.session.post = post
+        hooks = Collect()
+        results = await asyncio.gather(
+            client.search("first", hooks=hooks), client.search("second", hooks=hooks)
+        )
+        await client.close()
+        return results, hooks.chunks
+
+    results, chunks = asyncio.run(run())
+    assert sorted(map(len, chunks)) == [3, 5]
+    assert [len(r["blocks"][0]["markdown_block"]["chunks"]) for r in results] == [3, 5]
@@ -0,0 +1,163 @@
+import asyncio
+
+import httpx
+
+from api.utils import decode_cursor, encode_cursor
+from lib.mirror import ThreadMirror
+
+
+class Account:
+    """An account's threads, served the way AsyncClient pages them."""
+
+    def __init__(self, threads):
+        # slug -> (list item, entries)
+        self.threads = threads
+        self.detail_requests = []
+        self.list_requests = 0
+
+    async def get_threads(self, limit=20, offset=0, search_term=""):
+        self.list_requests += 1
+        items = [item for item, _ in self.threads.values()]
+        return items[offset : offset + limit]
+
+    async def get_thread_details_by_slug(self, slug, query_params=None):
+        self.detail_requests.append(slug)
+        entries = self.threads[slug][1]
+        limit = query_params["limit"]
+        return {
+            "entries": entries[:limit],
+            "has_next_page": len(entries) > limit,
+        }
+
+    async def iter_thread_entries(self, slug, page_size=100, offset=0):
+        for entry in self.threads[slug][1][offset:]:
+            yield entry
+
+
+def thread(n, answer="", entries=1):
+    item = {
+        "slug": f"thread-{n}",
+        "title": f"Thread {n}",
+        "last_query_datetime": f"2024-01-{n:02d}",
+    }
+    entries = [
+        {
+            "query_str": f"question {n}.{i}",
+            "blocks": [
+                {"intended_usage": "ask_text", "markdown_block": {"answer": answer}}
+            ],
+        }
+        for i in range(entries)
+    ]
+    return item["slug"], (item, entries)
+
+
+def newest_first(*threads):
+    return dict(sorted(threads, key=lambda t: t[1][0]["last_query_datetime"])[::-1])
+
+
+def test_sync_mirrors_threads_and_their_entries(tmp_path):
+    mirror = ThreadMirror(str(tmp_path / "threads.db"))
+    account = Account(newest_first(thread(1, entries=250), thread(2), thread(3)))
+
+    asyncio.run(mirror.sync(account, page_size=2))
+
+    assert [t["slug"] for t in mirror.list_threads()] == [
+        "thread-3",
+        "thread-2",
+        "thread-1",
+    ]
+    assert [t["slug"] for t in mirror.list_threads(limit=1, offset=1)] == ["thread-2"]
+    # Entries past the first page of details are fetched too
+    assert len(mirror.get_thread("thread-1")["entries"]) == 250
+    assert mirror.get_thread("missing") is None
+
+
+def test_incremental_sync_fetches_only_changed_threads(tmp_path):
+    mirror = ThreadMirror(str(tmp_path / "threads.db"))
+    account = Account(newest_first(thread(1), thread(2)))
+    asyncio.run(mirror.sync(account))
+
+    account.threads = newest_first(thread(1), thread(2), thread(3))
+    account.detail_requests.clear()
+    assert asyncio.run(mirror.sync(account)) == ["thread-3"]
+    assert account.detail_requests == ["thread-3"]
+
+
+def test_full_sync_drops_deleted_threads(tmp_path):
+    mirror = ThreadMirror(str(tmp_path / "threads.db"))
+    account = Account(newest_first(thread(1), thread(2)))
+    asyncio.run(mirror.sync(account))
+
+    del account.threads["thread-1"]
+    asyncio.run(mirror.sync(account, full=True))
+    assert [t["slug"] for t in mirror.list_threads()] == ["thread-2"]
+    assert mirror.get_thread("thread-1") is None
+
+
+def test_full_text_search_covers_titles_queries_and_answers(tmp_path):
+    mirror = ThreadMirror(str(tmp_path / "threads.db"))
+    account = Account(
+        newest_first(thread(1, answer="Rust has no garbage collector"), thread(2))
+    )
+    asyncio.run(mirror.sync(account))
+
+    def search(term):
+        return [t["slug"] for t in mirror.list_threads(search_term=term)]
+
+    assert search("garbage") == ["thread-1"]
+    assert search("question 2.0") == ["thread-2"]
+    assert sorted(search("Thread")) == ["thread-1", "thread-2"]
+    # Quotes and FTS operators are searched for, not parsed
+    assert search('garbage" OR "thread') == []
+
+
+def test_an_account_without_threads_counts_as_synced(tmp_path):
+    mirror = ThreadMirror(str(tmp_path / "threads.db"))
+    assert mirror.synced_at() is None
+    asyncio.run(mirror.sync(Account({})))
+    assert mirror.synced_at() is not None
+    # A new mirror on the same file remembers it
+    assert ThreadMirror(mirror.path).synced_at() is not None
+
+
+def test_creating_a_mirror_does_not_touch_the_disk(tmp_path):
+    ThreadMirror(str(tmp_path / "data" / "threads.db"))
+    assert not (tmp_path / "data").exists()
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(150)) == 150
+
+
+def test_threads_endpoints_sync_once_and_page_entries(api, monkeypatch, tmp_path):
+    mirror = ThreadMirror(str(tmp_path / "threads.db"))
+    monkeypatch.setattr(api, "thread_mirror", mirror)
+    account = Account(newest_first(thread(1, entries=5), thread(2)))
+    monkeypatch.setattr(api.upstream.pool.primary, "client", account)
+
+    async def run():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://api") as c:
+            listed = [(await c.get("/api/threads")).json() for _ in range(2)]
+            pages, cursor = [], None
+            while True:
+                params = {"limit": 2} if cursor is None else {"cursor": cursor}
+                page = (await c.get("/api/threads/thread-1", params=params)).json()
+                pages.append([e["query_str"] for e in page["entries"]])
+                cursor = page["next_cursor"]
+                if cursor is None:
+                    break
+            bad = await c.get("/api/threads/thread-1", params={"cursor": "!"})
+        return listed, pages, bad
+
+    listed, pages, bad = asyncio.run(run())
+    assert [t["slug"] for t in listed[0]] == ["thread-2", "thread-1"]
+    assert listed[1] == listed[0]
+    assert account.list_requests == 1
+    # Without `limit`, later pages keep the default page size
+    assert pages == [
+        ["question 1.0", "question 1.1"],
+        ["question 1.2", "question 1.3", "question 1.4"],
+    ]
+    assert bad.status_code == 400
@@ -0,0 +1,69 @@
+import pytest
+
+from lib import pool as pool_module
+from lib.pool import AccountGone, ClientPool, NoAccountAvailable
+from lib.shared import SharedState
+
+
+def spend(pool, mode="pro"):
+    """Runs one query the way the clients account for it."""
+    with pool.lease(mode) as account:
+        account.client.copilot -= 1
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(pool_module.time, "time", lambda: now[0])
+    return now
+
+
+def test_quota_is_refilled_after_cooldown(clock):
+    pool = ClientPool([{"session": "a"}], pro_quota=2, exhausted_cooldown=60)
+    spend(pool)
+    spend(pool)
+    with pytest.raises(NoAccountAvailable) as exc_info:
+        pool.acquire("pro")
+    assert exc_info.value.retry_after == 60
+
+    clock[0] += 59
+    with pytest.raises(NoAccountAvailable):
+        pool.acquire("pro")
+
+    clock[0] += 1
+    account = pool.acquire("pro")
+    assert account.client.copilot == 2
+
+
+def test_a_query_pinned_to_a_removed_account_fails_at_once():
+    pool = ClientPool([{"session": "a"}])
+    with pytest.raises(AccountGone, match="no longer in the pool") as exc_info:
+        pool.acquire(account="gone")
+    assert exc_info.value.retry_after is None
+    # Unpinned queries still run
+    pool.release(pool.acquire())
+
+
+def test_anonymous_accounts_get_no_quota(clock):
+    pool = ClientPool(anonymous=1, pro_quota=2, exhausted_cooldown=60)
+    clock[0] += 3600
+    with pytest.raises(NoAccountAvailable):
+        pool.acquire("pro")
+
+
+def test_shared_quota_is_refilled_after_cooldown(clock, tmp_path):
+    state = SharedState(str(tmp_path / "state.db"))
+    pool = ClientPool(
+        [{"session": "a"}], state=state, pro_quota=1, exhausted_cooldown=60
+    )
+    pool.release(pool.acquire("pro"))
+    other = ClientPool(
+        [{"session": "a"}], state=state, pro_quota=1, exhausted_cooldown=60
+    )
+    with pytest.raises(NoAccountAvailable):
+        other.acquire("pro")
+
+    clock[0] += 60
+    other.release(other.acquire("pro"))
+    with pytest.raises(NoAccountAvailable):
+        pool.acquire("pro")
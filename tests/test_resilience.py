@@ -0,0 +1,214 @@
+import json
+import asyncio
+import threading
+
+import pytest
+from curl_cffi.requests.exceptions import (
+    ConnectionError,
+    ConnectTimeout,
+    HTTPError,
+    RequestException,
+)
+
+from lib.perplexity import AsyncClient, Client
+from lib.resilience import Resilience, UpstreamTimeout
+
+
+class Status:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+def http_error(status):
+    return HTTPError(f"HTTP {status}", response=Status(status))
+
+
+@pytest.mark.parametrize(
+    "error, new_query, follow_up",
+    [
+        (http_error(502), True, False),
+        (http_error(429), False, False),
+        (http_error(404), False, False),
+        (RequestException("reset", code=56), True, False),
+        (ConnectTimeout("slow connect"), True, True),
+        (ConnectionError("refused", code=7), True, True),
+        (UpstreamTimeout("silent"), True, False),
+        (AssertionError("No remaining pro queries."), False, False),
+    ],
+)
+def test_retryable(error, new_query, follow_up):
+    policy = Resilience()
+    assert policy.retryable(error) is new_query
+    assert policy.retryable(error, follow_up=True) is follow_up
+
+
+def frame(n):
+    return b"event: message\r\ndata: " + json.dumps({"n": n}).encode() + b"\r\n\r\n"
+
+
+class Response:
+    """A streaming response that yields `frames`, then raises `error` if set."""
+
+    def __init__(self, frames=(), error=None, delay=0):
+        self.frames = frames
+        self.error = error
+        self.delay = delay
+        self.quit_now = threading.Event()
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size=None):
+        yield from self.frames
+        if self.error is not None:
+            raise self.error
+
+    async def aiter_content(self, chunk_size=None):
+        await asyncio.sleep(self.delay)
+        for data in self.frames:
+            yield data
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        pass
+
+
+class Session:
+    """Records queries and answers them with `respond()`."""
+
+    def __init__(self, respond):
+        self.respond = respond
+        self.queries = []
+
+    def post(self, url, json, **kwargs):
+        self.queries.append(json)
+        return self.respond()
+
+
+class AsyncSession(Session):
+    async def post(self, url, json, **kwargs):
+        return super().post(url, json, **kwargs)
+
+    async def close(self):
+        pass
+
+
+def fails_then_answers(error):
+    calls = []
+
+    def respond():
+        calls.append(1)
+        if len(calls) == 1:
+            raise error
+        return Response([frame(1)])
+
+    return respond
+
+
+def client(session, **policy):
+    search = Client({}, resilience=Resilience(backoff=0, **policy))
+    search._session_ready = True
+    search.session = session
+    return search
+
+
+def test_a_failed_new_query_is_retried():
+    session = Session(fails_then_answers(http_error(502)))
+    assert client(session).search("q") == {"n": 1}
+    assert len(session.queries) == 2
+
+
+def test_a_failed_follow_up_is_not_retried():
+    session = Session(fails_then_answers(http_error(502)))
+    follow_up = {"backend_uuid": "uuid", "attachments": []}
+    with pytest.raises(HTTPError):
+        client(session).search("q", follow_up=follow_up)
+    assert len(session.queries) == 1
+
+
+def test_a_follow_up_that_never_connected_is_retried():
+    session = Session(fails_then_answers(ConnectTimeout("slow connect")))
+    follow_up = {"backend_uuid": "uuid", "attachments": []}
+    assert client(session).search("q", follow_up=follow_up) == {"n": 1}
+    assert len(session.queries) == 2
+
+
+def test_no_retry_after_the_first_event():
+    session = Session(lambda: Response([frame(1)], RequestException("reset")))
+    stream = client(session).search("q", stream=True)
+    assert next(stream) == {"n": 1}
+    with pytest.raises(RequestException):
+        next(stream)
+    assert len(session.queries) == 1
+
+
+def test_retries_run_out():
+    session = Session(lambda: Response(error=UpstreamTimeout("silent")))
+    with pytest.raises(UpstreamTimeout):
+        client(session, retries=2).search("q")
+    assert len(session.queries) == 3
+
+
+def hedged_client(slow, fast):
+    search = AsyncClient(
+        {}, resilience=Resilience(hedge=True, hedge_after=0.05, backoff=0)
+    )
+    search._session_ready = True
+    search.session = AsyncSession(lambda: slow)
+    search._hedge = AsyncSession(lambda: fast)
+    return search
+
+
+def test_the_hedge_wins_and_the_slow_attempt_is_aborted():
+    slow = Response([frame(1)], delay=10)
+    fast = Response([frame(2)])
+    search = hedged_client(slow, fast)
+
+    async def run():
+        try:
+            return await asyncio.wait_for(search.search("q"), 5)
+        finally:
+            await search.close()
+
+    assert asyncio.run(run()) == {"n": 2}
+    assert slow.quit_now.is_set()
+    assert len(search.session.queries) == len(search._hedge.queries) == 1
+
+
+def test_a_hedged_pro_query_takes_two_from_the_quota():
+    slow = Response([frame(1)], delay=10)
+    search = hedged_client(slow, Response([frame(2)]))
+    search.copilot = 5
+
+    async def run():
+        try:
+            return await asyncio.wait_for(search.search("q", mode="pro"), 5)
+        finally:
+            await search.close()
+
+    asyncio.run(run())
+    assert search.copilot == 3
+
+
+def test_follow_ups_are_not_hedged():
+    slow = Response([frame(1)], delay=0.2)
+    search = hedged_client(slow, Response([frame(2)]))
+    follow_up = {"backend_uuid": "uuid", "attachments": []}
+
+    async def run():
+        try:
+            return await search.search("q", follow_up=follow_up)
+        finally:
+            await search.close()
+
+    assert asyncio.run(run()) == {"n": 1}
+    assert search._hedge.queries == []
+
+
+def test_curl_cffi_still_exposes_what_aborting_relies_on():
+    from curl_cffi.requests import Response as CurlResponse
+
+    response = CurlResponse()
+    assert hasattr(response, "quit_now")
+    assert hasattr(response, "queue")
@@ -0,0 +1,99 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from lib.pool import ClientPool, NoAccountAvailable
+from lib.shared import SharedState
+
+
+def held_lock(path):
+    """Another worker's connection, holding the database's write lock."""
+    db = sqlite3.connect(path, isolation_level=None)
+    db.execute("BEGIN IMMEDIATE")
+    return db
+
+
+def leases(path):
+    with sqlite3.connect(path) as db:
+        return db.execute("SELECT COUNT(*) FROM leases").fetchone()[0]
+
+
+def test_waiting_for_another_worker_does_not_block_the_loop(tmp_path):
+    path = str(tmp_path / "state.db")
+    pool = ClientPool([{"session": "a"}], state=SharedState(path))
+
+    async def run():
+        other = held_lock(path)
+        acquiring = asyncio.create_task(pool.acquire_async("auto"))
+        ticks = 0
+        for _ in range(20):
+            await asyncio.sleep(0.01)
+            ticks += 1
+        assert not acquiring.done()
+        other.execute("ROLLBACK")
+        account = await asyncio.wait_for(acquiring, 5)
+        await pool.release_async(account)
+        return ticks
+
+    assert asyncio.run(run()) == 20
+    assert leases(path) == 0
+
+
+def test_lease_taken_after_cancellation_is_given_back(tmp_path):
+    path = str(tmp_path / "state.db")
+    pool = ClientPool([{"session": "a"}], state=SharedState(path))
+    acquired = []
+    acquire = pool.acquire
+
+    def recording_acquire(*args):
+        acquired.append(acquire(*args))
+        return acquired[-1]
+
+    pool.acquire = recording_acquire
+
+    async def run():
+        other = held_lock(path)
+        acquiring = asyncio.create_task(pool.acquire_async("auto"))
+        await asyncio.sleep(0.05)
+        acquiring.cancel()
+        other.execute("ROLLBACK")
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if acquired and leases(path) == 0:
+                break
+
+    asyncio.run(run())
+    # The account was taken after the caller gave up, then released
+    assert len(acquired) == 1
+    assert pool.accounts[0].in_flight == 0
+    assert leases(path) == 0
+
+
+def test_lease_async_releases_on_error(tmp_path):
+    path = str(tmp_path / "state.db")
+    pool = ClientPool([{"session": "a"}], state=SharedState(path), quarantine=30)
+
+    async def run():
+        try:
+            async with pool.lease_async("auto"):
+                raise RuntimeError("upstream failed")
+        except RuntimeError:
+            pass
+
+    asyncio.run(run())
+    assert leases(path) == 0
+    assert pool.accounts[0].failures == 1
+
+
+def test_lease_is_not_refused_by_the_client_after_later_leases(tmp_path):
+    pool = ClientPool(
+        [{"session": "a"}], state=SharedState(str(tmp_path / "state.db")), pro_quota=2
+    )
+    first = pool.acquire("pro")
+    # Another query takes the last pro query before the first one starts
+    second = pool.acquire("pro")
+    with pytest.raises(NoAccountAvailable):
+        pool.acquire("pro")
+    first.client._reserve("pro", None, ["web"], [])
+    second.client._reserve("pro", None, ["web"], [])
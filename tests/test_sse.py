@@ -0,0 +1,175 @@
+import json
+import random
+import asyncio
+
+import pytest
+
+from lib.perplexity import AsyncClient, Client
+from lib.sse import SSEEvent, SSEParser, json_loads, loads, parse_message
+
+BODY = (
+    b": keep-alive\r\n"
+    b"event: message\r\n"
+    b'data: {"a": 1}\r\n'
+    b"\r\n"
+    b"data: first line\n"
+    b"data:second line\n"
+    b"id: 7\n"
+    b"\n"
+    b"event: end_of_stream\r"
+    b"data: {}\r"
+    b"\r"
+)
+
+EVENTS = [
+    SSEEvent("message", b'{"a": 1}', None),
+    SSEEvent("message", b"first line\nsecond line", "7"),
+    SSEEvent("end_of_stream", b"{}", "7"),
+]
+
+
+def parse(chunks):
+    parser = SSEParser()
+    events = []
+    for chunk in chunks:
+        events.extend(parser.feed(chunk))
+    return events + parser.close()
+
+
+def test_whole_body():
+    assert parse([BODY]) == EVENTS
+
+
+def test_byte_by_byte():
+    assert parse([BODY[i : i + 1] for i in range(len(BODY))]) == EVENTS
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_splits(seed):
+    rng = random.Random(seed)
+    cuts = sorted(rng.sample(range(1, len(BODY)), rng.randint(1, 15)))
+    chunks = [BODY[a:b] for a, b in zip([0, *cuts], [*cuts, len(BODY)])]
+    assert parse(chunks) == EVENTS
+
+
+def test_crlf_split_between_chunks_is_one_line_ending():
+    assert parse([b"data: x\r", b"\n\r", b"\n"]) == [SSEEvent("message", b"x", None)]
+
+
+CRLF_BODY = b"".join(
+    b"event: message\r\ndata: " + json.dumps({"n": i}).encode() + b"\r\n\r\n"
+    for i in range(20)
+)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_crlf_events_split_anywhere(seed):
+    rng = random.Random(seed)
+    cuts = sorted(rng.sample(range(1, len(CRLF_BODY)), rng.randint(1, 40)))
+    chunks = [CRLF_BODY[a:b] for a, b in zip([0, *cuts], [*cuts, len(CRLF_BODY)])]
+    assert parse(chunks) == [
+        SSEEvent("message", json.dumps({"n": i}).encode(), None) for i in range(20)
+    ]
+
+
+@pytest.mark.parametrize(
+    "body, event",
+    [
+        # A bare \n in a \r\n stream still ends a line
+        (
+            b"event: a\r\ndata: x\ndata: y\r\n\r\n",
+            SSEEvent("a", b"x\ny", None),
+        ),
+        (b"event: a\r\nid: 3\r\ndata: x\r\n\r\n", SSEEvent("a", b"x", "3")),
+        (b"event: a\ndata: x\n\n", SSEEvent("a", b"x", None)),
+        (b"event: a\rdata: x\r\r", SSEEvent("a", b"x", None)),
+        (b": ping\n\nevent: a\ndata: x\rdata: y\n\n", SSEEvent("a", b"x\ny", None)),
+    ],
+)
+def test_events_off_the_fast_path(body, event):
+    assert parse([body]) == [event]
+
+
+def test_close_flushes_an_unterminated_event():
+    parser = SSEParser()
+    assert parser.feed(b"event: end_of_stream\ndata: {}") == []
+    assert parser.close() == [SSEEvent("end_of_stream", b"{}", None)]
+
+
+def test_large_payload_split_over_many_chunks():
+    payload = json.dumps({"text": "x" * 100_000}).encode()
+    body = b"data: " + payload + b"\n\n"
+    chunks = [body[i : i + 1000] for i in range(0, len(body), 1000)]
+    assert parse(chunks) == [SSEEvent("message", payload, None)]
+
+
+@pytest.mark.parametrize("data", [b'{"a": [1]}', b' {"a": [1]}\n', '{"a": [1]}'])
+def test_json_loads_matches_the_stdlib(data):
+    assert json_loads(data) == {"a": [1]}
+
+
+@pytest.mark.parametrize("data", [b'{"a": 1} x', b'{"a": '])
+def test_json_loads_rejects_invalid_documents(data):
+    with pytest.raises(json.JSONDecodeError):
+        json_loads(data)
+
+
+@pytest.mark.parametrize("decoder", [json_loads, loads])
+def test_parse_message_decodes_nested_text(decoder):
+    steps = [{"step_type": "FINAL", "content": {"answer": "é"}}]
+    data = json.dumps({"status": "COMPLETED", "text": json.dumps(steps)}).encode()
+    assert parse_message(data, decoder) == {"status": "COMPLETED", "text": steps}
+
+
+class UnterminatedResponse:
+    """A response whose body ends right after its last event's data line."""
+
+    def __init__(self, body):
+        self.body = body
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size=None):
+        yield self.body
+
+    async def aiter_content(self, chunk_size=None):
+        yield self.body
+
+    def close(self):
+        pass
+
+    async def aclose(self):
+        pass
+
+
+UNTERMINATED = b"".join(
+    b"event: message\r\ndata: "
+    + json.dumps({"status": "PENDING", "n": i}).encode()
+    + (b"\r\n\r\n" if i < 2 else b"")
+    for i in range(3)
+)
+
+
+def test_client_keeps_an_unterminated_final_event():
+    client = Client({})
+    client._session_ready = True
+    client.session.post = lambda *args, **kwargs: UnterminatedResponse(UNTERMINATED)
+    assert client.search("query")["n"] == 2
+
+
+def test_async_client_keeps_an_unterminated_final_event():
+    async def run():
+        client = AsyncClient({})
+        client._session_ready = True
+
+        async def post(*args, **kwargs):
+            return UnterminatedResponse(UNTERMINATED)
+
+        client.session.post = post
+        try:
+            return await client.search("query")
+        finally:
+            await client.close()
+
+    assert asyncio.run(run())["n"] == 2
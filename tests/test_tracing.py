@@ -0,0 +1,146 @@
+import asyncio
+from collections import deque
+
+import httpx
+import pytest
+
+from api.profiler import ProfilerBusy, SamplingProfiler
+from lib.tracing import Trace, timer_for
+
+
+def attributes(span):
+    return {
+        item["key"]: next(iter(item["value"].values())) for item in span["attributes"]
+    }
+
+
+def test_stages_that_run_many_times_are_one_span():
+    trace = Trace("request")
+    trace.stage("serialize", 0.25, end=10.0)
+    trace.stage("serialize", 0.5, end=12.0)
+    [span] = trace.spans
+    assert (span.start, span.end) == (9.75, 12.0)
+    assert (span.busy, span.count) == (0.75, 2)
+    assert span.seconds == 0.75
+
+
+def test_otlp_export():
+    trace = Trace("query_sync", {"mode": "pro", "requested": True})
+    trace.add("admission", trace.root.start, trace.root.start + 0.001)
+    trace.stage("log", 0.002)
+    trace.add("upstream.error", trace.root.start, error="ReadTimeout()")
+    trace.finish(error=None)
+
+    [resource] = trace.to_otlp(service="test")["resourceSpans"]
+    assert attributes(resource["resource"]) == {"service.name": "test"}
+    root, admission, log, error = resource["scopeSpans"][0]["spans"]
+
+    assert {span["traceId"] for span in (root, admission, log, error)} == {
+        trace.trace_id
+    }
+    assert (root["name"], root["kind"]) == ("query_sync", 2)
+    assert "parentSpanId" not in root
+    # None attributes are left out, and booleans keep their type
+    assert attributes(root) == {"mode": "pro", "requested": True}
+    assert admission["parentSpanId"] == root["spanId"]
+    assert admission["kind"] == 1
+    start, end = int(admission["startTimeUnixNano"]), int(admission["endTimeUnixNano"])
+    assert end - start == pytest.approx(1_000_000, abs=1000)
+    # OTLP/JSON carries 64-bit integers as strings
+    assert attributes(log) == {"busy_ms": 2.0, "count": "1"}
+    assert error["status"] == {"code": 2, "message": "ReadTimeout()"}
+
+
+def test_server_timing():
+    trace = Trace("request")
+    trace.stage("log", 0.0015)
+    trace.finish()
+    log, root = trace.server_timing().split(", ")
+    assert log == "log;dur=1.50"
+    assert root.startswith("request;dur=")
+
+
+def test_timer_for_an_untraced_request_records_nothing():
+    with timer_for(None)("log"):
+        pass
+    trace = Trace("request")
+    with timer_for(trace)("log"):
+        pass
+    assert [(span.name, span.count) for span in trace.spans] == [("log", 1)]
+
+
+def test_traced_requests_are_kept_for_the_admin_endpoints(api, monkeypatch):
+    monkeypatch.setattr(api, "admin_token", "secret")
+    monkeypatch.setattr(api, "recent_traces", deque(maxlen=8))
+    admin = {"Authorization": "Bearer secret"}
+
+    async def run():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://api") as c:
+            response = await c.get(
+                "/api/query_sync", params={"q": "traced", "trace": True, "cache": False}
+            )
+            trace_id = response.headers["X-Trace-Id"]
+            listed = await c.get("/admin/traces", headers=admin)
+            exported = await c.get(f"/admin/traces/{trace_id}", headers=admin)
+            missing = await c.get("/admin/traces/nope", headers=admin)
+            return response, trace_id, listed, exported, missing
+
+    response, trace_id, listed, exported, missing = asyncio.run(run())
+    timings = [
+        part.split(";")[0] for part in response.headers["Server-Timing"].split(", ")
+    ]
+    assert {"admission", "upstream.search", "query_sync"} <= set(timings)
+    assert [trace["trace_id"] for trace in listed.json()] == [trace_id]
+    spans = exported.json()["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert {"upstream.first_event", "upstream.search"} <= {s["name"] for s in spans}
+    assert missing.status_code == 404
+
+
+def test_profile_returns_folded_stacks(api, monkeypatch):
+    monkeypatch.setattr(api, "admin_token", "secret")
+
+    async def run():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://api") as c:
+            params = {"seconds": 0.05, "interval": 0.005}
+            profile = await c.get(
+                "/admin/profile",
+                params=params,
+                headers={"Authorization": "Bearer secret"},
+            )
+            denied = await c.get(
+                "/admin/profile", params=params, headers={"Authorization": "Bearer x"}
+            )
+            return profile, denied
+
+    profile, denied = asyncio.run(run())
+    assert profile.status_code == 200
+    lines = profile.text.splitlines()
+    assert lines
+    for line in lines:
+        stack, count = line.rsplit(" ", 1)
+        assert int(count) > 0
+        # Frames run from the thread's name at the root down to the sampled frame
+        assert stack.startswith("MainThread;")
+    assert denied.status_code == 401
+
+
+def test_admin_endpoints_are_off_without_a_token(api, monkeypatch):
+    monkeypatch.setattr(api, "admin_token", None)
+
+    async def run():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://api") as c:
+            return await c.get("/admin/profile", params={"seconds": 0.01})
+
+    assert asyncio.run(run()).status_code == 404
+
+
+def test_one_profile_at_a_time():
+    profiler = SamplingProfiler()
+    profiler._lock.acquire()
+    with pytest.raises(ProfilerBusy):
+        profiler.profile(0.01)
+    profiler._lock.release()
+    assert profiler.profile(0.01, thread_ids={-1}) == ""
@@ -0,0 +1,34 @@
+import asyncio
+import io
+import os
+import shutil
+
+from fastapi import UploadFile
+
+from api.utils import spool_uploads, unique_name
+
+
+def test_unique_name_numbers_collisions():
+    assert unique_name("a.txt", {}) == "a.txt"
+    assert unique_name("a.txt", {"a.txt"}) == "a (1).txt"
+    assert unique_name("a.txt", {"a.txt", "a (1).txt"}) == "a (2).txt"
+    assert unique_name("README", {"README"}) == "README (1)"
+
+
+def test_every_upload_with_the_same_name_is_kept():
+    uploads = [
+        UploadFile(io.BytesIO(b"first"), filename="a.txt"),
+        UploadFile(io.BytesIO(b"second"), filename="dir/a.txt"),
+        UploadFile(io.BytesIO(b"third"), filename=None),
+    ]
+    directory, paths = asyncio.run(spool_uploads(uploads))
+    try:
+        assert list(paths) == ["a.txt", "a (1).txt", "file-2"]
+        contents = []
+        for path in paths.values():
+            assert os.path.dirname(path) == directory
+            with open(path, "rb") as f:
+                contents.append(f.read())
+        assert contents == [b"first", b"second", b"third"]
+    finally:
+        shutil.rmtree(directory)